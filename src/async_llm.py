@@ -1,8 +1,15 @@
 import os
+import json
+import time
+import random
 import aiohttp
 import asyncio
 from dotenv import load_dotenv
 
+from season1 import prompt_batch
+from season1 import response_cache
+from season1 import token_budget
+
 load_dotenv()
 
 API_URL = "https://api.openai.com/v1/chat/completions"
@@ -10,33 +17,429 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 
 headers = {"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"}
 
+DEFAULT_MODEL = token_budget.DEFAULT_MODEL
+DEFAULT_MAX_TOKENS = token_budget.DEFAULT_MAX_TOKENS
+
+# gpt-4o-mini tier 1 quota. Override per client for other tiers.
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 200000
+DEFAULT_MAX_CONCURRENCY = 64
+
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 60.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at a per-minute rate.
+
+    Attributes:
+        capacity (float): The largest amount the bucket holds (one minute of budget).
+        tokens (float): The amount currently available. May go negative after a refund
+            correction, which delays later acquisitions.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self._rate = per_minute / 60.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    async def acquire(self, amount: float) -> None:
+        """Wait until amount is available, then take it."""
+        # A single request larger than a minute of budget could never fit.
+        amount = min(amount, self.capacity)
+
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                # Wake up regularly, since adjust() may refund tokens meanwhile.
+                await asyncio.sleep(min((amount - self.tokens) / self._rate, 0.5))
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or take (negative) amount after the real cost is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMClient:
+    """An OpenAI chat completion client sharing one pooled session.
+
+    Requests are throttled by requests-per-minute and tokens-per-minute token
+    buckets and a concurrency cap. 429, 5xx and connection errors are retried with
+    jittered exponential backoff that honours Retry-After.
+
+    Use it as an async context manager inside one event loop:
 
-async def generate_unstructured_datas(system_prompts, user_prompts):
-    tasks = []
-    for i in range(len(user_prompts)):
-        tasks.append(generate_unstructured_data(system_prompts[i], user_prompts[i]))
+        async with LLMClient() as client:
+            async for index, text in client.generate_as_completed(systems, users):
+                ...
 
-    output = await asyncio.gather(*tasks)
-    return output
+    Batches are sent with requests that share a prompt prefix next to each other,
+    so a provider-side prompt cache can serve the shared part.
 
+    Responses go through a response_cache.ResponseCache (the shared one unless
+    another is given), so a request that was answered before is not sent again.
+    Identical prompt pairs within a batch are told apart by their sample index.
 
-async def generate_unstructured_data(system_prompt: str, user_prompt: str) -> str:
-    if not API_KEY:
-        raise ValueError("OpenAI API key is not set in environment variables.")
+    Given an until callback, a response is streamed and the connection is closed
+    as soon as the callback has seen enough, for example once
+    preprocessor.MapExtractor has the final map.
 
-    async with aiohttp.ClientSession(headers=headers) as session:
-        payload = {
-            "model": "gpt-4o-mini",
+    Attributes:
+        retry_count (int): Number of retried requests so far.
+        request_count (int): Number of HTTP requests sent so far, retries included.
+        usage (dict[str, int]): Token usage reported by the API for the completed
+            requests: "completions", "prompt_tokens", "cached_tokens" (prompt
+            tokens served from the prompt cache) and "completion_tokens", and
+            "stopped", the streamed responses closed early. Those report no
+            usage, so their tokens are not counted.
+    """
+
+    def __init__(
+        self,
+        api_url: str = API_URL,
+        api_key: str = API_KEY,
+        model: str = DEFAULT_MODEL,
+        max_tokens: int = DEFAULT_MAX_TOKENS,
+        requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_max: float = DEFAULT_BACKOFF_MAX,
+        cache: response_cache.ResponseCache = None,
+    ) -> None:
+        if cache is None:
+            cache = response_cache.get_default_cache()
+
+        # Replaying from the cache never reaches the API.
+        replay = cache is not None and cache.mode == response_cache.REPLAY
+        if not api_key and not replay:
+            raise ValueError("OpenAI API key is not set in environment variables.")
+
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+
+        self.retry_count = 0
+        self.request_count = 0
+        self.usage = {
+            "completions": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+            "stopped": 0,
+        }
+
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self) -> "LLMClient":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            self._session = aiohttp.ClientSession(
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+                connector=connector,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _make_payload(
+        self, system_prompt: str, user_prompt: str, max_tokens: int = None
+    ) -> dict:
+        return {
+            "model": self.model,
             "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
-            "max_tokens": 16384,
+            "max_tokens": max_tokens or self.max_tokens,
         }
 
-        async with session.post(API_URL, json=payload) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data["choices"][0]["message"]["content"]
-            else:
-                raise Exception(f"Error: {response.status}, {await response.text()}")
+    def _estimate_tokens(self, payload: dict) -> int:
+        """Token cost reserved before sending: the counted input tokens plus max_tokens."""
+        system_message, user_message = payload["messages"]
+        input_tokens = token_budget.count_message_tokens(
+            system_message["content"], user_message["content"], self.model
+        )
+        return input_tokens + payload["max_tokens"]
+
+    def _backoff(self, attempt: int, retry_after: float = None) -> float:
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def generate(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int = None,
+        sample_index: int = None,
+        until=None,
+    ) -> str:
+        """
+        Send one chat completion request and return its content.
+
+        Args:
+            system_prompt (str): The system message.
+            user_prompt (str): The user message.
+            max_tokens (int, optional): The completion limit of this request, like
+                token_budget.max_tokens_for sizes it. Defaults to the client's.
+            sample_index (int, optional): Which sample of this exact request it is,
+                for the response cache. Defaults to the first.
+            until (callable, optional): Streams the response and is called with
+                every piece of content. Once it returns True the request is closed
+                and the content received so far is returned. A cached response is
+                passed to it whole.
+
+        Raises:
+            LookupError: Raised when the response cache replays and misses.
+        """
+        payload = self._make_payload(system_prompt, user_prompt, max_tokens)
+        if until is not None:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+
+        if self.cache is None:
+            await self.open()
+            return await self._post(payload, until)
+
+        key = response_cache.payload_key(payload, sample_index)
+        found, content = self.cache.get(key)
+        if found:
+            if until is not None:
+                until(content)
+            return content
+
+        await self.open()
+        content = await self._post(payload, until)
+        self.cache.put(key, content)
+        return content
+
+    async def _post(self, payload: dict, until=None) -> str:
+        reserved = self._estimate_tokens(payload)
+
+        attempt = 0
+        while True:
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(reserved)
+
+            retry_after = None
+            async with self._semaphore:
+                self.request_count += 1
+                try:
+                    async with self._session.post(
+                        self.api_url, json=payload
+                    ) as response:
+                        if response.status == 200 and until is not None:
+                            return await self._read_stream(
+                                response, payload, reserved, until
+                            )
+                        if response.status == 200:
+                            data = await response.json()
+                            usage = data.get("usage") or dict()
+                            self._record_usage(usage)
+                            used = usage.get("total_tokens")
+                            if used is not None:
+                                self.token_bucket.adjust(reserved - used)
+                            return data["choices"][0]["message"]["content"]
+
+                        text = await response.text()
+                        if (
+                            response.status not in RETRY_STATUSES
+                            or attempt >= self.max_retries
+                        ):
+                            raise Exception(f"Error: {response.status}, {text}")
+
+                        retry_after = _parse_retry_after(response.headers)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if attempt >= self.max_retries:
+                        raise
+
+            # The failed attempt is not billed, so its reservation goes back.
+            self.token_bucket.adjust(reserved)
+
+            attempt += 1
+            self.retry_count += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    async def _read_stream(self, response, payload: dict, reserved: int, until) -> str:
+        """Collect the content of a server-sent event stream until it ends or until returns True."""
+        pieces = list()
+        usage = None
+        try:
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:") :].strip()
+                if data == b"[DONE]":
+                    break
+
+                event = json.loads(data)
+                usage = event.get("usage") or usage
+                for choice in event.get("choices") or ():
+                    delta = (choice.get("delta") or dict()).get("content")
+                    if not delta:
+                        continue
+                    pieces.append(delta)
+                    if until(delta):
+                        # Closing the connection stops the generation, so the
+                        # rest of the response is neither waited for nor billed.
+                        response.close()
+                        self.usage["stopped"] += 1
+                        content = "".join(pieces)
+                        # No usage is reported, so the completion is estimated.
+                        used = (
+                            reserved
+                            - payload["max_tokens"]
+                            + token_budget.count_tokens(content, self.model)
+                        )
+                        self.token_bucket.adjust(reserved - used)
+                        return content
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if not pieces:
+                raise
+            # until has seen part of the response, so it cannot be retried.
+            raise Exception(f"Error: stream interrupted, {e}") from e
+
+        if usage is not None:
+            self._record_usage(usage)
+            self.token_bucket.adjust(reserved - usage.get("total_tokens", reserved))
+        return "".join(pieces)
+
+    def _record_usage(self, usage: dict) -> None:
+        self.usage["completions"] += 1
+        self.usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self.usage["completion_tokens"] += usage.get("completion_tokens", 0)
+        details = usage.get("prompt_tokens_details") or dict()
+        self.usage["cached_tokens"] += details.get("cached_tokens") or 0
+
+    def usage_report(self) -> dict:
+        """The usage so far, with the share of prompt tokens served from the cache as "prefix_hit_ratio"."""
+        report = dict(self.usage)
+        prompt_tokens = report["prompt_tokens"]
+        report["prefix_hit_ratio"] = (
+            report["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+        )
+        return report
+
+    async def generate_as_completed(
+        self,
+        system_prompts: list,
+        user_prompts: list,
+        max_tokens: list = None,
+        until: list = None,
+    ):
+        """Yield (index, content) for every prompt pair as soon as each one finishes.
+
+        Requests are started in prompt prefix order (see prompt_batch.order_by_prefix),
+        so those sharing a prefix hit the provider's prompt cache together.
+        max_tokens and until optionally hold the completion limit and the stop
+        callback (see generate) of every request.
+        """
+        await self.open()
+        samples = response_cache.sample_indices(system_prompts, user_prompts)
+
+        async def indexed(i):
+            return i, await self.generate(
+                system_prompts[i],
+                user_prompts[i],
+                None if max_tokens is None else max_tokens[i],
+                samples[i],
+                None if until is None else until[i],
+            )
+
+        tasks = [
+            asyncio.ensure_future(indexed(i))
+            for i in prompt_batch.order_by_prefix(system_prompts, user_prompts)
+        ]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate_all(
+        self,
+        system_prompts: list,
+        user_prompts: list,
+        max_tokens: list = None,
+        until: list = None,
+    ) -> list:
+        """Return the contents for every prompt pair in input order."""
+        output = [None] * len(user_prompts)
+        async for i, content in self.generate_as_completed(
+            system_prompts, user_prompts, max_tokens, until
+        ):
+            output[i] = content
+
+        return output
+
+
+def _parse_retry_after(response_headers) -> float:
+    """Read the server's requested wait in seconds, if any."""
+    retry_after_ms = response_headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = response_headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    return None
+
+
+async def generate_unstructured_datas(system_prompts, user_prompts, **client_options):
+    async with LLMClient(**client_options) as client:
+        return await client.generate_all(system_prompts, user_prompts)
+
+
+async def generate_unstructured_data(
+    system_prompt: str, user_prompt: str, **client_options
+) -> str:
+    async with LLMClient(**client_options) as client:
+        return await client.generate(system_prompt, user_prompt)
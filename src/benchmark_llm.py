@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+
+import numpy as np
+
+import async_llm
+import data_utility
+import season1.utility as util
+from season1 import response_cache
+from mock_llm_server import MockLLMServer
+from season1.llm_utils import generate_data_block
+from season1.preprocessor import preprocess
+
+MAP_DATASET_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "dataset", "DemoMapDataset.json"
+)
+TARGET_PARAM_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "dataset",
+    "TargetParameterDataset.json",
+)
+
+PARAM_NAMES = [
+    "map_size",
+    "room_count",
+    "enemy_count",
+    "treasure_count",
+    "exploration",
+    "winding_path",
+]
+
+
+def benchmark_sync(base_url: str, server: MockLLMServer, count: int) -> dict:
+    """Run llm_utils.generate_data_block serially, as the sync pipeline does."""
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "mock"
+    _disable_response_cache()
+
+    map_dataset = util.read_json_file(MAP_DATASET_PATH)
+    param_list = util.read_json_file(TARGET_PARAM_PATH)["param_list"]
+    requests_before = server.stats["requests"]
+
+    latencies = list()
+    map_count = 0
+    start = time.perf_counter()
+    for i in range(count):
+        examples = data_utility.get_demos_from_map_dataset(map_dataset, PARAM_NAMES)
+        request_start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            data_block = generate_data_block(
+                param_list[i % len(param_list)], examples, "AutoCOT1", PARAM_NAMES
+            )
+        latencies.append(time.perf_counter() - request_start)
+        map_count += bool(data_block["map"])
+    elapsed = time.perf_counter() - start
+
+    # The OpenAI SDK retries internally, so retries are counted on the server side.
+    retries = server.stats["requests"] - requests_before - count
+    return _summarize("sync", latencies, map_count, elapsed, retries)
+
+
+def benchmark_async(base_url: str, count: int, **client_options) -> dict:
+    """Send count prompts through async_llm.LLMClient at once."""
+    _disable_response_cache()
+    map_dataset = util.read_json_file(MAP_DATASET_PATH)
+    system_prompts = list()
+    user_prompts = list()
+    for _ in range(count):
+        examples = data_utility.get_demos_from_map_dataset(map_dataset, PARAM_NAMES)
+        system_prompts.append("You are an expert dungeon designer.")
+        user_prompts.append("\n".join(example["map"] for example in examples))
+
+    async def run():
+        latencies = [None] * count
+        maps = [None] * count
+
+        async with async_llm.LLMClient(
+            api_url=base_url + "/chat/completions", api_key="mock", **client_options
+        ) as client:
+
+            async def timed(i):
+                request_start = time.perf_counter()
+                text = await client.generate(system_prompts[i], user_prompts[i])
+                latencies[i] = time.perf_counter() - request_start
+                with contextlib.redirect_stdout(io.StringIO()):
+                    maps[i] = preprocess(text)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(timed(i) for i in range(count)))
+            elapsed = time.perf_counter() - start
+
+            return latencies, sum(bool(level) for level in maps), elapsed, client
+
+    latencies, map_count, elapsed, client = asyncio.run(run())
+    return _summarize("async", latencies, map_count, elapsed, client.retry_count)
+
+
+def _disable_response_cache() -> None:
+    """
+    Send every request to the mock server.
+
+    Cache hits would be measured instead of round trips, and the mock replies
+    must not be stored under real model keys in the shared response cache.
+    """
+    response_cache.set_default_cache(None)
+
+
+def _summarize(
+    name: str, latencies: list[float], map_count: int, elapsed: float, retries: int
+) -> dict:
+    return {
+        "client": name,
+        "requests": len(latencies),
+        "maps": map_count,
+        "maps_per_second": map_count / elapsed if elapsed else 0.0,
+        "p50_latency": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p99_latency": float(np.percentile(latencies, 99)) if latencies else 0.0,
+        "retries": retries,
+        "elapsed": elapsed,
+    }
+
+
+def print_report(results: list[dict]) -> None:
+    print(
+        f"{'client':<8}{'requests':>10}{'maps':>8}{'maps/s':>10}"
+        f"{'p50 (s)':>10}{'p99 (s)':>10}{'retries':>10}"
+    )
+    for result in results:
+        print(
+            f"{result['client']:<8}{result['requests']:>10}{result['maps']:>8}"
+            f"{result['maps_per_second']:>10.2f}{result['p50_latency']:>10.3f}"
+            f"{result['p99_latency']:>10.3f}{result['retries']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the sync and async LLM clients against a mock server."
+    )
+    parser.add_argument("--sync-count", type=int, default=20)
+    parser.add_argument("--async-count", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--latency-jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.05)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--requests-per-minute", type=int, default=5000)
+    parser.add_argument("--tokens-per-minute", type=int, default=10**8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    base_url = server.start()
+
+    try:
+        results = [
+            benchmark_sync(base_url, server, args.sync_count),
+            benchmark_async(
+                base_url,
+                args.async_count,
+                requests_per_minute=args.requests_per_minute,
+                tokens_per_minute=args.tokens_per_minute,
+                backoff_base=args.retry_after,
+            ),
+        ]
+    finally:
+        server.stop()
+
+    print_report(results)
@@ -43,3 +43,32 @@ def get_demos_from_map_dataset(dataset, param_names) -> list[dict]:
         target_list = random.sample(target_list, 9)
 
     return target_list
+
+
+def get_shared_demos_from_map_dataset(
+    dataset, param_names, count: int, requests_per_set: int = 1
+) -> list[list[dict]]:
+    """
+    Draw demo sets for count requests, each set shared by requests_per_set of them.
+
+    Requests with the same demo set have byte-identical prompt prefixes, so a
+    provider-side prompt cache can serve them. The list objects are shared too.
+
+    Args:
+        dataset: The nested demo map dataset.
+        param_names (list[str]): See get_demos_from_map_dataset.
+        count (int): Number of requests.
+        requests_per_set (int, optional): Requests per demo set. 1 draws a new set
+            for every request, like get_demos_from_map_dataset. Sharing trades demo
+            variety for cache hits, so it is opt-in.
+
+    Returns:
+        list[list[dict]]: The demo set of every request.
+    """
+    demo_sets = list()
+    for i in range(count):
+        if i % requests_per_set == 0:
+            demos = get_demos_from_map_dataset(dataset, param_names)
+        demo_sets.append(demos)
+
+    return demo_sets
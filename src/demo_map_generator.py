@@ -1,8 +1,13 @@
+import json
 import os
+import queue
+import random
 import subprocess
+import threading
 
 import numpy as np
 
+import season1.dungeon as dungeon
 import season1.placer as placer
 import season1.utility as util
 import season1.validater as validator
@@ -10,122 +15,347 @@ import season1.validater as validator
 config = util.load_config()
 
 
-def create_map_dataset() -> list:
+MAP_SIZES = (17, 21, 27)
+ROOM_COUNTS = (5, 8, 13)
+ENEMY_COUNTS = (10, 16, 26)
+TREASURE_COUNTS = (1, 2, 4)
+
+# Maps kept per (exploration, winding_path) bucket of a cell.
+BUCKET_SIZE = 3
+
+# Maps generated per round of a cell. Rounds stop once every bucket is full.
+ROUND_SIZE = 100
+
+
+def create_map_dataset(
+    workers: int = None,
+    seed: int = None,
+    use_node: bool = False,
+    round_size: int = ROUND_SIZE,
+    report: bool = True,
+) -> list:
+    """
+    Create the demo map dataset, 3 maps for every cell of the parameter grid.
+
+    Cells are built independently by build_cell, in parallel across worker
+    processes. Maps from node_map_generator.js come from one NodeWorkerPool, so
+    with use_node the cells are built one after another and the labeling is
+    parallel instead.
+
+    Args:
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        seed (int, optional): Seed of the map generator. None is nondeterministic.
+        use_node (bool, optional): Generate maps with a NodeWorkerPool instead of season1.dungeon.
+        round_size (int, optional): Maps generated per round of a cell.
+        report (bool, optional): Print the generated and accepted maps per bucket.
+
+    Returns:
+        list: The maps nested by map size, room count, enemy count, treasure count,
+              exploration and winding path.
+    """
+    cell_seeds = np.random.SeedSequence(seed).spawn(
+        len(MAP_SIZES) * len(ROOM_COUNTS) * len(ENEMY_COUNTS) * len(TREASURE_COUNTS)
+    )
+    cells = [
+        {
+            "index": (map_idx, room_idx, enemy_idx, treasure_idx),
+            "map_size": map_size,
+            "room_count": room_count,
+            "enemy_count": enemy_count,
+            "treasure_count": treasure_count,
+            "round_size": round_size,
+        }
+        for map_idx, map_size in enumerate(MAP_SIZES)
+        for room_idx, room_count in enumerate(ROOM_COUNTS)
+        for enemy_idx, enemy_count in enumerate(ENEMY_COUNTS)
+        for treasure_idx, treasure_count in enumerate(TREASURE_COUNTS)
+    ]
+    for cell, cell_seed in zip(cells, cell_seeds):
+        cell["seed"] = cell_seed
+
+    if use_node:
+        with NodeWorkerPool(workers, seed) as pool:
+            results = [build_cell(cell, pool, workers) for cell in cells]
+    else:
+        results = util.parallel_map(build_cell, cells, workers, chunksize=1)
+
     data = [
-        [[[[] for _ in range(3)] for _ in range(3)] for _ in range(3)] for _ in range(3)
+        [[[None for _ in TREASURE_COUNTS] for _ in ENEMY_COUNTS] for _ in ROOM_COUNTS]
+        for _ in MAP_SIZES
     ]
+    for result in results:
+        map_idx, room_idx, enemy_idx, treasure_idx = result["index"]
+        data[map_idx][room_idx][enemy_idx][treasure_idx] = result["buckets"]
 
-    for map_idx, map_size in enumerate((17, 21, 27)):
-        for room_idx, room_count in enumerate((5, 8, 13)):
-            for enemy_idx, enemy_count in enumerate((10, 16, 26)):
-                for treasure_idx, treasure_count in enumerate((1, 2, 4)):
-                    while True:
-                        print(map_idx, room_idx, enemy_idx, treasure_idx)
-
-                        maps = [
-                            placer.Map(map_dict)
-                            for map_dict in generate_node_maps(
-                                map_size, room_count, 500
-                            )
-                        ]
-
-                        for map in maps:
-                            map.params["enemy_group_min"] = enemy_count
-                            map.params["enemy_group_max"] = enemy_count
-
-                            map.params["group_size_min"] = 1
-                            map.params["group_size_max"] = 1
-
-                            map.params["enemy_ideal_min"] = enemy_count
-                            map.params["enemy_ideal_max"] = enemy_count
-
-                            map.params["boss"] = 1
-                            map.params["treasure"] = treasure_count
-
-                            placer.modify_map(map, 0, 10, 0)
-
-                            params_dict = validator.get_label(map.get_ascii_map())
-                            map.params = params_dict
-
-                        explorations = [map.params["exploration"] for map in maps]
-                        winding_paths = [map.params["winding_path"] for map in maps]
-
-                        exploration_20line = np.percentile(explorations, 20)
-                        exploration_40line = np.percentile(explorations, 40)
-                        exploration_60line = np.percentile(explorations, 60)
-                        exploration_80line = np.percentile(explorations, 80)
-                        winding_path_20line = np.percentile(winding_paths, 20)
-                        winding_path_40line = np.percentile(winding_paths, 40)
-                        winding_path_60line = np.percentile(winding_paths, 60)
-                        winding_path_80line = np.percentile(winding_paths, 80)
-
-                        sublist = [[[] for _ in range(3)] for _ in range(3)]
-
-                        for map in maps:
-                            exploration = map.params["exploration"]
-                            winding_path = map.params["winding_path"]
-
-                            if exploration < exploration_20line:
-                                i = 0
-                            elif exploration_40line < exploration < exploration_60line:
-                                i = 1
-                            elif exploration_80line < exploration:
-                                i = 2
-                            else:
-                                i = None
-
-                            if winding_path < winding_path_20line:
-                                j = 0
-                            elif (
-                                winding_path_40line < winding_path < winding_path_60line
-                            ):
-                                j = 1
-                            elif winding_path_80line < winding_path:
-                                j = 2
-                            else:
-                                j = None
-
-                            if (
-                                i is not None
-                                and j is not None
-                                and len(sublist[i][j]) < 3
-                            ):
-                                sublist[i][j].append(
-                                    {"params": map.params, "map": map.get_ascii_map()}
-                                )
-
-                        OK = True
-                        for i in range(3):
-                            for j in range(3):
-                                if len(sublist[i][j]) != 3:
-                                    OK = False
-
-                        if OK:
-                            data[map_idx][room_idx][enemy_idx][treasure_idx] = sublist
-                            break
+    if report:
+        print_report(results)
 
     return data
 
 
-def generate_node_maps(
-    map_size: int, room_count_ideal: int, map_count: int
-) -> list[dict]:
-    node_map_generator_path = os.path.join(
-        os.path.dirname(__file__), "node_map_generator.js"
-    )
+def build_cell(cell: dict, pool: "NodeWorkerPool" = None, workers: int = 1) -> dict:
+    """
+    Collect BUCKET_SIZE maps for every exploration and winding_path bucket of a cell.
+
+    Maps are generated and labeled in rounds of round_size, and every labeled map
+    is kept as a candidate. After each round the 0-20, 40-60 and 80-100 percentile
+    bands of exploration and winding_path are recomputed over all candidates of the
+    cell, and the cell is done as soon as each of the 9 band pairs holds
+    BUCKET_SIZE candidates. The first ones generated are kept.
+
+    Args:
+        cell (dict): index, map_size, room_count, enemy_count, treasure_count,
+            round_size and seed (an int or np.random.SeedSequence).
+        pool (NodeWorkerPool, optional): Generate maps with this pool instead of season1.dungeon.
+        workers (int, optional): Number of worker processes for labeling.
+
+    Returns:
+        dict: index, buckets (3 x 3 lists of {"params", "map"}), rounds, generated
+              (all maps of the cell), and bucket_generated (3 x 3 candidate counts).
+    """
+    rng = np.random.default_rng(cell["seed"])
+    # placer draws from the random module, so it is seeded from the cell as well.
+    random.seed(int(rng.integers(2**63)))
 
-    subprocess.run(
-        [
-            "node",
-            node_map_generator_path,
-            str(map_size),
-            str(room_count_ideal),
-            str(map_count),
+    candidates = list()
+    explorations = list()
+    winding_paths = list()
+    rounds = 0
+
+    while True:
+        rounds += 1
+        maps = _generate_candidates(cell, rng, pool)
+        labels = validator.get_labels([map.get_ascii_map() for map in maps], workers)
+
+        for map, label in zip(maps, labels):
+            candidates.append({"params": label, "map": map.get_ascii_map()})
+            explorations.append(label["exploration"])
+            winding_paths.append(label["winding_path"])
+
+        exploration_bands = _percentile_bands(explorations)
+        winding_path_bands = _percentile_bands(winding_paths)
+
+        buckets = [[[] for _ in range(3)] for _ in range(3)]
+        bucket_generated = [[0] * 3 for _ in range(3)]
+        for candidate, i, j in zip(candidates, exploration_bands, winding_path_bands):
+            if i < 0 or j < 0:
+                continue
+            bucket_generated[i][j] += 1
+            if len(buckets[i][j]) < BUCKET_SIZE:
+                buckets[i][j].append(candidate)
+
+        if all(len(bucket) == BUCKET_SIZE for row in buckets for bucket in row):
+            return {
+                "index": cell["index"],
+                "buckets": buckets,
+                "rounds": rounds,
+                "generated": len(candidates),
+                "bucket_generated": bucket_generated,
+            }
+
+
+def _generate_candidates(
+    cell: dict, rng: np.random.Generator, pool: "NodeWorkerPool" = None
+) -> list[placer.Map]:
+    if pool is not None:
+        maps = [
+            placer.Map(map_dict)
+            for map_dict in generate_node_maps(
+                cell["map_size"], cell["room_count"], cell["round_size"], pool
+            )
         ]
+    else:
+        maps = dungeon.generate_maps(
+            cell["map_size"], cell["room_count"], cell["round_size"], seed=rng
+        )
+
+    for map in maps:
+        map.params["enemy_group_min"] = cell["enemy_count"]
+        map.params["enemy_group_max"] = cell["enemy_count"]
+
+        map.params["group_size_min"] = 1
+        map.params["group_size_max"] = 1
+
+        map.params["enemy_ideal_min"] = cell["enemy_count"]
+        map.params["enemy_ideal_max"] = cell["enemy_count"]
+
+        map.params["boss"] = 1
+        map.params["treasure"] = cell["treasure_count"]
+
+        placer.modify_map(map, 0, 10, 0)
+
+    return maps
+
+
+def _percentile_bands(values: list[float]) -> np.ndarray:
+    """Band 0, 1 or 2 for values in the 0-20, 40-60 or 80-100 percentiles, else -1."""
+    values = np.asarray(values, dtype=float)
+    line20, line40, line60, line80 = np.percentile(values, (20, 40, 60, 80))
+
+    bands = np.full(len(values), -1)
+    bands[values < line20] = 0
+    bands[(line40 < values) & (values < line60)] = 1
+    bands[line80 < values] = 2
+
+    return bands
+
+
+def print_report(results: list[dict]) -> None:
+    """Print the maps generated per cell and per bucket, against the maps kept."""
+    generated = sum(result["generated"] for result in results)
+    accepted = len(results) * 9 * BUCKET_SIZE
+    print(
+        f"{len(results)} cells: {generated} maps generated, {accepted} accepted "
+        f"({generated - accepted} wasted)"
     )
 
-    raw_path = config["paths"]["raw"]
-    return util.load_json_files(raw_path)
+    for result in results:
+        bucket_counts = " ".join(
+            "/".join(str(count) for count in row) for row in result["bucket_generated"]
+        )
+        print(
+            f"cell {result['index']}: {result['generated']} generated in "
+            f"{result['rounds']} rounds, per bucket {bucket_counts} "
+            f"(accepted {BUCKET_SIZE} each)"
+        )
+
+
+class NodeWorkerPool:
+    """Long-lived node_map_worker.js processes generating maps in parallel.
+
+    Requests and maps are exchanged as newline-delimited JSON over stdin and
+    stdout, so Node starts once per worker, and nothing is written to disk.
+    Every worker gets its own seed derived from the pool seed.
+
+    Use it as a context manager:
+
+        with NodeWorkerPool(workers=4, seed=0) as pool:
+            maps = pool.generate(21, 8, 500)
+
+    Attributes:
+        workers (int): Number of Node processes.
+        seeds (list[int]): The seed of every worker.
+    """
+
+    def __init__(self, workers: int = None, seed: int = None) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.seeds = [
+            int(child.generate_state(1)[0])
+            for child in np.random.SeedSequence(seed).spawn(self.workers)
+        ]
+
+        self._processes = list()
+        self._responses = queue.Queue()
+        self._next_id = 0
+
+    def __enter__(self) -> "NodeWorkerPool":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def start(self) -> None:
+        if self._processes:
+            return
+
+        worker_path = os.path.join(os.path.dirname(__file__), "node_map_worker.js")
+        for worker, seed in enumerate(self.seeds):
+            process = subprocess.Popen(
+                ["node", worker_path, str(seed)],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+            )
+            threading.Thread(
+                target=self._read, args=(worker, process.stdout), daemon=True
+            ).start()
+            self._processes.append(process)
+
+    def _read(self, worker: int, stdout) -> None:
+        for line in stdout:
+            self._responses.put((worker, json.loads(line)))
+        self._responses.put((worker, None))
+
+    def close(self) -> None:
+        for process in self._processes:
+            process.stdin.close()
+        for process in self._processes:
+            process.wait()
+        self._processes = list()
+
+    def iter_maps(self, map_size: int, room_count: int, map_count: int):
+        """
+        Split map_count maps over the workers and yield them as they arrive.
+
+        Yields:
+            tuple[int, int, str]: (worker, index within the worker's share, map).
+
+        Raises:
+            RuntimeError: Raised when a worker reports an error or exits.
+        """
+        self.start()
+
+        pending = dict()
+        for worker, process in enumerate(self._processes):
+            count = map_count // self.workers + (worker < map_count % self.workers)
+            if count == 0:
+                continue
+
+            request = {
+                "id": self._next_id,
+                "map_size": map_size,
+                "room_count": room_count,
+                "count": count,
+            }
+            pending[self._next_id] = worker
+            self._next_id += 1
+
+            process.stdin.write(json.dumps(request) + "\n")
+            process.stdin.flush()
+
+        while pending:
+            worker, response = self._responses.get()
+            if response is None:
+                raise RuntimeError(f"Node worker {worker} exited.")
+            if response.get("id") not in pending:
+                # Left over from a request abandoned by an earlier error.
+                continue
+            if "error" in response:
+                raise RuntimeError(f"Node worker {worker}: {response['error']}")
+            if response.get("done"):
+                del pending[response["id"]]
+            else:
+                yield worker, response["index"], response["map"]
+
+    def generate(self, map_size: int, room_count: int, map_count: int) -> list[dict]:
+        """Return map_count raw map dicts, ordered by worker for a given pool seed."""
+        results = sorted(self.iter_maps(map_size, room_count, map_count))
+        return [{"params": {}, "map": level} for _, _, level in results]
+
+
+def generate_node_maps(
+    map_size: int, room_count_ideal: int, map_count: int, pool: NodeWorkerPool = None
+) -> list[dict]:
+    """
+    Generate raw maps with node_map_generator.js.
+
+    Args:
+        map_size (int): Width and height of every map.
+        room_count_ideal (int): Number of rooms of every map.
+        map_count (int): Number of maps.
+        pool (NodeWorkerPool, optional): A running pool to reuse. Without one, a pool
+            is started for this call only.
+
+    Returns:
+        list[dict]: Raw map dicts with empty params.
+    """
+    if pool is not None:
+        return pool.generate(map_size, room_count_ideal, map_count)
+
+    with NodeWorkerPool() as pool:
+        return pool.generate(map_size, room_count_ideal, map_count)
 
 
 if __name__ == "__main__":
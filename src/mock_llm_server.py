@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from aiohttp import web
+
+import season1.utility as util
+from season1 import prompt_batch
+
+DEFAULT_MAP_DATASET_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "dataset", "DemoMapDataset.json"
+)
+
+RESPONSE_TEMPLATE = """Step 1: Plan the rooms and their connections.
+Step 2: Place the player, the boss, the enemies and the treasures.
+
+Final map:
+```
+{map}```
+"""
+
+
+class MockLLMServer:
+    """A local stand-in for the OpenAI chat completions endpoint.
+
+    Every request is answered with an ASCII map, either one of the canned
+    responses or a map from the demo dataset wrapped in RESPONSE_TEMPLATE.
+    Latency, server errors and 429 rate limits can be injected. Prompt caching is
+    simulated: prompt prefixes seen before are reported as cached tokens in the
+    usage, at the granularity of prompt_batch. Streamed requests are answered
+    with server-sent events, stream_chunk_chars characters every stream_interval
+    seconds.
+
+    Attributes:
+        latency (float): Mean seconds before a response is sent.
+        latency_jitter (float): Latency is drawn uniformly from latency +- latency_jitter.
+        error_rate (float): Probability of answering with a 500.
+        rate_limit_rate (float): Probability of answering with a 429.
+        retry_after (float): Retry-After seconds sent with a 429.
+        stream_chunk_chars (int): Characters of content per streamed event.
+        stream_interval (float): Seconds between streamed events.
+        stats (dict[str, int]): Counts of requests, completions, errors, rate
+            limits and streams the client closed early ("stopped"), the prompt and
+            cached tokens of the completions, and the completion tokens sent.
+    """
+
+    def __init__(
+        self,
+        responses: list[str] = None,
+        map_dataset_path: str = DEFAULT_MAP_DATASET_PATH,
+        latency: float = 0.5,
+        latency_jitter: float = 0.2,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        stream_chunk_chars: int = 16,
+        stream_interval: float = 0.01,
+        seed: int = None,
+    ) -> None:
+        if responses is None:
+            responses = [
+                RESPONSE_TEMPLATE.format(map=level)
+                for level in _load_maps(map_dataset_path)
+            ]
+
+        self.responses = responses
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_interval = stream_interval
+        self.stats = {
+            "requests": 0,
+            "completions": 0,
+            "errors": 0,
+            "rate_limits": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+            "stopped": 0,
+        }
+
+        # Digests of every cacheable prefix of the prompts answered so far.
+        self._prefix_cache = set()
+
+        self._random = random.Random(seed)
+        self._runner = None
+        self._thread = None
+        self._loop = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle_completion)
+        app.router.add_get("/stats", self._handle_stats)
+        return app
+
+    async def _handle_completion(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.stats["requests"] += 1
+
+        latency = self.latency + self._random.uniform(
+            -self.latency_jitter, self.latency_jitter
+        )
+        await asyncio.sleep(max(0.0, latency))
+
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.stats["rate_limits"] += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats["errors"] += 1
+            return web.json_response(
+                {"error": {"message": "Internal server error", "type": "server_error"}},
+                status=500,
+            )
+
+        content = self._random.choice(self.responses)
+        prompt = "\n".join(message["content"] for message in payload["messages"])
+        prompt_tokens = len(prompt) // prompt_batch.CHARS_PER_TOKEN
+        cached_tokens = self._cache_prompt(prompt)
+        completion_tokens = len(content) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["cached_tokens"] += cached_tokens
+        if payload.get("stream"):
+            return await self._stream_completion(request, payload, content, usage)
+
+        self.stats["completions"] += 1
+        self.stats["completion_tokens"] += completion_tokens
+        return web.json_response(
+            {
+                "id": f"chatcmpl-mock-{self.stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model", "mock"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+        )
+
+    async def _stream_completion(
+        self, request: web.Request, payload: dict, content: str, usage: dict
+    ) -> web.StreamResponse:
+        """Send content as chat.completion.chunk events, stopping if the client goes away."""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        def event(choices: list, **fields) -> bytes:
+            chunk = {
+                "id": f"chatcmpl-mock-{self.stats['requests']}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "mock"),
+                "choices": choices,
+                **fields,
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        sent = 0
+        try:
+            for start in range(0, len(content), self.stream_chunk_chars):
+                piece = content[start : start + self.stream_chunk_chars]
+                delta = {"content": piece}
+                if start == 0:
+                    delta["role"] = "assistant"
+                await response.write(
+                    event([{"index": 0, "delta": delta, "finish_reason": None}])
+                )
+                sent += len(piece)
+                await asyncio.sleep(self.stream_interval)
+
+            await response.write(
+                event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            )
+            if (payload.get("stream_options") or dict()).get("include_usage"):
+                await response.write(event([], usage=usage))
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            self.stats["stopped"] += 1
+            self.stats["completion_tokens"] += sent // 4
+            return response
+
+        self.stats["completions"] += 1
+        self.stats["completion_tokens"] += usage["completion_tokens"]
+        await response.write_eof()
+        return response
+
+    def _cache_prompt(self, prompt: str) -> int:
+        """Return the tokens of the longest cached prefix of prompt, and cache all of its prefixes."""
+        step = prompt_batch.CACHED_PREFIX_STEP_TOKENS * prompt_batch.CHARS_PER_TOKEN
+        start = prompt_batch.MIN_CACHED_PREFIX_TOKENS * prompt_batch.CHARS_PER_TOKEN
+
+        digest = hashlib.sha256(prompt[:start].encode())
+        cached_chars = 0
+        hit = True
+        for end in range(start, len(prompt) + 1, step):
+            if end > start:
+                digest.update(prompt[end - step : end].encode())
+            key = digest.digest()
+            if hit and key in self._prefix_cache:
+                cached_chars = end
+            else:
+                hit = False
+                self._prefix_cache.add(key)
+
+        return cached_chars // prompt_batch.CHARS_PER_TOKEN
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve from a background thread and return the base URL ending with /v1."""
+        started = threading.Event()
+        address = dict()
+
+        async def serve():
+            self._runner = web.AppRunner(self.make_app())
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, host, port)
+            await site.start()
+            address["port"] = site._server.sockets[0].getsockname()[1]
+            started.set()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+
+        return f"http://{host}:{address['port']}/v1"
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+
+def _load_maps(path: str) -> list[str]:
+    """Collect every map of the nested demo map dataset."""
+    maps = list()
+
+    def collect(node):
+        if isinstance(node, dict):
+            maps.append(node["map"])
+        else:
+            for child in node:
+                collect(child)
+
+    collect(util.read_json_file(path))
+    return maps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI chat server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--latency-jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--stream-chunk-chars", type=int, default=16)
+    parser.add_argument("--stream-interval", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        stream_chunk_chars=args.stream_chunk_chars,
+        stream_interval=args.stream_interval,
+        seed=args.seed,
+    )
+    web.run_app(server.make_app(), host=args.host, port=args.port)
@@ -12,12 +12,8 @@ const tileMapping = {
 
 const fs = require('fs');
 const path = require('path');
-const yaml = require('js-yaml');
 
-const file = fs.readFileSync(path.join(__dirname, 'config.yaml'), 'utf8');
-const config = yaml.load(file);
-
-var roguelike = require(path.join("..", "src", "node-roguelike", "level", "roguelike"));
+var roguelike = require(path.join(__dirname, "node-roguelike", "level", "roguelike"));
 
 function convertToString(level){
     let world = level.world;
@@ -136,42 +132,45 @@ function emptyDirectory(dirPath) {
     }
 }
 
-let mapSize;
-let roomCountIdeal;
-let mapCount;
-
-if (process.argv.length >= 5){
-    const args = process.argv.slice(2);
-    mapSize = Number(args[0]);
-    roomCountIdeal = Number(args[1]);
-    mapCount = Number(args[2]);
-} else {
-    console.log("Not enough parameters.");
-    process.exit();
-}
-
-let directoryName = path.join(__dirname, '..', 'data', '1. raw');
+module.exports = { createMap, convertToString, checkMapSize };
+
+if (require.main === module) {
+    let mapSize;
+    let roomCountIdeal;
+    let mapCount;
+
+    if (process.argv.length >= 5){
+        const args = process.argv.slice(2);
+        mapSize = Number(args[0]);
+        roomCountIdeal = Number(args[1]);
+        mapCount = Number(args[2]);
+    } else {
+        console.log("Not enough parameters.");
+        process.exit();
+    }
 
-if (!fs.existsSync(directoryName)) {
-    fs.mkdirSync(directoryName, { recursive: true });
-}
+    let directoryName = path.join(__dirname, '..', 'data', '1. raw');
 
-emptyDirectory(directoryName);
+    if (!fs.existsSync(directoryName)) {
+        fs.mkdirSync(directoryName, { recursive: true });
+    }
 
-let mapList = [];
-for (let i = 0; i < mapCount; ++i){
-    mapList.push({"params": {}, "map": createMap(mapSize, roomCountIdeal)});
-}
+    emptyDirectory(directoryName);
 
-data = {"map_list": mapList};
+    let mapList = [];
+    for (let i = 0; i < mapCount; ++i){
+        mapList.push({"params": {}, "map": createMap(mapSize, roomCountIdeal)});
+    }
 
-const jsonData = JSON.stringify(data, null, 2);
+    data = {"map_list": mapList};
 
-fs.writeFile(path.join(directoryName, 'rawMaps.json'), jsonData, (err) => {
-  if (err) {
-    console.error('An error occurred:', err);
-  } else {
-    console.log('File has been saved');
-  }
-});
+    const jsonData = JSON.stringify(data, null, 2);
 
+    fs.writeFile(path.join(directoryName, 'rawMaps.json'), jsonData, (err) => {
+      if (err) {
+        console.error('An error occurred:', err);
+      } else {
+        console.log('File has been saved');
+      }
+    });
+}
@@ -0,0 +1,71 @@
+#!/usr/bin/env node
+
+// A long-lived map generator driven over stdin/stdout with newline-delimited JSON.
+//
+// Request (one line):  {"id": 0, "map_size": 17, "room_count": 5, "count": 100, "seed": 1}
+// Responses (one line each, in order):
+//   {"id": 0, "index": 0, "map": "..."}   for every map as soon as it is created
+//   {"id": 0, "done": true}               after the last map
+//   {"id": 0, "error": "..."}             instead, if the request failed
+//
+// "seed" is optional. The worker seed (first argument) is used until a request sets one.
+
+const readline = require('readline');
+
+const { createMap } = require('./node_map_generator');
+
+/**
+ * Creates a seeded replacement for Math.random (mulberry32).
+ *
+ * @param {number} seed - A 32-bit integer seed.
+ * @returns {function(): number} A function returning floats in [0, 1).
+ */
+function mulberry32(seed) {
+    let state = seed >>> 0;
+    return function () {
+        state = (state + 0x6D2B79F5) >>> 0;
+        let t = state;
+        t = Math.imul(t ^ (t >>> 15), t | 1);
+        t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+        return ((t ^ (t >>> 14)) >>> 0) / 4294967296;
+    };
+}
+
+function send(message) {
+    process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+// stdout carries the protocol, so log messages of node_map_generator.js go to stderr.
+console.log = console.error;
+
+if (process.argv.length >= 3) {
+    // node-roguelike draws from Math.random, so seeding it makes the worker reproducible.
+    Math.random = mulberry32(Number(process.argv[2]));
+}
+
+const input = readline.createInterface({ input: process.stdin, terminal: false });
+
+input.on('line', (line) => {
+    if (!line.trim()) return;
+
+    let request;
+    try {
+        request = JSON.parse(line);
+    } catch (err) {
+        send({ "id": null, "error": "Invalid request: " + err.message });
+        return;
+    }
+
+    try {
+        if (request.seed !== undefined && request.seed !== null) {
+            Math.random = mulberry32(request.seed);
+        }
+
+        for (let i = 0; i < request.count; ++i) {
+            send({ "id": request.id, "index": i, "map": createMap(request.map_size, request.room_count) });
+        }
+        send({ "id": request.id, "done": true });
+    } catch (err) {
+        send({ "id": request.id, "error": String(err && err.message || err) });
+    }
+});
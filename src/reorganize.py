@@ -1,82 +1,59 @@
 import glob
 import json
 import os
-from typing import Any
 
+from season1 import batch_store
 from season1.utility import load_config
 
     # 이 스크립트는 다음 두 가지 주요 기능을 수행합니다:
     # 1. 메인 디렉토리와 서브디렉토리 내의 batch*.json 파일들을 재정리합니다.
     #    - 메인 디렉토리에 batch*.json 파일이 있을 경우, 이 파일들만 취합하여 새로 정리합니다.
     #    - 메인 디렉토리에 batch*.json 파일이 없을 경우, 서브디렉토리의 파일들을 취합하여 정리합니다.
-    # 2. 데이터가 재정리된 후, 메인 디렉토리에서 처리된 기존의 batch*.json 파일들을 삭제하고, 100개의 항목으로 구성된 새로운 batch 파일들을 메인 디렉토리에 생성합니다.
+    # 2. 데이터가 재정리된 후, 메인 디렉토리에서 처리된 기존의 batch*.json 파일들을 삭제하고, 100개의 항목으로 구성된 batch 저장소(batch_store)를 메인 디렉토리에 생성합니다.
+    #    - 이미 batch 저장소가 있으면 메타데이터만 바꿔서 batch 크기를 다시 정합니다.
     #    - 서브디렉토리의 파일들은 삭제되지 않습니다.
     #    - 최종적으로, 어느 경로에서 파일들이 처리되었는지를 출력합니다.
     
 
-def load_data_from_directory(directory_path: str) -> tuple[list[Any], list[str]]:
-    """Load all data from all batch files in the specified directory into a single list."""
-    all_data = []
-    file_paths = glob.glob(f"{directory_path}batch*.json")
-
-    for file_path in file_paths:
-        with open(file_path, "r") as infile:
-            dataset = json.load(infile)
-            all_data.extend(dataset.get("map_list", []))
-
-    return all_data, file_paths
-
-
-def save_data_in_batches(all_data: list, directory_path: str) -> None:
-    """Save all data into batch files with exactly 100 items each."""
-    batch_number = 0
-    total_data_count = len(all_data)
-
-    for i in range(0, total_data_count, 100):
-        batch_data = all_data[i : i + 100]
-        batch_file = f"{directory_path}batch{batch_number}.json"
-        dataset = {"map_list": batch_data}
-
-        with open(batch_file, "w") as outfile:
-            json.dump(dataset, outfile)
-
-        print(f"Saved {batch_file} with {len(batch_data)} items")
-        batch_number += 1
-
-
-def reorganize_batches(directory_path: str) -> None:
+def reorganize_batches(
+    directory_path: str, batch_size: int = batch_store.DEFAULT_BATCH_SIZE
+) -> None:
     """Main function to reorganize existing batch files from preprocessed and its subdirectories into proper sizes."""
 
-    # Load all data from the main preprocessed directory
-    main_dir_data, main_dir_files = load_data_from_directory(directory_path)
+    # A store is re-batched by rewriting its metadata only
+    if batch_store.is_store(directory_path):
+        dataset = batch_store.BatchStore(directory_path)
+        dataset.rebatch(batch_size)
+        print(f"Rebatched {len(dataset)} items into {dataset.batch_count} batches")
+        return
+
+    main_dir_files = glob.glob(f"{directory_path}batch*.json")
 
     if main_dir_files:
         # If there are files in the main directory, process only those files
-        all_data = main_dir_data
-        file_paths_to_delete = main_dir_files
+        directories = [directory_path]
         processed_from = "Main Directory"
     else:
         # If no files in the main directory, load from subdirectories
-        all_data = []
-        subdirs = [d for d in glob.glob(f"{directory_path}*/") if os.path.isdir(d)]
-        file_paths_to_delete = []
-
-        for subdir in subdirs:
-            subdir_data, subdir_files = load_data_from_directory(subdir)
-            all_data.extend(subdir_data)
-            file_paths_to_delete.extend([])  # 서브디렉토리의 파일은 삭제하지 않음
-
+        directories = [d for d in glob.glob(f"{directory_path}*/") if os.path.isdir(d)]
         processed_from = "Sub Directories"
 
+    # Move the data into a store in the main directory, one file at a time
+    dataset = batch_store.BatchStore(directory_path, batch_size, flush_every=batch_size)
+    with dataset:
+        for directory in directories:
+            for file_path in glob.glob(f"{directory}batch*.json"):
+                with open(file_path, "r") as infile:
+                    dataset.extend(json.load(infile).get("map_list", []))
+
     # Remove the files that were loaded (only from main directory)
+    # 서브디렉토리의 파일은 삭제하지 않음
     if processed_from == "Main Directory":
-        for file_path in file_paths_to_delete:
+        for file_path in main_dir_files:
             os.remove(file_path)
 
-    # Save the data into new batch files with 100 items each in the main preprocessed directory
-    save_data_in_batches(all_data, directory_path)
-
     # Output detailed information about the processing
+    print(f"Saved {len(dataset)} items in {dataset.batch_count} batches")
     print(f"Data processing completed.")
     print(f"Processed from: {processed_from}")
 
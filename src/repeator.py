@@ -19,43 +19,29 @@ def repeat_process(prompt_style: str) -> None:
     create_directory(repeated_path)
     setup_logging(f"{repeated_path}.log")
 
-    current_file, batch_number, dataset = find_or_create_dataset(path=repeated_path)
+    dataset = find_or_create_dataset(path=repeated_path)
 
     data_block = None
-    map_list = load_list_from_files(preprocessed_path, "map_list")
     # Use the general function with a new parameter generation function
-    for pre_data in map_list:
-
-        parameters = pre_data["params"]
-        examples = [get_data_from_map(pre_data["map"])]
-
-        # Step 3: Pass the data block to generate_and_save_data
-        dataset = generate_and_save_data(data_block, current_file, dataset)
-
-        # Step 4: Check if a new file is needed based on dataset size
-        if len(dataset["map_list"]) == 0:
-            # Create a new batch file and reset the dataset
-            batch_number += 1
-            current_file = f"{preprocessed_path}batch{batch_number}.json"
-            dataset = {"map_list": []}
-
-        for iteration in range(2):
-            data_block = generate_data_block(parameters, examples, prompt_style)
-            examples = [get_data_from_map(data_block["map"])]
-
-        # Step 3: Pass the data block to generate_and_save_data
-        dataset = generate_and_save_data(data_block, current_file, dataset)
-
-        # Step 4: Check if a new file is needed based on dataset size
-        if len(dataset["map_list"]) == 0:
-            # Create a new batch file and reset the dataset
-            batch_number += 1
-            current_file = f"{repeated_path}batch{batch_number}.json"
-            dataset = {"map_list": []}
-
-    if dataset and dataset["map_list"]:
-        save_dataset_to_file(dataset, current_file)
-        print(f"Successfully saved {current_file} with remaining data")
+    with dataset:
+        for pre_data in iter_list_from_files(preprocessed_path, "map_list"):
+
+            parameters = pre_data["params"]
+            examples = [get_data_from_map(pre_data["map"])]
+
+            # Step 3: Pass the data block to generate_and_save_data
+            # There is no block before the first map, so nothing is saved then.
+            if data_block is not None:
+                generate_and_save_data(data_block, dataset)
+
+            for iteration in range(2):
+                data_block = generate_data_block(parameters, examples, prompt_style)
+                examples = [get_data_from_map(data_block["map"])]
+
+            # Step 3: Pass the data block to generate_and_save_data
+            generate_and_save_data(data_block, dataset)
+
+    print(f"Successfully saved {repeated_path} with {len(dataset)} data")
 
 
 # Example usage (should be removed in production code)
@@ -0,0 +1,236 @@
+import bisect
+import json
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_BATCH_SIZE = 100
+
+META_FILE = "meta.json"
+INDEX_FILE = "index.jsonl"
+DATA_FILES = {None: "records.jsonl", "zstd": "records.jsonl.zst"}
+
+
+def is_store(path: str) -> bool:
+    """Check whether path is a directory holding a BatchStore."""
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+class BatchStore:
+    """An append-only JSON Lines dataset with a sidecar index.
+
+    Records are appended to a single data file in chunks. Each chunk is a run of
+    JSON lines (one zstd frame when compressed), and the sidecar index holds one
+    "[offset, length, count]" line per chunk. Appending a chunk writes to the end
+    of both files and never rewrites earlier data.
+
+    Batches are fixed-size ranges of the record order kept in the metadata, so
+    re-batching only rewrites the small meta file.
+
+    A chunk is durable once its index line is written. Data appended after the
+    last index line (a crash in between) is cut off the next time the store is
+    written to.
+
+    Attributes:
+        path (str): The store directory.
+        batch_size (int): Number of records per batch.
+        compression (str): None, or "zstd" if the zstandard package is installed.
+        flush_every (int): Number of appended records buffered into one chunk.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = None,
+        compression: str = None,
+        flush_every: int = 1,
+    ) -> None:
+        """
+        Args:
+            path (str): The store directory. Created if it does not exist.
+            batch_size (int, optional): Records per batch. Defaults to the stored
+                value, or DEFAULT_BATCH_SIZE for a new store. Changing it re-batches.
+            compression (str, optional): None or "zstd". Only used for a new store.
+            flush_every (int, optional): Appended records buffered before a chunk is
+                written. Larger values compress better but lose more on a crash.
+
+        Raises:
+            ValueError: Raised when the compression is not supported.
+            ImportError: Raised when "zstd" is requested without the zstandard package.
+        """
+        self.path = path
+        self.flush_every = flush_every
+
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.isfile(meta_path):
+            with open(meta_path, "r") as file:
+                meta = json.load(file)
+        else:
+            if compression not in DATA_FILES:
+                raise ValueError(f"Unsupported compression: {compression}")
+            meta = {"compression": compression, "batch_size": DEFAULT_BATCH_SIZE}
+            os.makedirs(path, exist_ok=True)
+
+        self.compression = meta["compression"]
+        if self.compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package.")
+
+        self.batch_size = meta["batch_size"]
+        if not os.path.isfile(meta_path) or (
+            batch_size is not None and batch_size != self.batch_size
+        ):
+            self.rebatch(batch_size or self.batch_size)
+
+        self.data_path = os.path.join(path, DATA_FILES[self.compression])
+        self.index_path = os.path.join(path, INDEX_FILE)
+
+        # Per chunk: offset and length in the data file, and the records before it.
+        self._offsets = list()
+        self._lengths = list()
+        self._starts = list()
+        self._count = 0
+        self._index_size = 0
+        self._load_index()
+
+        self._buffer = list()
+        self._data_file = None
+        self._index_file = None
+
+    def _load_index(self) -> None:
+        if not os.path.isfile(self.index_path):
+            return
+
+        with open(self.index_path, "rb") as file:
+            for line in file:
+                try:
+                    offset, length, count = json.loads(line)
+                except ValueError:
+                    # A line cut off by a crash ends the index.
+                    break
+                self._offsets.append(offset)
+                self._lengths.append(length)
+                self._starts.append(self._count)
+                self._count += count
+                self._index_size += len(line)
+
+    def rebatch(self, batch_size: int) -> None:
+        """Change the number of records per batch. Only the metadata is rewritten."""
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive.")
+
+        self.batch_size = batch_size
+        meta_path = os.path.join(self.path, META_FILE)
+        temp_path = meta_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"compression": self.compression, "batch_size": batch_size}, file)
+        os.replace(temp_path, meta_path)
+
+    def __len__(self) -> int:
+        return self._count + len(self._buffer)
+
+    @property
+    def batch_count(self) -> int:
+        return -(-len(self) // self.batch_size)
+
+    def _open_writer(self) -> None:
+        if self._data_file is not None:
+            return
+
+        # Drop anything written after the last complete chunk.
+        data_end = self._offsets[-1] + self._lengths[-1] if self._offsets else 0
+        self._data_file = open(self.data_path, "ab")
+        self._data_file.truncate(data_end)
+        self._data_file.seek(data_end)
+        self._index_file = open(self.index_path, "ab")
+        self._index_file.truncate(self._index_size)
+        self._index_file.seek(self._index_size)
+
+    def append(self, record: dict) -> None:
+        """Add a record. It is written once flush_every records are buffered."""
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def extend(self, records) -> None:
+        for record in records:
+            self.append(record)
+
+    def flush(self) -> None:
+        """Write the buffered records as one chunk."""
+        if not self._buffer:
+            return
+
+        self._open_writer()
+
+        chunk = "".join(json.dumps(record) + "\n" for record in self._buffer)
+        chunk = chunk.encode("utf-8")
+        if self.compression == "zstd":
+            chunk = zstandard.ZstdCompressor().compress(chunk)
+
+        offset = self._data_file.tell()
+        self._data_file.write(chunk)
+        self._data_file.flush()
+
+        index_line = json.dumps([offset, len(chunk), len(self._buffer)]) + "\n"
+        self._index_file.write(index_line.encode("utf-8"))
+        self._index_file.flush()
+
+        self._offsets.append(offset)
+        self._lengths.append(len(chunk))
+        self._starts.append(self._count)
+        self._count += len(self._buffer)
+        self._index_size += len(index_line)
+        self._buffer = list()
+
+    def close(self) -> None:
+        self.flush()
+        if self._data_file is not None:
+            self._data_file.close()
+            self._index_file.close()
+            self._data_file = None
+            self._index_file = None
+
+    def __enter__(self) -> "BatchStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _read_chunk(self, file, chunk: int) -> list[dict]:
+        file.seek(self._offsets[chunk])
+        data = file.read(self._lengths[chunk])
+        if self.compression == "zstd":
+            data = zstandard.ZstdDecompressor().decompress(data)
+
+        return [json.loads(line) for line in data.splitlines()]
+
+    def iter_records(self, start: int = 0, stop: int = None):
+        """Yield the written records from start to stop, one chunk in memory at a time."""
+        self.flush()
+        stop = self._count if stop is None else min(stop, self._count)
+        if start >= stop:
+            return
+
+        chunk = bisect.bisect_right(self._starts, start) - 1
+        with open(self.data_path, "rb") as file:
+            while chunk < len(self._starts) and self._starts[chunk] < stop:
+                first = self._starts[chunk]
+                for i, record in enumerate(self._read_chunk(file, chunk), first):
+                    if start <= i < stop:
+                        yield record
+                chunk += 1
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def read_batch(self, batch_number: int) -> list[dict]:
+        start = batch_number * self.batch_size
+        return list(self.iter_records(start, start + self.batch_size))
+
+    def iter_batches(self):
+        """Yield (batch_number, records) for every batch."""
+        for batch_number in range(self.batch_count):
+            yield batch_number, self.read_batch(batch_number)
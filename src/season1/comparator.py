@@ -1,61 +1,160 @@
-from labeler import load_folder, save_folder
-import validater
+import os
+import re
+import json
+from concurrent.futures import ProcessPoolExecutor
 
-import utility
+from . import batch_store
+from . import utility
+from . import validater
 
 config = utility.load_config()
 PREPROCESSED_PATH = config["paths"]["preprocessed"]
 COMPARED_PATH = config["paths"]["compared"]
 
-DEFAULT_FILE_COUNT = 100
+DEFAULT_FILE_COUNT = None
+# Maps validated at once. Bounds the memory held by the comparator.
+DEFAULT_CHUNK_SIZE = 1000
 
 
 def compare(
     preprocessed_path: str = PREPROCESSED_PATH,
     compared_path: str = COMPARED_PATH,
     file_count: int = DEFAULT_FILE_COUNT,
-) -> None:
+    workers: int = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
     """
     Load preprocessed data, estimate parameters, and compare them.
 
+    Maps are streamed from the preprocessed batches, validated chunk by chunk in
+    one process pool, and appended to a batch_store.BatchStore as each chunk is
+    done, so only one chunk is held in memory at a time.
+
+    An existing compared store is resumed: as many preprocessed maps as it already
+    holds are skipped, after checking that they are the maps it holds, in order.
+    Delete compared_path to start over.
+
     Args:
-        preprocessed_path: Path to the folder with preprocessed data files.
-        compared_path: Path to the folder where comparison results will be saved.
-        file_count: Number of data files to process.
+        preprocessed_path: Path to the folder with preprocessed batch files, or a BatchStore.
+        compared_path: Path to the store where comparison results will be saved.
+        file_count: Number of batch files to process. Defaults to all of them.
+        workers: Number of worker processes used for validation. Defaults to the CPU count.
+        chunk_size: Number of maps validated at once.
+
+    Returns:
+        int: The number of compared maps in the store.
+
+    Raises:
+        ValueError: Raised when the existing compared store was not made from the
+            maps in preprocessed_path.
     """
+    workers = workers or os.cpu_count() or 1
+    skip = 0
+
+    with batch_store.BatchStore(
+        compared_path, flush_every=chunk_size
+    ) as store, ProcessPoolExecutor(max_workers=workers) as executor:
+        done = len(store)
+        compared_items = store.iter_records(0, done)
+        chunk = list()
+
+        def flush():
+            # Validate every map of the chunk at once
+            after_params_list = validater.validate_many(
+                [map_item["map"] for map_item in chunk], workers, executor=executor
+            )
 
-    # load preprocessed data. They don't have estimated parameters.
-    preprocessed_data = load_folder(path=preprocessed_path, file_count=file_count)
-
-    # Initialize compared data list
-    compared_data = [{"map_list": []} for _ in range(file_count)]
-
-    # Update parameters and prepare compared data
-    for i, data in enumerate(preprocessed_data):
-        for map_item in data["map_list"]:
-            try:
-                examples = map_item["example_maps"]
-            except KeyError:
-                examples = None
-            map = map_item["map"]
-            before_params = map_item["params"]
-            after_params = validater.validate(map)
-            compared_data[i]["map_list"].append(
+            # Update parameters and prepare compared data
+            store.extend(
                 {
-                    "example_maps": examples,
-                    "map": map,
-                    "before_params": before_params,
+                    "example_maps": map_item.get("example_maps"),
+                    "map": map_item["map"],
+                    "before_params": map_item["params"],
                     "after_params": after_params,
                 }
+                for map_item, after_params in zip(chunk, after_params_list)
             )
-    save_folder(data=compared_data, path=compared_path, file_count=file_count)
+            store.flush()
+            chunk.clear()
 
-    return
+        for map_item in iter_preprocessed(preprocessed_path, file_count):
+            if skip < done:
+                # Resume only a store made from these maps
+                if next(compared_items)["map"] != map_item["map"]:
+                    raise ValueError(
+                        f"Compared map {skip} in {compared_path} differs from the "
+                        f"preprocessed map in {preprocessed_path}. "
+                        "Delete the compared store to start over."
+                    )
+                skip += 1
+                continue
 
+            chunk.append(map_item)
+            if len(chunk) >= chunk_size:
+                flush()
 
-if __name__ == "__main__":
-    compare(
-        preprocessed_path=PREPROCESSED_PATH,
-        compared_path=COMPARED_PATH,
-        file_count=1,
+        if skip < done:
+            raise ValueError(
+                f"{compared_path} holds {done} compared maps, but only {skip} "
+                f"preprocessed maps were found in {preprocessed_path}. "
+                "Delete the compared store to start over."
+            )
+
+        if chunk:
+            flush()
+
+        return len(store)
+
+
+def iter_preprocessed(path: str, file_count: int = None):
+    """
+    Yield the map items of every preprocessed batch, one file in memory at a time.
+
+    Batch files are discovered rather than expected: every .json file in path is
+    read, in the natural order of their names (batch2.json before batch10.json).
+
+    Args:
+        path (str): A directory of batch files, or a BatchStore.
+        file_count (int, optional): Read only the first file_count batches.
+
+    Yields:
+        dict: The map items, with "map" and "params".
+    """
+    if batch_store.is_store(path):
+        store = batch_store.BatchStore(path)
+        batch_count = store.batch_count
+        if file_count is not None:
+            batch_count = min(batch_count, file_count)
+        yield from store.iter_records(0, batch_count * store.batch_size)
+        return
+
+    for file_path in discover_batches(path)[:file_count]:
+        with open(file_path, "r") as file:
+            yield from json.load(file)["map_list"]
+
+
+def discover_batches(path: str) -> list[str]:
+    """Return the .json files in path, sorted by name with numbers compared numerically."""
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"The specified directory does not exist: {path}")
+
+    def natural_key(filename):
+        return [
+            int(part) if part.isdigit() else part
+            for part in re.split(r"(\d+)", filename)
+        ]
+
+    filenames = sorted(
+        (
+            filename
+            for filename in os.listdir(path)
+            if filename.endswith(".json")
+            and os.path.isfile(os.path.join(path, filename))
+        ),
+        key=natural_key,
     )
+    return [os.path.join(path, filename) for filename in filenames]
+
+
+if __name__ == "__main__":
+    print(f"Compared {compare()} maps.")
@@ -0,0 +1,83 @@
+import numpy as np
+
+try:
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
+
+
+def label(mask: np.ndarray) -> tuple[np.ndarray, int]:
+    """
+    Label the 4-connected components of a 2-dimensional bool mask.
+
+    Uses scipy.ndimage.label when scipy is installed, and a two-pass union-find
+    over the horizontal runs of each row otherwise. Both number the components
+    in row-major order of their first tile.
+
+    Args:
+        mask (np.ndarray): The tiles to group into components.
+
+    Returns:
+        tuple[np.ndarray, int]: The component id of every tile (0 outside mask,
+        components 1..count) and the component count.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    if ndimage is not None:
+        ids, count = ndimage.label(mask)
+        return ids.astype(np.int32), int(count)
+
+    return _label_runs(mask)
+
+
+def _label_runs(mask: np.ndarray) -> tuple[np.ndarray, int]:
+    height, width = mask.shape
+    ids = np.zeros(mask.shape, dtype=np.int32)
+    if not mask.any():
+        return ids, 0
+
+    # Runs of True in every row, as [start, end) columns. Padding each row with
+    # False on both sides makes every run start and end at a change.
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    rows, starts = np.nonzero(np.diff(padded, axis=1) == 1)
+    _, ends = np.nonzero(np.diff(padded, axis=1) == -1)
+    rows, starts, ends = rows.tolist(), starts.tolist(), ends.tolist()
+
+    # First pass: union every run with the runs of the row above it overlaps.
+    parents = list(range(len(starts)))
+
+    def find(run):
+        while parents[run] != run:
+            parents[run] = parents[parents[run]]
+            run = parents[run]
+        return run
+
+    above = 0
+    for run in range(len(starts)):
+        row = rows[run]
+        while above < run and (
+            rows[above] < row - 1
+            or (rows[above] == row - 1 and ends[above] <= starts[run])
+        ):
+            above += 1
+
+        other = above
+        while other < run and rows[other] == row - 1 and starts[other] < ends[run]:
+            root, other_root = find(run), find(other)
+            if root != other_root:
+                parents[max(root, other_root)] = min(root, other_root)
+            other += 1
+
+    # Second pass: number the roots in order of their first run.
+    run_ids = list()
+    root_ids = dict()
+    for run in range(len(starts)):
+        root = find(run)
+        if root not in root_ids:
+            root_ids[root] = len(root_ids) + 1
+        run_ids.append(root_ids[root])
+
+    lengths = np.array(ends) - np.array(starts)
+    ids.ravel()[np.flatnonzero(mask)] = np.repeat(run_ids, lengths)
+
+    return ids, len(root_ids)
@@ -0,0 +1,146 @@
+import copy
+
+import numpy as np
+
+from . import grid
+
+# Flood-fill neighbour order. The labels depend on it, so it must not change.
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+class DistanceEngine:
+    """Flood-fill distances between the objects of a single level.
+
+    The level is flattened into an integer-indexed grid whose neighbour table is
+    built once, so every flood fill is a plain list walk instead of tuple-keyed
+    dict lookups. Flood fills are cached per source tile, which lets
+    exploration, winding_path and difficulty_curve share the same passes.
+
+    The distance between two tiles is the flood-fill order used by
+    labeler._flood_fill_area (the number of tiles discovered before the target),
+    not the geometric path length. That order depends on the search running
+    from one source at a time, so each accessible object still gets its own
+    pass, but each pass is done at most once per level.
+
+    Attributes:
+        height (int): Number of rows of the level.
+        width (int): Number of columns of the level.
+    """
+
+    def __init__(self, level: grid.Level, icon_obstacles: set = None) -> None:
+        level = grid.as_level(level)
+        if icon_obstacles is None:
+            accessible = level.passable
+        else:
+            accessible = ~level.mask("".join(icon_obstacles))
+
+        self.height, self.width = level.shape
+        height, width = level.shape
+
+        # Neighbours of every tile in DIRECTIONS order, -1 where blocked.
+        index = np.arange(height * width).reshape(height, width)
+        neighbour_table = np.full((height, width, len(DIRECTIONS)), -1)
+        for k, (dx, dy) in enumerate(DIRECTIONS):
+            target = (
+                slice(max(dx, 0), height + min(dx, 0)),
+                slice(max(dy, 0), width + min(dy, 0)),
+            )
+            source = (
+                slice(max(-dx, 0), height + min(-dx, 0)),
+                slice(max(-dy, 0), width + min(-dy, 0)),
+            )
+            neighbour_table[source + (k,)] = np.where(
+                accessible[target], index[target], -1
+            )
+
+        self._neighbours = [
+            [new_index for new_index in row if new_index >= 0]
+            for row in neighbour_table.reshape(height * width, -1).tolist()
+        ]
+        self._orders = dict()
+
+    def updated(self, level: grid.Level, changed: np.ndarray) -> "DistanceEngine":
+        """
+        Return the engine of level, an edit of the level this engine was built for.
+
+        A cached flood fill stays valid unless it reached a changed tile or one
+        next to it, so fills of untouched areas carry over. If no tile changed,
+        the neighbour table is shared as well.
+
+        Args:
+            level (grid.Level): The edited level, of the same shape.
+            changed (np.ndarray): Bool mask of the tiles whose accessibility changed.
+
+        Returns:
+            DistanceEngine: A new engine. This one is left as it is.
+        """
+        if not changed.any():
+            engine = copy.copy(self)
+            engine._orders = dict(self._orders)
+            return engine
+
+        engine = DistanceEngine(level)
+
+        touched = changed.copy()
+        touched[1:] |= changed[:-1]
+        touched[:-1] |= changed[1:]
+        touched[:, 1:] |= changed[:, :-1]
+        touched[:, :-1] |= changed[:, 1:]
+        touched = np.flatnonzero(touched).tolist()
+
+        for source, (order, queue) in self._orders.items():
+            if all(order[index] < 0 for index in touched):
+                engine._orders[source] = (order, queue)
+
+        return engine
+
+    def _index(self, pos: tuple) -> int:
+        return pos[0] * self.width + pos[1]
+
+    def _order_from(self, pos: tuple) -> tuple[list, list]:
+        """Run (or reuse) the flood fill from pos.
+
+        Returns:
+            tuple[list, list]: Per-tile flood-fill order (-1 if unreachable) and
+            the reached tile indices in discovery order.
+        """
+        source = self._index(pos)
+        if source in self._orders:
+            return self._orders[source]
+
+        neighbours = self._neighbours
+        order = [-1] * len(neighbours)
+        order[source] = 0
+        queue = [source]
+
+        # Iterating over the queue while appending to it visits every tile once.
+        for index in queue:
+            for new_index in neighbours[index]:
+                if order[new_index] < 0:
+                    order[new_index] = len(queue)
+                    queue.append(new_index)
+
+        self._orders[source] = (order, queue)
+        return order, queue
+
+    def flood_fill_area(self, pos: tuple) -> tuple[dict, int]:
+        """Same result as labeler._flood_fill_area, backed by the cached pass."""
+        order, queue = self._order_from(pos)
+        width = self.width
+        result = {divmod(index, width): order[index] for index in queue}
+        return result, len(queue) - 1
+
+    def distance(self, source: tuple, target: tuple) -> int:
+        """Flood-fill order of target seen from source, or -1 if unreachable."""
+        order, _ = self._order_from(source)
+        return order[self._index(target)]
+
+    def distance_matrix(self, positions: list) -> list[list[int]]:
+        """Object-to-object flood-fill orders; row i is seen from positions[i]."""
+        indices = [self._index(pos) for pos in positions]
+        matrix = []
+        for pos in positions:
+            order, _ = self._order_from(pos)
+            matrix.append([order[index] for index in indices])
+
+        return matrix
@@ -0,0 +1,331 @@
+import numpy as np
+
+from . import grid
+from . import placer
+
+# Tile codes and characters of node_map_generator.js (tileMapping).
+OUTSIDE = 0
+FLOOR = 1
+WALL = 2
+DOOR = 3
+SPECIAL_DOOR = 4
+ENTRY = 5
+EXIT = 6
+TILE_CHARACTERS = " .#/X<>"
+
+ROOM_SIZE_MIN = 3
+
+# Share of the map the rooms are sized to fill, leaving room to place all of them.
+PACKING_RATIO = 0.6
+
+
+class Room:
+    """An axis-aligned room. The walls lie one tile outside the interior.
+
+    Attributes:
+        row (int): Top row of the interior.
+        col (int): Left column of the interior.
+        height (int): Number of interior rows.
+        width (int): Number of interior columns.
+    """
+
+    def __init__(self, row: int, col: int, height: int, width: int) -> None:
+        self.row = row
+        self.col = col
+        self.height = height
+        self.width = width
+
+    def transposed(self) -> "Room":
+        return Room(self.col, self.row, self.width, self.height)
+
+    def flipped(self, size: int) -> "Room":
+        """The same room in the upside-down map of the given height."""
+        return Room(size - self.row - self.height, self.col, self.height, self.width)
+
+
+def generate_maps(
+    map_size: int,
+    room_count: int,
+    map_count: int,
+    seed: int | np.random.Generator = None,
+    room_size_min: int = ROOM_SIZE_MIN,
+    room_size_max: int = None,
+) -> list[placer.Map]:
+    """
+    Generate room-and-corridor maps in memory, as node_map_generator.js does.
+
+    Args:
+        map_size (int): Width and height of every map. Walls touch all four borders.
+        room_count (int): Exact number of rooms of every map.
+        map_count (int): Number of maps.
+        seed (int | np.random.Generator, optional): Seed, or a generator to draw from.
+            None is nondeterministic.
+        room_size_min (int, optional): Smallest interior side of a room.
+        room_size_max (int, optional): Largest interior side of a room. Defaults to a
+            size that lets room_count rooms fit in the map.
+
+    Returns:
+        list[placer.Map]: The maps, with "<" for the entry and ">" for the exit.
+
+    Raises:
+        ValueError: Raised when room_count rooms can not fit in the map.
+    """
+    rng = np.random.default_rng(seed)
+    return [
+        placer.Map(
+            level=generate_level(
+                map_size, room_count, rng, room_size_min, room_size_max
+            )
+        )
+        for _ in range(map_count)
+    ]
+
+
+def generate_level(
+    map_size: int,
+    room_count: int,
+    rng: np.random.Generator = None,
+    room_size_min: int = ROOM_SIZE_MIN,
+    room_size_max: int = None,
+) -> grid.Level:
+    """
+    Generate one map as a grid.Level. See generate_maps.
+
+    Rooms are added one at a time next to an existing room, sharing a wall with a
+    door in it, until room_count rooms are placed. When no position is left for a
+    room, smaller rooms are tried, so the room count is reached by construction
+    instead of by generating maps until one happens to have it.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if room_size_max is None:
+        room_size_max = _default_room_size_max(map_size, room_count, room_size_min)
+
+    # Each failed map shrinks the rooms, as createMap in node_map_generator.js does.
+    size_max = room_size_max
+    while True:
+        for _ in range(10):
+            tiles = _generate_tiles(map_size, room_count, rng, room_size_min, size_max)
+            if tiles is not None:
+                return grid.Level(
+                    np.frombuffer(TILE_CHARACTERS.encode(), np.uint8)[tiles]
+                )
+
+        if size_max <= room_size_min:
+            raise ValueError(
+                f"{room_count} rooms do not fit in a map of size {map_size}."
+            )
+        size_max -= 1
+
+
+def _default_room_size_max(map_size: int, room_count: int, room_size_min: int) -> int:
+    # Rooms share walls, so a room takes about (side + 1) ** 2 tiles.
+    mean_side = np.sqrt(PACKING_RATIO * (map_size - 1) ** 2 / room_count) - 1
+    size_max = int(2 * mean_side) - room_size_min
+
+    return max(room_size_min, min(size_max, map_size - 4))
+
+
+def _generate_tiles(
+    map_size: int,
+    room_count: int,
+    rng: np.random.Generator,
+    room_size_min: int,
+    room_size_max: int,
+) -> np.ndarray:
+    """Return the tile codes of one map, or None if the rooms did not fit."""
+    tiles = np.zeros((map_size, map_size), dtype=np.uint8)
+    rooms = list()
+
+    while len(rooms) < room_count:
+        height, width = rng.integers(room_size_min, room_size_max + 1, size=2)
+        room = _place_room(tiles, rng, height, width, room_size_min, first=not rooms)
+        if room is None:
+            return None
+        rooms.append(room)
+
+    if not _stretch_to_borders(tiles, rooms):
+        return None
+
+    _set_stairs(tiles, rng, rooms[0], ENTRY)
+    _set_stairs(tiles, rng, rooms[-1], EXIT)
+
+    return tiles
+
+
+def _window_sum(mask: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Sum of mask over every height x width window, indexed by its top-left tile."""
+    table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int32)
+    table[1:, 1:] = mask.cumsum(axis=0).cumsum(axis=1)
+
+    return (
+        table[height:, width:]
+        - table[:-height, width:]
+        - table[height:, :-width]
+        + table[:-height, :-width]
+    )
+
+
+def _place_room(
+    tiles: np.ndarray,
+    rng: np.random.Generator,
+    height: int,
+    width: int,
+    room_size_min: int,
+    first: bool = False,
+) -> Room:
+    """
+    Place a room of about height x width, shrinking it until some position fits.
+
+    Every position of one room size is checked at once with window sums. A room
+    may only overlap existing walls, and (except for the first room) must share a
+    wall with an existing room where a door can connect the two.
+
+    Returns:
+        Room: The placed room, or None if not even the smallest room fits.
+    """
+    map_size = tiles.shape[0]
+    occupied = tiles != OUTSIDE
+    open_tiles = (tiles == FLOOR) | (tiles == DOOR)
+
+    # A wall tile with floor behind it can become a door into a room on its other side.
+    walls = tiles == WALL
+    floor = tiles == FLOOR
+    door_down = np.zeros_like(walls)
+    door_down[1:] = walls[1:] & floor[:-1]
+    door_up = np.zeros_like(walls)
+    door_up[:-1] = walls[:-1] & floor[1:]
+    door_right = np.zeros_like(walls)
+    door_right[:, 1:] = walls[:, 1:] & floor[:, :-1]
+    door_left = np.zeros_like(walls)
+    door_left[:, :-1] = walls[:, :-1] & floor[:, 1:]
+
+    while True:
+        if height + 2 <= map_size and width + 2 <= map_size:
+            # Indexed by the top-left wall tile (row - 1, col - 1) of the room.
+            end_row = map_size - height
+            end_col = map_size - width
+            fits = _window_sum(open_tiles, height + 2, width + 2) == 0
+            fits &= _window_sum(occupied, height, width)[1:end_row, 1:end_col] == 0
+
+            if first:
+                # Start on the lattice of this room size, so rooms of the same
+                # size can tile the map without gaps.
+                fits[np.arange(fits.shape[0]) % (height + 1) != 0] = False
+                fits[:, np.arange(fits.shape[1]) % (width + 1) != 0] = False
+            else:
+                doors = [
+                    _window_sum(door_down, 1, width)[: end_row - 1, 1:end_col],
+                    _window_sum(door_up, 1, width)[height + 1 :, 1:end_col],
+                    _window_sum(door_right, height, 1)[1:end_row, : end_col - 1],
+                    _window_sum(door_left, height, 1)[1:end_row, width + 1 :],
+                ]
+                fits &= sum(doors) > 0
+
+            positions = np.argwhere(fits)
+            if len(positions):
+                # Only positions sharing the most wall are kept, which packs the
+                # rooms tightly enough to fit the room count.
+                shared = _window_sum(walls, height + 2, width + 2)[fits]
+                positions = positions[shared == shared.max()]
+                top, left = positions[rng.integers(len(positions))]
+                room = Room(int(top) + 1, int(left) + 1, int(height), int(width))
+                _carve_room(tiles, room)
+                if not first:
+                    _set_door(
+                        tiles, rng, room, [door_down, door_up, door_right, door_left]
+                    )
+                return room
+
+        if height <= room_size_min and width <= room_size_min:
+            return None
+        if height >= width:
+            height = max(room_size_min, height - 1)
+        else:
+            width = max(room_size_min, width - 1)
+
+
+def _carve_room(tiles: np.ndarray, room: Room) -> None:
+    """Lay the floor of room and wall it in, keeping existing walls and doors."""
+    top, left = room.row - 1, room.col - 1
+    bottom, right = room.row + room.height, room.col + room.width
+
+    box = tiles[top : bottom + 1, left : right + 1]
+    box[box == OUTSIDE] = WALL
+    tiles[room.row : bottom, room.col : right] = FLOOR
+
+
+def _set_door(
+    tiles: np.ndarray, rng: np.random.Generator, room: Room, door_masks: list
+) -> None:
+    """Turn one random shared wall tile of room into a door."""
+    door_down, door_up, door_right, door_left = door_masks
+    top, left = room.row - 1, room.col - 1
+    bottom, right = room.row + room.height, room.col + room.width
+    cols = slice(room.col, right)
+    rows = slice(room.row, bottom)
+
+    candidates = (
+        [(top, col) for col in np.flatnonzero(door_down[top, cols]) + room.col]
+        + [(bottom, col) for col in np.flatnonzero(door_up[bottom, cols]) + room.col]
+        + [(row, left) for row in np.flatnonzero(door_right[rows, left]) + room.row]
+        + [(row, right) for row in np.flatnonzero(door_left[rows, right]) + room.row]
+    )
+    row, col = candidates[rng.integers(len(candidates))]
+    tiles[row, col] = DOOR
+
+
+def _stretch_to_borders(tiles: np.ndarray, rooms: list[Room]) -> bool:
+    """
+    Grow rooms until walls touch all four borders, as checkMapSize requires.
+
+    Each side is handled as the top side of a flipped or transposed view of the
+    tiles, so the rooms are grown in place.
+
+    Returns:
+        bool: False if some border can not be reached.
+    """
+    map_size = tiles.shape[0]
+    views = [
+        (tiles, lambda room: room, lambda room: room),
+        (
+            tiles[::-1],
+            lambda room: room.flipped(map_size),
+            lambda room: room.flipped(map_size),
+        ),
+        (tiles.T, Room.transposed, Room.transposed),
+        (
+            tiles.T[::-1],
+            lambda room: room.transposed().flipped(map_size),
+            lambda room: room.flipped(map_size).transposed(),
+        ),
+    ]
+
+    for view, to_view, from_view in views:
+        if (view[0] == WALL).any():
+            continue
+
+        # The room closest to the border whose way up is clear grows into it.
+        for i in sorted(range(len(rooms)), key=lambda i: to_view(rooms[i]).row):
+            room = to_view(rooms[i])
+            left, right = room.col - 1, room.col + room.width
+            if (view[: room.row - 1, left : right + 1] == OUTSIDE).all():
+                grown = Room(1, room.col, room.height + room.row - 1, room.width)
+                _carve_room(view, grown)
+                rooms[i] = from_view(grown)
+                break
+        else:
+            return False
+
+    return True
+
+
+def _set_stairs(
+    tiles: np.ndarray, rng: np.random.Generator, room: Room, stairs: int
+) -> None:
+    interior = tiles[
+        room.row : room.row + room.height, room.col : room.col + room.width
+    ]
+    positions = np.argwhere(interior == FLOOR)
+    row, col = positions[rng.integers(len(positions))]
+    interior[row, col] = stairs
@@ -1,22 +1,36 @@
-import glob
-import json
+import itertools
+import os
 import re
-from utility import load_config
+import shutil
 
+import batch_store
+from utility import iter_json_files, load_config
 
 # 파일 단위로 이상한 데이터를 제거합니다.
 # 실행 후 reorganize.py를 실행해 주세요.
 
 
-def load_all_batches(preprocessed_path: str) -> list:  # TODO: move to utility
-    """Load all batch files from the preprocessed directory."""
-    file_paths = glob.glob(f"{preprocessed_path}batch*.json")
-    batches = []
-    for file_path in file_paths:
-        with open(file_path, "r") as infile:
-            dataset = json.load(infile)
-            batches.append((file_path, dataset))
-    return batches
+def is_valid_map(item: dict) -> bool:
+    """Check that 'map' is not empty, has 'P'/'B', has at least five lines,
+    and that the first and last line consist of # and spaces with at least three consecutive #s.
+    """
+    map_data = item.get("map", "").strip()
+    lines = map_data.splitlines()
+
+    # Check if the first and last line are valid
+    def valid_border_line(line: str) -> bool:
+        return bool(re.match(r"^\s*#{3,}\s*$", line))
+
+    # Remove if map is empty, lacks P/B, or the first/last line are invalid
+    return not (
+        not map_data
+        or ("P" not in map_data or "B" not in map_data)
+        or (
+            lines
+            and (not valid_border_line(lines[0]) or not valid_border_line(lines[-1]))
+        )
+        or len(lines) < 5
+    )
 
 
 def filter_maps(dataset: dict) -> dict:
@@ -27,59 +41,97 @@ def filter_maps(dataset: dict) -> dict:
     removed_items = []
 
     for item in dataset.get("map_list", []):
-        map_data = item.get("map", "").strip()
-        lines = map_data.splitlines()
-
-        # Check if the first and last line are valid
-        def valid_border_line(line: str) -> bool:
-            return bool(re.match(r"^\s*#{3,}\s*$", line))
-
-        # Remove if map is empty, lacks P/B, or the first/last line are invalid
-        if (
-            not map_data
-            or ("P" not in map_data or "B" not in map_data)
-            or (
-                lines
-                and (
-                    not valid_border_line(lines[0]) or not valid_border_line(lines[-1])
-                )
-            )
-            or len(lines) < 5
-        ):
-            removed_items.append(map_data)
-        else:
+        if is_valid_map(item):
             filtered_map_list.append(item)
+        else:
+            removed_items.append(item.get("map", "").strip())
 
     return {"map_list": filtered_map_list}, removed_items
 
 
-def save_batches(batches: list) -> None:
-    """Save the filtered datasets back to their respective files."""
-    for file_path, dataset in batches:
-        with open(file_path, "w") as outfile:
-            json.dump(dataset, outfile)
-        print(f"Saved filtered dataset to {file_path}")
+def save_store(
+    path: str, records, batch_size: int = None, compression: str = None
+) -> int:
+    """
+    Replace the dataset in path with a new store holding records.
 
+    The store is written next to path first, so records may be read from path
+    while it is written. Then the old store files and batch*.json files in path
+    are replaced by it.
 
-def clean_batches():
-    """Main function to clean batch files based on the given conditions."""
-    config = load_config()
-    preprocessed_path = config["paths"]["preprocessed"]
+    Returns:
+        int: The number of records saved.
+    """
+    temp_path = path.rstrip(os.sep) + ".filtered"
+    shutil.rmtree(temp_path, ignore_errors=True)
+
+    if batch_size is None:
+        batch_size = batch_store.DEFAULT_BATCH_SIZE
+    store = batch_store.BatchStore(
+        temp_path, batch_size, compression, flush_every=batch_size
+    )
+    with store:
+        store.extend(records)
+    count = len(store)
+
+    old_files = [batch_store.META_FILE, batch_store.INDEX_FILE]
+    old_files += batch_store.DATA_FILES.values()
+    old_files += [
+        filename
+        for filename in os.listdir(path)
+        if filename.startswith("batch") and filename.endswith(".json")
+    ]
+    for filename in old_files:
+        file_path = os.path.join(path, filename)
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+    for filename in os.listdir(temp_path):
+        os.replace(os.path.join(temp_path, filename), os.path.join(path, filename))
+    os.rmdir(temp_path)
+
+    return count
 
-    # Load all batches
-    batches = load_all_batches(preprocessed_path)
 
-    # Filter each batch dataset and print removed items
-    for i, (file_path, dataset) in enumerate(batches):
-        filtered_dataset, removed_items = filter_maps(dataset)
-        batches[i] = (file_path, filtered_dataset)
+def clean_batches():
+    """Main function to clean the preprocessed dataset based on the given conditions.
 
-        # Print removed items' map part only
-        for map_data in removed_items:
-            print(f"Removed from {file_path}: {map_data}")
+    Raises:
+        ValueError: Raised when the preprocessed dataset holds no maps.
+    """
+    config = load_config()
+    preprocessed_path = config["paths"]["preprocessed"]
 
-    # Save the cleaned batches
-    save_batches(batches)
+    # Keep the batch size and compression of an existing store
+    batch_size = None
+    compression = None
+    if batch_store.is_store(preprocessed_path):
+        dataset = batch_store.BatchStore(preprocessed_path)
+        batch_size = dataset.batch_size
+        compression = dataset.compression
+
+    # Check for data before anything is replaced
+    items = iter_json_files(preprocessed_path)
+    first = next(items, None)
+    if first is None:
+        raise ValueError(f"No maps found in {preprocessed_path}")
+
+    total = 0
+
+    def kept_items():
+        nonlocal total
+        for item in itertools.chain([first], items):
+            total += 1
+            if is_valid_map(item):
+                yield item
+            else:
+                # Print removed items' map part only
+                print(f"Removed item {total - 1}: {item.get('map', '').strip()}")
+
+    # Filter the dataset into a new store
+    kept = save_store(preprocessed_path, kept_items(), batch_size, compression)
+
+    print(f"Saved {kept} of {total} maps to {preprocessed_path}")
 
 
 # Run the cleaning process
@@ -0,0 +1,183 @@
+from functools import cached_property
+
+import numpy as np
+
+try:
+    from . import components
+except ImportError:
+    import components
+
+OUTSIDE = " "
+
+# Cached properties of Level, dropped when its tiles change.
+CACHED_PROPERTIES = (
+    "walls",
+    "passable",
+    "objects",
+    "room_tiles",
+    "components",
+    "rooms",
+)
+
+
+class Level:
+    """A class to represent ASCII level as a compact tile array.
+
+    ASCII tiles are stored as their own code, so `level.tiles == ord("#")` works
+    directly. Other characters (LLM outputs sometimes contain them) get codes
+    from 128 upward and are remembered in `extra_chars`. Rows are padded with
+    " " to the longest row, as validater._standardize does.
+
+    Attributes:
+        tiles (np.ndarray): The 2-dimensional uint8 array of tile codes.
+        extra_chars (list[str]): Non-ASCII characters, extra_chars[i] has code 128 + i.
+    """
+
+    wall_icons = "#"
+    door_icons = "/"
+    object_icons = "ETP>B"
+
+    def __init__(self, tiles: np.ndarray, extra_chars: list[str] = None) -> None:
+        self.tiles = tiles
+        self.extra_chars = extra_chars if extra_chars is not None else list()
+
+    @classmethod
+    def from_str(cls, level: str) -> "Level":
+        """Create a Level from a string level. Returns None for an empty level."""
+        if not level:
+            return None
+
+        rows = level.split("\n")
+        if not rows[-1]:
+            rows = rows[:-1]
+
+        return cls._from_rows(rows)
+
+    @classmethod
+    def from_list(cls, list_level: list) -> "Level":
+        """Create a Level from a 2D list level. Returns None for an empty level."""
+        if not list_level:
+            return None
+
+        return cls._from_rows(["".join(row) for row in list_level])
+
+    @classmethod
+    def _from_rows(cls, rows: list[str]) -> "Level":
+        width = max(len(row) for row in rows)
+        text = "".join(row.ljust(width, OUTSIDE) for row in rows)
+
+        if text.isascii():
+            flat = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+            return cls(flat.reshape(len(rows), width).copy())
+
+        extra_chars = list()
+        codes = list()
+        for char in text:
+            code = ord(char)
+            if code >= 128:
+                if char not in extra_chars:
+                    extra_chars.append(char)
+                code = min(128 + extra_chars.index(char), 255)
+            codes.append(code)
+
+        flat = np.array(codes, dtype=np.uint8)
+        return cls(flat.reshape(len(rows), width), extra_chars)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.tiles.shape
+
+    def code(self, char: str) -> int:
+        """Return the tile code of char, or -1 if char does not occur in this level."""
+        code = ord(char)
+        if code < 128:
+            return code
+        if char in self.extra_chars:
+            return min(128 + self.extra_chars.index(char), 255)
+        return -1
+
+    def char(self, code: int) -> str:
+        """Return the character of a tile code."""
+        if code < 128:
+            return chr(code)
+        return self.extra_chars[code - 128]
+
+    def mask(self, chars: str) -> np.ndarray:
+        """Return a bool mask of the tiles equal to any of chars."""
+        codes = [self.code(char) for char in chars]
+        return np.isin(self.tiles, [code for code in codes if code >= 0])
+
+    def count(self, char: str) -> int:
+        return int(np.count_nonzero(self.tiles == self.code(char)))
+
+    def positions(self, char: str) -> list[tuple[int, int]]:
+        """Return the positions of char in row-major order."""
+        return [(int(x), int(y)) for x, y in np.argwhere(self.tiles == self.code(char))]
+
+    def histogram(self) -> dict[str, int]:
+        """Return the number of tiles of every character in the level."""
+        codes, counts = np.unique(self.tiles, return_counts=True)
+        return {self.char(code): int(count) for code, count in zip(codes, counts)}
+
+    @cached_property
+    def walls(self) -> np.ndarray:
+        return self.mask(self.wall_icons)
+
+    @cached_property
+    def passable(self) -> np.ndarray:
+        return ~self.walls
+
+    @cached_property
+    def objects(self) -> np.ndarray:
+        return self.mask(self.object_icons)
+
+    @cached_property
+    def room_tiles(self) -> np.ndarray:
+        """The tiles rooms are made of: neither walls, doors nor outside."""
+        return ~self.mask(self.wall_icons + self.door_icons + OUTSIDE)
+
+    @cached_property
+    def components(self) -> tuple[np.ndarray, int]:
+        """components.label of the passable tiles."""
+        return components.label(self.passable)
+
+    @cached_property
+    def rooms(self) -> tuple[np.ndarray, int]:
+        """components.label of the room tiles."""
+        return components.label(self.room_tiles)
+
+    def set_tiles(self, positions: list[tuple[int, int]], char: str) -> None:
+        """Write char at every position and drop the cached masks."""
+        if not positions:
+            return
+
+        code = self.code(char)
+        if code < 0:
+            self.extra_chars.append(char)
+            code = self.code(char)
+
+        rows, cols = zip(*positions)
+        self.tiles[list(rows), list(cols)] = code
+        for name in CACHED_PROPERTIES:
+            self.__dict__.pop(name, None)
+
+    def copy(self) -> "Level":
+        return Level(self.tiles.copy(), list(self.extra_chars))
+
+    def to_list(self) -> list[list[str]]:
+        if not self.extra_chars:
+            return [list(row.tobytes().decode("ascii")) for row in self.tiles]
+        return [[self.char(code) for code in row] for row in self.tiles.tolist()]
+
+    def to_str(self) -> str:
+        """Return the level as a string, every row ending with a newline."""
+        return "".join("".join(row) + "\n" for row in self.to_list())
+
+
+def as_level(level) -> Level:
+    """Convert a string level, a 2D list level or a Level into a Level."""
+    if level is None or isinstance(level, Level):
+        return level
+    if isinstance(level, str):
+        return Level.from_str(level)
+    return Level.from_list(level)
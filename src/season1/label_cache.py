@@ -0,0 +1,218 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from . import grid
+from . import labeler
+from . import utility
+
+config = utility.load_config()
+
+CACHE_PATH = config["paths"]["cache"]
+
+DEFAULT_MEMORY_SIZE = 4096
+
+
+class LabelCache:
+    """A persistent cache of label results keyed by the hash of the map.
+
+    Results are pickled into a SQLite file, with an in-memory LRU in front of it.
+    The key covers the labeling function, its keyword arguments,
+    labeler.LABELER_VERSION and the normalized map, so bumping the version
+    invalidates old entries.
+
+    Attributes:
+        path (str): The SQLite file.
+        memory_size (int): Number of results kept in memory.
+        memory_hits (int): Lookups answered from memory.
+        disk_hits (int): Lookups answered from the SQLite file.
+        misses (int): Lookups that had to be computed.
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join(CACHE_PATH, "labels.sqlite"),
+        memory_size: int = DEFAULT_MEMORY_SIZE,
+    ) -> None:
+        self.path = path
+        self.memory_size = memory_size
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not cross a fork, so worker processes open their own.
+        if self._connection is None or self._pid != os.getpid():
+            utility.create_directory(os.path.dirname(self.path))
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS labels (key TEXT PRIMARY KEY, value BLOB)"
+            )
+            self._pid = os.getpid()
+
+        return self._connection
+
+    def get(self, key: str) -> tuple[bool, any]:
+        """Return (found, value) for key."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return True, pickle.loads(self._memory[key])
+
+        row = (
+            self._connect()
+            .execute("SELECT value FROM labels WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None:
+            self.misses += 1
+            return False, None
+
+        self.disk_hits += 1
+        self._remember(key, row[0])
+        return True, pickle.loads(row[0])
+
+    def put(self, key: str, value: any) -> None:
+        blob = pickle.dumps(value)
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO labels (key, value) VALUES (?, ?)", (key, blob)
+            )
+        self._remember(key, blob)
+
+    def put_many(self, items: list[tuple[str, any]]) -> None:
+        blobs = [(key, pickle.dumps(value)) for key, value in items]
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO labels (key, value) VALUES (?, ?)", blobs
+            )
+        for key, blob in blobs:
+            self._remember(key, blob)
+
+    def _remember(self, key: str, blob: bytes) -> None:
+        self._memory[key] = blob
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove every entry from memory and from the SQLite file."""
+        self._memory.clear()
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM labels")
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+
+_default_cache = None
+_default_disabled = False
+
+
+def get_default_cache() -> LabelCache:
+    """Return the shared cache, creating it on first use. None if disabled."""
+    global _default_cache
+
+    if _default_disabled:
+        return None
+    if _default_cache is None:
+        _default_cache = LabelCache()
+
+    return _default_cache
+
+
+def set_default_cache(cache: LabelCache) -> None:
+    """Replace the shared cache. Passing None turns caching off."""
+    global _default_cache, _default_disabled
+
+    _default_cache = cache
+    _default_disabled = cache is None
+
+
+def make_key(kind: str, level: str | grid.Level, **params) -> str:
+    """Hash the labeling function name, its arguments, the labeler version and the map."""
+    if isinstance(level, grid.Level):
+        level = level.to_str()
+    elif level and not level.endswith("\n"):
+        # A missing final newline does not change the parsed level.
+        level += "\n"
+
+    param_str = ",".join(f"{name}={value!r}" for name, value in sorted(params.items()))
+    header = f"{kind}:{labeler.LABELER_VERSION}:{param_str}\n"
+    return hashlib.sha256((header + (level or "")).encode("utf-8")).hexdigest()
+
+
+def cached(kind: str, compute, level: str | grid.Level, **params) -> any:
+    """Return compute(level, **params), going through the shared cache."""
+    cache = get_default_cache()
+    if cache is None or level is None:
+        return compute(level, **params)
+
+    key = make_key(kind, level, **params)
+    found, value = cache.get(key)
+    if found:
+        return value
+
+    value = compute(level, **params)
+    cache.put(key, value)
+    return value
+
+
+def cached_map(
+    kind: str,
+    compute,
+    levels: list,
+    workers: int = None,
+    executor: ProcessPoolExecutor = None,
+    **params,
+) -> list:
+    """
+    Return compute(level, **params) for every level.
+
+    Hits are answered in this process, and only the misses are sent to the process
+    pool (executor, if given). Results are written back to the cache from this
+    process only.
+    """
+    levels = list(levels)
+    func = partial(compute, **params) if params else compute
+
+    cache = get_default_cache()
+    if cache is None:
+        return utility.parallel_map(func, levels, workers, executor=executor)
+
+    keys = [make_key(kind, level, **params) for level in levels]
+    results = [None] * len(levels)
+    missing = list()
+    for i, key in enumerate(keys):
+        found, value = cache.get(key)
+        if found:
+            results[i] = value
+        else:
+            missing.append(i)
+
+    computed = utility.parallel_map(
+        func, [levels[i] for i in missing], workers, executor=executor
+    )
+    for i, value in zip(missing, computed):
+        results[i] = value
+    cache.put_many([(keys[i], value) for i, value in zip(missing, computed)])
+
+    return results
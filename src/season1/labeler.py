@@ -2,6 +2,11 @@ from collections import deque
 import json
 import os
 
+import numpy as np
+
+from . import distance
+from . import grid
+from . import label_cache
 from .utility import load_config
 
 config = load_config()
@@ -12,7 +17,10 @@ LABELLED_PATH = config["paths"]["labelled"]
 # Define constants
 DEFAULT_FILE_COUNT = 100
 DEFAULT_DIFFICULTY_CURVE_INTERVAL = 5
-DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+DIRECTIONS = distance.DIRECTIONS
+
+# Bump when a change alters any label value. Cached labels of older versions are ignored.
+LABELER_VERSION = 1
 
 # Input parameter names list
 input_parameter_names = [
@@ -62,6 +70,7 @@ def label(
     labelled_path: str = LABELLED_PATH,
     file_count: int = DEFAULT_FILE_COUNT,
     difficulty_curve_interval: int = DEFAULT_DIFFICULTY_CURVE_INTERVAL,
+    workers: int = None,
 ) -> None:
     """
     Labels level data by estimating and updating parameters.
@@ -71,44 +80,65 @@ def label(
         labelled_path: Path to the output files.
         file_count: Number of files to process.
         difficulty_curve_interval: Interval for difficulty curve calculation.
+        workers: Number of worker processes. Defaults to the CPU count.
     """
 
     # Load data. input_data is a list of batches = { "map_list": [] }
     data = load_folder(path=placed_path, file_count=file_count)
 
-    # Estimate each level data
-    for i, data_i in enumerate(data):
-        for j, map_list_j in enumerate(data_i["map_list"]):
-            new_params = estimate(map_list_j["map"], difficulty_curve_interval)
-            data[i]["map_list"][j]["params"].update(new_params)
+    # Estimate every level data at once
+    map_items = [map_item for data_i in data for map_item in data_i["map_list"]]
+    new_params_list = estimate_many(
+        [map_item["map"] for map_item in map_items], difficulty_curve_interval, workers
+    )
+    for map_item, new_params in zip(map_items, new_params_list):
+        map_item["params"].update(new_params)
 
     # Save data
     save_folder(data=data, path=labelled_path, file_count=file_count)
 
 
 def estimate(
-    level: str, difficulty_curve_interval: int = DEFAULT_DIFFICULTY_CURVE_INTERVAL
+    level: str | grid.Level,
+    difficulty_curve_interval: int = DEFAULT_DIFFICULTY_CURVE_INTERVAL,
 ) -> dict[str, float]:
     """
     Estimate level parameters and return them as a dictionary.
 
+    Ragged rows are padded with outside tiles to the longest row (see grid.Level),
+    so the map is as wide as its longest row. Tiles past the first row's length
+    count towards map_size and the tile totals and can be reached by flood fills.
+
     Args:
-        level: Level data in string format.
+        level: Level data in string format or as a grid.Level.
         difficulty_curve_interval: Interval for difficulty curve calculation.
 
     Returns:
         Dictionary of estimated parameters.
     """
-    # Convert string level to list level it
-    list_level = str_level_to_list_level(level)
+    return label_cache.cached(
+        "estimate",
+        _estimate,
+        level,
+        difficulty_curve_interval=difficulty_curve_interval,
+    )
+
+
+def _estimate(
+    level: str | grid.Level,
+    difficulty_curve_interval: int = DEFAULT_DIFFICULTY_CURVE_INTERVAL,
+) -> dict[str, float]:
+    # Convert string level to grid level
+    grid_level = grid.as_level(level)
 
     # Count parameters
-    counts = _set_count_dict(list_level)
+    counts = _set_count_dict(grid_level)
 
     # Find positions of objects and calculate distances
-    positions = _set_object_dict(list_level)
+    positions = _set_object_dict(grid_level)
+    engine = distance.DistanceEngine(grid_level)
     distances, accessible_tile_count = _set_distance_dict(
-        list_level, positions["entry"], positions["exit"]
+        grid_level, positions["entry"], positions["exit"], engine
     )
 
     # Calculate and store output parameters
@@ -117,8 +147,34 @@ def estimate(
         positions,
         distances,
         difficulty_curve_interval,
-        list_level,
+        grid_level,
         accessible_tile_count,
+        engine,
+    )
+
+
+def estimate_many(
+    levels: list[str],
+    difficulty_curve_interval: int = DEFAULT_DIFFICULTY_CURVE_INTERVAL,
+    workers: int = None,
+) -> list[dict[str, float]]:
+    """
+    Estimate the parameters of many levels across a process pool.
+
+    Args:
+        levels: Levels in string format.
+        difficulty_curve_interval: Interval for difficulty curve calculation.
+        workers: Number of worker processes. Defaults to the CPU count.
+
+    Returns:
+        Estimated parameters of every level, in input order.
+    """
+    return label_cache.cached_map(
+        "estimate",
+        _estimate,
+        levels,
+        workers,
+        difficulty_curve_interval=difficulty_curve_interval,
     )
 
 
@@ -127,10 +183,14 @@ def _calculate_output_parameters(
     positions: dict,
     distances: dict,
     difficulty_curve_interval: int,
-    list_level: list,
+    level: grid.Level,
     accessible_tile_count: int,
+    engine: distance.DistanceEngine = None,
 ) -> dict:
     """Calculate and return the output parameters."""
+    if engine is None:
+        engine = distance.DistanceEngine(level)
+
     return {
         output_parameter_names[0]: _density(
             counts["treasure_count"] + counts["enemy_count"], counts["total_tile_count"]
@@ -139,10 +199,11 @@ def _calculate_output_parameters(
             counts["empty_tile_count"], counts["total_tile_count"]
         ),
         output_parameter_names[2]: _exploration_requirement(
-            list_level,
+            level,
             distances["entry"],
             positions["object_positions"],
             accessible_tile_count,
+            engine,
         ),
         output_parameter_names[3]: _difficulty_curve(
             distances["entry"], positions["enemy_positions"], difficulty_curve_interval
@@ -151,12 +212,13 @@ def _calculate_output_parameters(
         output_parameter_names[5]: counts["enemy_count"],
         output_parameter_names[6]: counts["map_size"],
         output_parameter_names[7]: _exploration_requirement(
-            list_level,
+            level,
             distances["entry"],
             [positions["entry"], positions["exit"]],
             accessible_tile_count,
+            engine,
         ),
-        output_parameter_names[8]: _count_rooms(list_level),
+        output_parameter_names[8]: _count_rooms(level),
     }
 
 
@@ -241,8 +303,10 @@ def save_folder(
 # =============================
 # 3-1. Tile and Object Counting
 # =============================
-def _set_count_dict(list_level: list) -> dict:
-    treasure_count, enemy_count, empty_tile_count, map_size = _tile_count(list_level)
+def _set_count_dict(level: grid.Level, histogram: dict = None) -> dict:
+    treasure_count, enemy_count, empty_tile_count, map_size = _tile_count(
+        level, histogram
+    )
 
     total_object_count = treasure_count + enemy_count + 2
     total_passable_tile_count = total_object_count + empty_tile_count
@@ -259,62 +323,40 @@ def _set_count_dict(list_level: list) -> dict:
     }
 
 
-def _tile_count(list_level: list) -> tuple:
-    treasure_count = 0
-    enemy_count = 0
-    empty_tile_count = 0
-    map_size = len(list_level), len(list_level[0])
-    for row in list_level:
-        for tile in row:
-            if tile == icons["treasure"]:
-                treasure_count += 1
-            elif tile == icons["enemy"]:
-                enemy_count += 1
-            elif tile == icons["empty"]:
-                empty_tile_count += 1
+def _tile_count(level: grid.Level, histogram: dict = None) -> tuple:
+    if histogram is None:
+        histogram = level.histogram()
+
+    treasure_count = histogram.get(icons["treasure"], 0)
+    enemy_count = histogram.get(icons["enemy"], 0)
+    empty_tile_count = histogram.get(icons["empty"], 0)
+    map_size = level.shape
 
     return treasure_count, enemy_count, empty_tile_count, map_size
 
 
-def _count_rooms(list_level: list) -> int:
+def _count_rooms(level: grid.Level) -> int:
     """
     Count the number of rooms in the level. A room is defined as a continuous space surrounded by walls.
 
     Args:
-        list_level: 2D list representing the level.
+        level: The level, or a 2D list representing it.
 
     Returns:
         Number of rooms.
     """
-    icon_wall = icons["wall"]
-
-    closed_space_count = 0
-    visited = set()
-    icon_obstacles = {icon_wall, icons["door"], icons["outside"]}
-
-    x_boundary = len(list_level)
-    y_boundary = len(list_level[0])
-
-    for x in range(x_boundary):
-        for y in range(y_boundary):
-            if (x, y) not in visited and _is_accessible(
-                list_level[x][y], icon_obstacles
-            ):
-                closed_space_count += 1
-                _visit(
-                    list_level, x, y, x_boundary, y_boundary, icon_obstacles, visited
-                )
-
-    return closed_space_count
+    _, room_count = grid.as_level(level).rooms
+    return room_count
 
 
 # ====================================
 # 3-2. Object and Position Information
 # ====================================
-def _set_object_dict(list_level: list) -> dict:
+def _set_object_dict(level: grid.Level) -> dict:
     """Determines the position of objects in the given level."""
+    positions = _object_positions(level)
 
-    entry_position = _find_objects_position(list_level, icons["entry"])
+    entry_position = positions.get(icons["entry"], [])
     if not entry_position:
         print("Entry doesn't exist.")
         entry_position = None
@@ -323,9 +365,9 @@ def _set_object_dict(list_level: list) -> dict:
             print("Entry is not unique.")
         entry_position = entry_position[0]
 
-    treasure_positions = _find_objects_position(list_level, icons["treasure"])
-    enemy_positions = _find_objects_position(list_level, icons["enemy"])
-    exit_position = _get_exit_position(list_level)
+    treasure_positions = positions.get(icons["treasure"], [])
+    enemy_positions = positions.get(icons["enemy"], [])
+    exit_position = _get_exit_position(level, positions)
 
     object_positions = treasure_positions + enemy_positions
     if entry_position:
@@ -341,23 +383,36 @@ def _set_object_dict(list_level: list) -> dict:
     }
 
 
-def _get_exit_position(list_level: list) -> str:
+def _object_positions(level: grid.Level) -> dict[str, list[tuple[int, int]]]:
+    """Return the row-major positions of every object icon, found in one pass."""
+    xs, ys = np.nonzero(level.objects)
+    chars = level.tiles[xs, ys].tobytes().decode("ascii")
+
+    positions = dict()
+    for char, x, y in zip(chars, xs.tolist(), ys.tolist()):
+        positions.setdefault(char, []).append((x, y))
+
+    return positions
+
+
+def _get_exit_position(level: grid.Level, positions: dict = None) -> str:
     """Determines the position of the exit in the given level."""
-    icon_boss = icons["boss"]
-    icon_exit = icons["exit"]
-
-    # Check if there is a boss or an exit.
-    for row in list_level:
-        if icon_boss in row:
-            exit_position = _find_objects_position(list_level, icon_boss)
-            break
-        elif icon_exit in row:
-            exit_position = _find_objects_position(list_level, icon_exit)
-            break
-    else:
+    if positions is None:
+        positions = _object_positions(level)
+    boss_positions = positions.get(icons["boss"], [])
+    exit_positions = positions.get(icons["exit"], [])
+
+    # Check if there is a boss or an exit. The first row holding either one decides.
+    candidate_rows = [pos[0] for pos in boss_positions[:1] + exit_positions[:1]]
+    if not candidate_rows:
         print("Exit doesn't exist")
         return None
 
+    if boss_positions and boss_positions[0][0] == min(candidate_rows):
+        exit_position = boss_positions
+    else:
+        exit_position = exit_positions
+
     if len(exit_position) != 1:
         print("Exit is not unique")
 
@@ -365,14 +420,20 @@ def _get_exit_position(list_level: list) -> str:
 
 
 def _set_distance_dict(
-    list_level: list, entry_pos: tuple, exit_pos: tuple
+    level: grid.Level,
+    entry_pos: tuple,
+    exit_pos: tuple,
+    engine: distance.DistanceEngine = None,
 ) -> tuple[dict, int]:
     """Determines the area of the flood-fill algo required from start pos to all another accessible tile."""
+    if engine is None:
+        engine = distance.DistanceEngine(level)
+
     entry_distance_dict, accessible_tile_count_from_entry = (
-        _flood_fill_area(list_level, entry_pos) if entry_pos else {}
+        engine.flood_fill_area(entry_pos) if entry_pos else {}
     )
     exit_distance_dict, accessible_tile_count_from_exit = (
-        _flood_fill_area(list_level, exit_pos) if exit_pos else {}
+        engine.flood_fill_area(exit_pos) if exit_pos else {}
     )
 
     return {
@@ -381,14 +442,9 @@ def _set_distance_dict(
     }, accessible_tile_count_from_entry
 
 
-def _find_objects_position(list_level: list, obj_icon: str) -> list:
+def _find_objects_position(level: grid.Level, obj_icon: str) -> list:
     """Find all positions of a specific object icon in the level."""
-    return [
-        (i, j)
-        for i, row in enumerate(list_level)
-        for j, tile in enumerate(row)
-        if tile == obj_icon
-    ]
+    return grid.as_level(level).positions(obj_icon)
 
 
 def _shortest_distances(list_level: list, pos: tuple) -> dict:
@@ -465,10 +521,11 @@ def _empty_ratio(empty_count: int, total_tile_count: int) -> float:
 
 
 def _exploration_requirement(
-    list_level: list[list],
+    level: grid.Level,
     distance_dict_entry: dict,
     object_positions: list,
     accessible_tile_count: int,
+    engine: distance.DistanceEngine = None,
 ) -> int:
     """
     Returns the amount of movement required to meet all objects from the entrance.
@@ -477,6 +534,7 @@ def _exploration_requirement(
         distance_dict_entry: Dict of distances between entry and accessible tiles.
         object_positions: List of positions of all objects in the level.
         accessible_tile_count: the number of accessible tiles from entry.
+        engine: Distance engine of the level. Reusing one across calls shares its flood fills.
 
     Returns:
         The amount of movement required to meet all objects from the entrance.
@@ -491,19 +549,13 @@ def _exploration_requirement(
         if obj_pos in distance_dict_entry:
             accessible_obj_list.append(obj_pos)
 
-    # Make distance dict for every accissible objects.
-    accessible_obj_distance_dict_list = []
-    for obj_pos in accessible_obj_list:
-        accessible_obj_distance_dict, _ = _flood_fill_area(list_level, obj_pos)
-        accessible_obj_distance_dict_list.append(accessible_obj_distance_dict)
+    # Make distance matrix for every accissible objects.
+    if engine is None:
+        engine = distance.DistanceEngine(level)
+    distance_matrix = engine.distance_matrix(accessible_obj_list)
 
-    f_e = 0
+    f_e = sum(map(sum, distance_matrix))
     n = len(accessible_obj_list)
-    for i in range(n):
-        E_i = 0
-        for obj_pos_j in accessible_obj_list:
-            E_i += accessible_obj_distance_dict_list[i][obj_pos_j]
-        f_e += E_i
 
     if n == 1:
         return 0
@@ -516,24 +568,21 @@ def _difficulty_curve(
 ) -> float:
     """Returns the difficulty curve."""
 
-    heights = []
-
     # Find the longest distance within accessible points.
     longest_distance = max(distance_dict.values(), default=0)
+    interval_count = longest_distance // interval + 1
 
-    for i in range(longest_distance // interval + 1):
-        temp_height = 0
-        for enemy_pos in enemy_positions:
-            try:
-                enemy_distance = distance_dict[enemy_pos]
-                if i * interval < enemy_distance <= (i + 1) * interval:
-                    temp_height += 1
-            except KeyError:
+    # Enemy counts per interval (i * interval, (i + 1) * interval].
+    heights = [0] * interval_count
+    for enemy_pos in enemy_positions:
+        enemy_distance = distance_dict.get(enemy_pos)
+        if enemy_distance is None:
+            for _ in range(interval_count):
                 print("Enemy may be in an inaccessible location.", enemy_pos)
-        heights.append(temp_height)
+        elif enemy_distance > 0:
+            heights[(enemy_distance - 1) // interval] += 1
 
     height_difference = heights[0] - heights[-1]
-    interval_count = longest_distance // interval + 1
     return (
         height_difference / interval_count
     )  # Mean variation of enemy number per interval.
@@ -554,38 +603,6 @@ def str_level_to_list_level(level: str) -> list:
     return result
 
 
-def _visit(
-    list_level: list,
-    x: int,
-    y: int,
-    x_boundary: int,
-    y_boundary: int,
-    icon_obstacles: set,
-    visited: set,
-) -> None:
-    """
-    Explores the level starting from the given (x, y) position using a breadth-first search (BFS) approach.
-
-    This method is in-place. It modify an input: visited.
-
-    Returns:
-        None
-    """
-    que = deque([(x, y)])
-    while que:
-        cur_x, cur_y = que.popleft()
-        for dx, dy in DIRECTIONS:
-            new_x = cur_x + dx
-            new_y = cur_y + dy
-            if (
-                (new_x, new_y) not in visited
-                and _is_in_bounds(new_x, new_y, x_boundary, y_boundary)
-                and _is_accessible(list_level[new_x][new_y], icon_obstacles)
-            ):
-                visited.add((new_x, new_y))
-                que.append((new_x, new_y))
-
-
 def _is_in_bounds(x: int, y: int, x_boundary: int, y_boundary: int) -> bool:
     """Check if the position is within the map boundaries."""
     return 0 <= x < x_boundary and 0 <= y < y_boundary
@@ -2,6 +2,8 @@ from .prompt_generator import generate_prompt
 from .sampler import generate_example_prompt
 from .preprocessor import preprocess
 from .unstructured_data_generator import unstructured_data_generate
+from . import batch_store
+from . import token_budget
 from .utility import *
 
 
@@ -12,8 +14,15 @@ def generate_prompt_and_ascii_map(
     # Generate the prompt
     system, prompt = generate_prompt(example_prompt, parameters, prompt_style)
 
+    # Size the reply for the requested map instead of the model's largest
+    max_tokens = token_budget.max_tokens_for(params=parameters)
+    logging.info(
+        f"Input tokens: {token_budget.count_message_tokens(system, prompt)}, "
+        f"max_tokens: {max_tokens}"
+    )
+
     # Generate unstructured data from the prompt
-    raw_text = unstructured_data_generate(system, prompt)
+    raw_text = unstructured_data_generate(system, prompt, max_tokens)
 
     # Preprocess the unstructured data into an ASCII map
     ascii_map = preprocess(raw_text)
@@ -42,22 +51,8 @@ def generate_data_block(
     return data_block
 
 
-def generate_and_save_data(
-    data_block: dict,
-    current_file: str,
-    dataset: dict,
-) -> dict:
-    """Append the provided data block to the dataset and save it if necessary."""
-
-    # Step 1: Append the data block to the dataset
-    dataset["map_list"].append(data_block)
-
-    logging.info(f"Appending data block to dataset in file: {current_file}")
-
-    # Step 2: Check if dataset size has reached the limit (e.g., 100 entries)
-    if len(dataset["map_list"]) >= 100:
-        save_dataset_to_file(dataset, current_file)
-        dataset = {"map_list": []}  # Reset dataset after saving
-        logging.info(f"Dataset saved and reset after reaching limit in {current_file}")
+def generate_and_save_data(data_block: dict, dataset: batch_store.BatchStore) -> None:
+    """Append the provided data block to the dataset store."""
+    dataset.append(data_block)
 
-    return dataset
+    logging.info(f"Appending data block to dataset: {dataset.path}")
@@ -0,0 +1,230 @@
+import math
+
+import numpy as np
+
+STEP = "step"
+INDEX = "index"
+
+SIDES = ("before", "after")
+
+
+def column(side: str, param_name: str) -> str:
+    """The field name of a parameter in a metrics table, like "after_room_count"."""
+    return f"{side}_{param_name}"
+
+
+def build_table(
+    compared_lists: dict[int, list[dict]] | list[dict],
+    param_name_list: list[str],
+) -> np.ndarray:
+    """
+    Materialize compared results into a columnar NumPy structured array.
+
+    Every record becomes one row with its recursion step, its position within that
+    step, and one float column per before/after parameter. List parameters such as
+    map_size become subarray columns, one value per component. Values that are not
+    numbers (None, "NaN", a missing key) are stored as NaN, so the statistics below
+    skip them without any per-record special casing.
+
+    Args:
+        compared_lists (dict[int, list[dict]] | list[dict]): Records with
+            "before_params" and "after_params", keyed by recursion step. A plain
+            iterable of records is step 0.
+        param_name_list (list[str]): The parameters to keep.
+
+    Returns:
+        np.ndarray: The table, with the fields STEP, INDEX and column(side, name)
+        for every side of SIDES and every name of param_name_list.
+    """
+    if not isinstance(compared_lists, dict):
+        compared_lists = {0: compared_lists}
+
+    steps = list()
+    indices = list()
+    values = {
+        column(side, param_name): list()
+        for side in SIDES
+        for param_name in param_name_list
+    }
+
+    for step, compared_list in compared_lists.items():
+        index = -1
+        for index, compared in enumerate(compared_list):
+            for side in SIDES:
+                params = compared.get(f"{side}_params") or dict()
+                for param_name in param_name_list:
+                    values[column(side, param_name)].append(params.get(param_name))
+        steps.extend([step] * (index + 1))
+        indices.extend(range(index + 1))
+
+    for name, raw_values in values.items():
+        values[name] = _column_values(raw_values)
+
+    # A parameter is as wide as its widest value on either side.
+    widths = dict()
+    for param_name in param_name_list:
+        widths[param_name] = max(
+            values[column(side, param_name)].shape[1:] or (0,) for side in SIDES
+        )[0]
+
+    dtype = [(STEP, np.int32), (INDEX, np.int32)]
+    for side in SIDES:
+        for param_name in param_name_list:
+            if widths[param_name]:
+                dtype.append((column(side, param_name), np.float64, widths[param_name]))
+            else:
+                dtype.append((column(side, param_name), np.float64))
+
+    table = np.empty(len(steps), dtype=dtype)
+    table[STEP] = steps
+    table[INDEX] = indices
+    for side in SIDES:
+        for param_name in param_name_list:
+            name = column(side, param_name)
+            if values[name].shape[1:] == table[name].shape[1:]:
+                table[name] = values[name]
+            else:
+                # Scalars where the other side holds lists do not fit the columns.
+                table[name] = math.nan
+
+    return table
+
+
+def _column_values(raw_values: list) -> np.ndarray:
+    """
+    Convert the values of one column to floats, all at once when possible.
+
+    Returns:
+        np.ndarray: Shape (rows,) for scalars, (rows, width) for lists. Values that
+        are not numbers, and lists shorter than the widest one, become NaN.
+    """
+    try:
+        values = np.array(raw_values, dtype=np.float64)
+        if values.ndim in (1, 2):
+            return values
+    except (TypeError, ValueError):
+        pass
+
+    # Mixed values, like lists and scalars or strings other than "NaN".
+    width = max(
+        (len(value) for value in raw_values if isinstance(value, (list, tuple))),
+        default=0,
+    )
+    if not width:
+        return np.array([_to_float(value) for value in raw_values], dtype=np.float64)
+
+    values = np.full((len(raw_values), width), math.nan)
+    for row, value in enumerate(raw_values):
+        if isinstance(value, (list, tuple)) and len(value) == width:
+            values[row] = [_to_float(item) for item in value]
+
+    return values
+
+
+def _to_float(value) -> float:
+    """A number as a float, anything else as NaN."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def valid(values: np.ndarray) -> np.ndarray:
+    """Rows whose values (every component of a list parameter) are all numbers."""
+    return np.isfinite(values).all(axis=tuple(range(1, np.ndim(values))))
+
+
+def abs_diff(table: np.ndarray, param_name: str) -> np.ndarray:
+    """|after - before| of every row. NaN where either side is missing."""
+    return np.abs(
+        table[column("after", param_name)] - table[column("before", param_name)]
+    )
+
+
+def controllability(table: np.ndarray, param_name: str) -> np.ndarray:
+    """
+    1 - |before - after| / max(before, after) of every row.
+
+    Rows with a missing side, or where both values are 0, are NaN.
+    """
+    before = table[column("before", param_name)]
+    after = table[column("after", param_name)]
+    larger = np.maximum(before, after)
+
+    scores = np.full(np.shape(larger), math.nan)
+    defined = np.isfinite(larger) & (larger != 0)
+    scores[defined] = 1 - np.abs(before - after)[defined] / larger[defined]
+
+    return scores
+
+
+def mean_std(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The mean and standard deviation of the valid rows of values, per component.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Scalars for a scalar column, arrays for a
+        subarray column. NaN if no row is valid.
+    """
+    values = values[valid(values)]
+    if not len(values):
+        nan = np.full(values.shape[1:], math.nan)
+        return nan[()], nan[()]
+
+    return np.mean(values, axis=0), np.std(values, axis=0)
+
+
+def group_mean(
+    table: np.ndarray, values: np.ndarray, by: str = STEP
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The mean of the valid rows of a column for every value of table[by].
+
+    A subarray column, like map_size, is averaged per component, as in mean_std.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The sorted group keys and their means, of
+        shape (groups,) plus the shape of one row. A group without valid rows has
+        a NaN mean.
+    """
+    keys, groups = np.unique(table[by], return_inverse=True)
+    rows = valid(values)
+
+    # One bincount per component of a subarray column
+    width = math.prod(np.shape(values)[1:])
+    components = values[rows].reshape(-1, width)
+    totals = np.stack(
+        [
+            np.bincount(groups[rows], weights=component, minlength=len(keys))
+            for component in components.T
+        ],
+        axis=1,
+    )
+    counts = np.bincount(groups[rows], minlength=len(keys))[:, np.newaxis]
+
+    means = np.full(totals.shape, math.nan)
+    np.divide(totals, counts, out=means, where=counts > 0)
+
+    return keys, means.reshape((len(keys),) + np.shape(values)[1:])
+
+
+def pivot(
+    table: np.ndarray, values: np.ndarray, rows: str = INDEX, columns: str = STEP
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Lay a column out as a 2-D array, like a spreadsheet pivot table.
+
+    A subarray column, like map_size, keeps its components as trailing axes.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The row keys, the column keys
+        and the array of values, of shape (rows, columns) plus the shape of one
+        row. Missing cells are NaN.
+    """
+    row_keys, row_positions = np.unique(table[rows], return_inverse=True)
+    column_keys, column_positions = np.unique(table[columns], return_inverse=True)
+
+    grid = np.full((len(row_keys), len(column_keys)) + np.shape(values)[1:], math.nan)
+    grid[row_positions, column_positions] = values
+
+    return row_keys, column_keys, grid
@@ -4,6 +4,9 @@ import random
 import json
 
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
@@ -11,6 +14,11 @@ if current_dir not in sys.path:
 
 import utility
 
+try:
+    from . import grid
+except ImportError:
+    import grid
+
 config = utility.load_config()
 
 tile_character = {
@@ -30,12 +38,14 @@ class Map:
         params (dict[str, str]): Parameters which describe map's features.
     """
 
-    def __init__(self, dict_map: dict = None) -> None:
+    def __init__(self, dict_map: dict = None, level: grid.Level = None) -> None:
         self.list_map = list()
         self.params = dict()
 
         if dict_map:
             self.from_dict(dict_map)
+        if level is not None:
+            self.from_level(level)
 
     def get_ascii_map(self) -> str:
         ascii_map = ""
@@ -55,6 +65,12 @@ class Map:
     def to_dict(self) -> dict[str, any]:
         return {"params": self.params, "map": self.get_ascii_map()}
 
+    def from_level(self, level: grid.Level):
+        self.list_map = level.to_list()
+
+    def to_level(self) -> grid.Level:
+        return grid.Level.from_list(self.list_map)
+
 
 def load_maps(path: str = config["paths"]["raw"]) -> list[Map]:
     """Load all maps from directory.
@@ -100,6 +116,96 @@ def save_maps(
         count += 1
 
 
+def place_all(
+    src: str = config["paths"]["raw"],
+    dst: str = config["paths"]["placed"],
+    workers: int = None,
+    seed: int = None,
+    batch_size: int = 100,
+    prefix: str = "batch",
+    group_min_dist: int = 10,
+    flag_try_count: int = 50,
+    enemy_sparsity: int = 3,
+) -> int:
+    """Assign parameters to every raw map, place objects and save the placed maps.
+
+    Maps are read and written one batch at a time, and at most two batches per
+    worker are in flight, so the corpus is never held in memory. Every map gets
+    its own random generator derived from seed and its position in src, so the
+    output does not depend on the number of workers.
+
+    Args:
+        src (str, optional): The directory of raw map files (or a BatchStore).
+        dst (str, optional): The directory the placed batches are written to.
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        seed (int, optional): The base seed. None is nondeterministic.
+        batch_size (int, optional): Maps per output file.
+        prefix (str, optional): Output files are named prefix0.json, prefix1.json, ...
+        group_min_dist (int, optional): See modify_map.
+        flag_try_count (int, optional): See modify_map.
+        enemy_sparsity (int, optional): See modify_map.
+
+    Returns:
+        int: The number of placed maps.
+    """
+    utility.create_directory(dst)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    entropy = np.random.SeedSequence(seed).entropy
+    options = (entropy, group_min_dist, flag_try_count, enemy_sparsity)
+
+    def batches():
+        batch = list()
+        start = 0
+        for map_dict in utility.iter_json_files(src):
+            batch.append(map_dict)
+            if len(batch) == batch_size:
+                yield start, batch, options
+                start += len(batch)
+                batch = list()
+        if batch:
+            yield start, batch, options
+
+    written = list()
+
+    def save(batch):
+        path = os.path.join(dst, f"{prefix}{len(written)}.json")
+        with open(path, "w") as file:
+            json.dump({"map_list": batch}, file, separators=(",", ":"))
+        written.append(len(batch))
+
+    if workers <= 1:
+        for args in batches():
+            save(_place_batch(args))
+        return sum(written)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for args in batches():
+            pending.append(executor.submit(_place_batch, args))
+            if len(pending) >= 2 * workers:
+                save(pending.popleft().result())
+        while pending:
+            save(pending.popleft().result())
+
+    return sum(written)
+
+
+def _place_batch(args: tuple) -> list[dict]:
+    start, batch, (entropy, group_min_dist, flag_try_count, enemy_sparsity) = args
+
+    placed = list()
+    for index, map_dict in enumerate(batch, start):
+        rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(index,)))
+        map = Map(map_dict)
+        assign_parameters(map)
+        modify_map(map, group_min_dist, flag_try_count, enemy_sparsity, rng)
+        placed.append(map.to_dict())
+
+    return placed
+
+
 def assign_parameters(
     map: Map,
     enemy_density=0.05,
@@ -159,7 +265,11 @@ def assign_parameters(
 
 
 def modify_map(
-    map: Map, group_min_dist: int, flag_try_count: int, enemy_sparsity: int
+    map: Map,
+    group_min_dist: int,
+    flag_try_count: int,
+    enemy_sparsity: int,
+    rng: np.random.Generator = None,
 ) -> None:
     """Modify map with its parameters.
 
@@ -168,25 +278,174 @@ def modify_map(
         group_min_dist (int): The minimum distance between enemy groups.
         flag_try_count (int): The number of trial to set enemy group flag.
         enemy_sparsity (int): Sparsity of enemies in a enemy group.
+        rng (np.random.Generator, optional): Random source. Defaults to a generator
+            seeded from the random module, so random.seed still applies.
     """
-    group_size_list = _calc_group_detail(map)
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+
+    group_size_list = _calc_group_detail(map, rng)
+
+    placement = PlacementGrid(map.list_map)
+    _set_player_and_boss(placement, map.params["boss"])
+    flags = _set_group_flag(
+        placement, len(group_size_list), group_min_dist, flag_try_count, rng
+    )
+    _set_enemy(placement, flags, group_size_list, enemy_sparsity, rng)
+    _set_treasure(placement, map.params["treasure"], rng)
 
-    _set_player_and_boss(map)
-    _set_group_flag(map, len(group_size_list), group_min_dist, flag_try_count)
-    _set_enemy(map, group_size_list, enemy_sparsity)
-    _set_treasure(map)
 
+class FreeCells:
+    """A set of cells with O(1) membership, removal and uniform sampling.
+
+    The cells are kept densely in a list, and removing one moves the last cell
+    into its slot.
+    """
 
-def _set_player_and_boss(map: Map) -> None:
-    for line in map.list_map:
-        for i in range(len(line)):
-            if line[i] == "<":
-                line[i] = tile_character["player"]
-            if line[i] == ">" and map.params["boss"]:
-                line[i] = tile_character["boss"]
+    def __init__(self, cells: list[int], size: int) -> None:
+        """
+        Args:
+            cells (list[int]): The initial cells, distinct integers below size.
+            size (int): Upper bound of the cell values.
+        """
+        self._cells = list(cells)
+        self._slots = [-1] * size
+        for slot, cell in enumerate(self._cells):
+            self._slots[cell] = slot
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def __contains__(self, cell: int) -> bool:
+        return self._slots[cell] >= 0
+
+    def sample(self, rng: np.random.Generator) -> int:
+        return self._cells[int(rng.random() * len(self._cells))]
+
+    def remove_all(self, cells) -> None:
+        """Remove every cell of cells that is in the set."""
+        members = self._cells
+        slots = self._slots
+        for cell in cells:
+            slot = slots[cell]
+            if slot < 0:
+                continue
+
+            last = members.pop()
+            if last != cell:
+                members[slot] = last
+                slots[last] = slot
+            slots[cell] = -1
+
+
+class PlacementGrid:
+    """The tiles of a Map flattened for placing objects, written through to the Map.
+
+    The tiles are padded with one non-floor tile on every side, so a cell (the
+    flat index of a tile) has the neighbours cell + width, cell - width, cell + 1
+    and cell - 1 without bounds checks.
 
+    Attributes:
+        list_map (list[list[str]]): The tiles of the Map, updated by place.
+        tiles (np.ndarray): The padded tile codes the grid was made from.
+        width (int): Width of the padded grid.
+        floor (bytearray): 1 for every "." tile not yet taken, indexed by cell.
+    """
 
-def _calc_group_detail(map: Map) -> tuple[int]:
+    def __init__(self, list_map: list[list[str]]) -> None:
+        self.list_map = list_map
+
+        tiles = grid.Level.from_list(list_map).tiles
+        self.tiles = np.zeros((tiles.shape[0] + 2, tiles.shape[1] + 2), dtype=np.uint8)
+        self.tiles[1:-1, 1:-1] = tiles
+
+        self.width = self.tiles.shape[1]
+        self.floor = bytearray((self.tiles == ord(".")).tobytes())
+        self._empty = bytes(self.floor)
+        self._steps = (self.width, -self.width, 1, -1)
+        self._zones = dict()
+
+    @property
+    def size(self) -> int:
+        return len(self.floor)
+
+    def cells_of(self, char: str) -> np.ndarray:
+        """Return the cells whose tile was char when the grid was made."""
+        return np.flatnonzero(self.tiles == ord(char))
+
+    def empty_cells(self) -> np.ndarray:
+        """Return the cells of the map's original "." tiles."""
+        return np.flatnonzero(np.frombuffer(self._empty, dtype=np.uint8))
+
+    def free_cells(self) -> np.ndarray:
+        """Return the cells of the "." tiles not taken yet."""
+        return np.flatnonzero(np.frombuffer(self.floor, dtype=np.uint8))
+
+    def exclusion_zone(self, cell: int, radius: int) -> list[int]:
+        """
+        Return the original "." tiles within radius steps of cell, walking over "." tiles.
+
+        Zones are memoized, so retries at the same radius reuse them.
+        """
+        key = (cell, radius)
+        if key in self._zones:
+            return self._zones[key]
+
+        # Tiles are cleared from a copy of the empty tiles once reached, and
+        # every ring of the search is appended to the zone.
+        unseen = bytearray(self._empty)
+        unseen[cell] = 0
+        zone = [cell]
+        start = 0
+        for _ in range(radius):
+            end = len(zone)
+            for now in zone[start:end]:
+                for step in self._steps:
+                    next = now + step
+                    if unseen[next]:
+                        unseen[next] = 0
+                        zone.append(next)
+            start = end
+
+        self._zones[key] = zone
+        return zone
+
+    def nearby_free_cells(self, cell: int, limit: int) -> list[int]:
+        """
+        Breadth-first search over free tiles from cell until more than limit are found.
+
+        All free neighbours of the last tile expanded are kept, so up to limit + 4
+        tiles may be returned.
+        """
+        found = [cell]
+        seen = {cell}
+        queue = deque(found)
+        while queue and len(found) <= limit:
+            now = queue.popleft()
+            for step in self._steps:
+                next = now + step
+                if self.floor[next] and next not in seen:
+                    seen.add(next)
+                    found.append(next)
+                    queue.append(next)
+
+        return found
+
+    def place(self, cells, char: str) -> None:
+        """Write char at every cell and take those tiles."""
+        for cell in cells:
+            row, col = divmod(int(cell), self.width)
+            self.list_map[row - 1][col - 1] = char
+            self.floor[cell] = 0
+
+
+def _set_player_and_boss(placement: PlacementGrid, boss: int) -> None:
+    placement.place(placement.cells_of("<"), tile_character["player"])
+    if boss:
+        placement.place(placement.cells_of(">"), tile_character["boss"])
+
+
+def _calc_group_detail(map: Map, rng: np.random.Generator) -> list[int]:
     group_min = map.params["enemy_group_min"]
     group_max = map.params["enemy_group_max"]
 
@@ -198,34 +457,51 @@ def _calc_group_detail(map: Map) -> tuple[int]:
     del map.params["enemy_ideal_min"]
     del map.params["enemy_ideal_max"]
 
+    # The first draw is taken as is when the ideal can not be reached, and the
+    # draw after try_max failures otherwise.
     try_max = 10000
-    try_count = 0
-    while True:
-        group_list = list()
-        group = random.randrange(group_min, group_max + 1)
-
-        for i in range(group):
-            group_list.append(random.randrange(group_size_min, group_size_max + 1))
-
-        if (
-            group_min * group_size_min > ideal_max
-            or group_max * group_size_max < ideal_min
-            or try_count >= try_max
-        ):
-            map.params["enemy_count"] = sum(group_list)
-            return group_list
-
-        if ideal_min <= sum(group_list) <= ideal_max:
-            map.params["enemy_count"] = sum(group_list)
-            return group_list
+    if group_min * group_size_min > ideal_max or group_max * group_size_max < ideal_min:
+        try_max = 0
 
-        try_count += 1
-
-
-def _set_group_flag(map: Map, group_count: int, min_dist: int, try_count: int) -> None:
+    # Draws are made in batches. Each row is a group count and the group sizes,
+    # of which only the first group count are used.
+    batch_size = 64
+    drawn = 0
+    while True:
+        count = min(batch_size, try_max + 1 - drawn)
+        groups = rng.integers(group_min, group_max + 1, size=count)
+        sizes = rng.integers(
+            group_size_min, group_size_max + 1, size=(count, group_max)
+        )
+        sizes[np.arange(group_max) >= groups[:, None]] = 0
+        totals = sizes.sum(axis=1)
+
+        hits = np.flatnonzero((ideal_min <= totals) & (totals <= ideal_max))
+        if len(hits):
+            pick = hits[0]
+        elif drawn + count > try_max:
+            pick = count - 1
+        else:
+            drawn += count
+            batch_size = min(batch_size * 4, 4096)
+            continue
+
+        group_list = sizes[pick, : groups[pick]].tolist()
+        map.params["enemy_count"] = sum(group_list)
+        return group_list
+
+
+def _set_group_flag(
+    placement: PlacementGrid,
+    group_count: int,
+    min_dist: int,
+    try_count: int,
+    rng: np.random.Generator,
+) -> list[int]:
     while min_dist >= 0:
-        if _try_set_group_flag(map, group_count, min_dist, try_count):
-            return
+        flags = _try_set_group_flag(placement, group_count, min_dist, try_count, rng)
+        if flags is not None:
+            return flags
         else:
             min_dist -= 1
 
@@ -233,109 +509,66 @@ def _set_group_flag(map: Map, group_count: int, min_dist: int, try_count: int) -
 
 
 def _try_set_group_flag(
-    map: Map, group_count: int, min_dist: int, try_count: int
-) -> bool:
-    empty_set = set()
-    for i in range(len(map.list_map)):
-        for j in range(len(map.list_map[i])):
-            if map.list_map[i][j] == ".":
-                empty_set.add((i, j))
+    placement: PlacementGrid,
+    group_count: int,
+    min_dist: int,
+    try_count: int,
+    rng: np.random.Generator,
+) -> list[int]:
+    """Pick group_count flag cells at least min_dist + 1 steps apart, or return None."""
+    empty_cells = placement.empty_cells().tolist()
 
     for _ in range(try_count):
-        ok = True
+        free = FreeCells(empty_cells, placement.size)
         flag_list = list()
 
         for _ in range(group_count):
-            if empty_set:
-                flag = random.choice(list(empty_set))
-                flag_list.append(flag)
-            else:
-                ok = False
+            if not free:
                 break
 
-            enemy_region = dict()
-            queue = deque()
-            enemy_region[flag] = 0
-            queue.append(flag)
-
-            while queue:
-                now = queue.popleft()
+            flag = free.sample(rng)
+            flag_list.append(flag)
+            free.remove_all(placement.exclusion_zone(flag, min_dist))
 
-                for direction in ((1, 0), (-1, 0), (0, 1), (0, -1)):
-                    next = (now[0] + direction[0], now[1] + direction[1])
+        if len(flag_list) == group_count:
+            return flag_list
 
-                    if (
-                        0 <= next[0] < len(map.list_map)
-                        and 0 <= next[1] < len(map.list_map[next[0]])
-                        and map.list_map[next[0]][next[1]] == "."
-                        and next not in enemy_region
-                        and enemy_region[now] + 1 <= min_dist
-                    ):
+    return None
 
-                        enemy_region[next] = enemy_region[now] + 1
-                        queue.append(next)
 
-            empty_set -= enemy_region.keys()
-
-        if ok:
-            for flag in flag_list:
-                map.list_map[flag[0]][flag[1]] = tile_character["flag"]
-            return True
-
-    return False
-
-
-def _set_enemy(map: Map, group_size_list: list[int], sparsity: int) -> None:
-    group_num = 0
-    for i in range(len(map.list_map)):
-        for j in range(len(map.list_map[i])):
-            if map.list_map[i][j] == tile_character["flag"]:
-                map.list_map[i][j] = "."
-                empty_list = list()
-
-                empty_list.append((i, j))
-
-                queue = deque()
-                queue.append((i, j))
-
-                while (
-                    queue and len(empty_list) <= group_size_list[group_num] * sparsity
-                ):
-                    now = queue.popleft()
-                    for direction in ((1, 0), (-1, 0), (0, 1), (0, -1)):
-                        next = (now[0] + direction[0], now[1] + direction[1])
-                        if (
-                            0 <= next[0] < len(map.list_map)
-                            and 0 <= next[1] < len(map.list_map[i])
-                            and map.list_map[next[0]][next[1]] == "."
-                            and next not in empty_list
-                        ):
-                            empty_list.append(next)
-                            queue.append(next)
+def _set_enemy(
+    placement: PlacementGrid,
+    flags: list[int],
+    group_size_list: list[int],
+    sparsity: int,
+    rng: np.random.Generator,
+) -> None:
+    # Groups are matched to flags in row-major order, and a flag blocks the
+    # search of earlier groups until its own group is placed.
+    flags = sorted(flags)
+    for flag in flags:
+        placement.floor[flag] = 0
 
-                enemy_list = random.sample(empty_list, group_size_list[group_num])
-                for enemy in enemy_list:
-                    map.list_map[enemy[0]][enemy[1]] = tile_character["enemy"]
+    for flag, group_size in zip(flags, group_size_list):
+        placement.floor[flag] = 1
+        candidates = placement.nearby_free_cells(flag, group_size * sparsity)
+        placement.place(_sample(rng, candidates, group_size), tile_character["enemy"])
 
-                group_num += 1
 
+def _set_treasure(
+    placement: PlacementGrid, treasure_count: int, rng: np.random.Generator
+) -> None:
+    treasures = _sample(rng, placement.free_cells(), treasure_count)
+    placement.place(treasures, tile_character["treasure"])
 
-def _set_treasure(map: Map) -> None:
-    empty_list = list()
-    for i in range(len(map.list_map)):
-        for j in range(len(map.list_map[i])):
-            if map.list_map[i][j] == ".":
-                empty_list.append((i, j))
 
-    treasure_list = random.sample(empty_list, map.params["treasure"])
+def _sample(rng: np.random.Generator, population, k: int) -> np.ndarray:
+    """Pick k distinct items uniformly at random, like random.sample."""
+    if not 0 <= k <= len(population):
+        raise ValueError("Sample larger than population or is negative")
 
-    for treasure in treasure_list:
-        map.list_map[treasure[0]][treasure[1]] = tile_character["treasure"]
+    return np.asarray(population)[rng.random(len(population)).argsort()[:k]]
 
 
 if __name__ == "__main__":
-    maps = load_maps()
-    for map in maps:
-        assign_parameters(map)
-        modify_map(map, 10, 50, 3)
-    save_maps(maps)
+    print(f"Placed {place_all()} maps.")
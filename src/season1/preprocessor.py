@@ -33,6 +33,11 @@ def has_two_or_more_hashes(line: str) -> bool:
     return result
 
 
+# A line naming the map that follows as the answer, like "Final map:".
+FINAL_CUE = re.compile(r"\bfinal\b", re.IGNORECASE)
+FENCE = "```"
+
+
 def _is_ascii_art_line(line: str) -> bool:
     """
     Determines if the given line likely represents an ASCII art line,
@@ -44,15 +49,122 @@ def _is_ascii_art_line(line: str) -> bool:
     Returns:
     bool: True if the line likely represents ASCII art, otherwise False.
     """
-    result = has_two_or_more_hashes(line) and not is_chapter_format(line)
+    return has_two_or_more_hashes(line) and not is_chapter_format(line)
+
+
+class MapExtractor:
+    """Finds the ASCII art map of a response while it is streamed in.
+
+    Text is fed in chunks of any size and every line is looked at once, as it
+    completes. The map is the last run of consecutive ASCII art lines, as
+    _extract_ascii_art_map finds it.
+
+    With early_stop, feeding stops as soon as the closing fence of a map arrives
+    whose opening fence directly follows a line announcing it as final, like
+    "Final map:" (blank lines in between are allowed). Step-by-step styles print
+    a map per step, and replies may echo the original map after mentioning the
+    final one, so only a map announced right before it is taken as the answer
+    before the response ends.
+
+    Attributes:
+        done (bool): True once the final map closed and no more text is needed.
+
+    Example:
+        >>> extractor = MapExtractor()
+        >>> extractor.feed("The final map needs two enemies.\\n\\nOriginal map:\\n")
+        False
+        >>> extractor.feed("```\\n#####\\n#...#\\n#####\\n```\\n")
+        False
+        >>> extractor.feed("Final map:\\n```\\n#####\\n#E.E#\\n#####\\n```\\nDone.")
+        True
+        >>> print(extractor.finish())
+        #####
+        #E.E#
+        #####
+    """
 
-    print(f"is_ascii_art_line - Line to check: '{line}' Result: {result}")
-    return result
+    def __init__(self, early_stop: bool = True) -> None:
+        self.early_stop = early_stop
+        self.done = False
+
+        self._partial = list()  # Pieces of the line not yet ended.
+        self._run = list()  # The art lines since the last non-art line.
+        self._map = list()  # The last finished run.
+        # Whether the last prose line announced a final map.
+        self._final = False
+        # Whether the open fence follows such a line, so its closing fence ends the map.
+        self._armed = False
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Add the next chunk of the response.
+
+        Returns:
+            bool: True if the final map is complete and the rest can be dropped.
+        """
+        if self.done:
+            return True
+
+        lines = chunk.split("\n")
+        self._partial.append(lines[0])
+        if len(lines) == 1:
+            return False
+
+        self._add_line("".join(self._partial))
+        for line in lines[1:-1]:
+            if self.done:
+                return True
+            self._add_line(line)
+        self._partial = [lines[-1]]
+
+        return self.done
+
+    def _add_line(self, line: str) -> None:
+        if _is_ascii_art_line(line):
+            self._run.append(line)
+            return
+
+        fence = line.strip().startswith(FENCE)
+        if self._run:
+            self._map = self._run
+            self._run = list()
+            if self.early_stop and self._armed and fence:
+                self.done = True
+                return
+            self._armed = False
+            self._final = False
+            if fence:
+                return
+
+        if fence:
+            self._armed = self._final
+            self._final = False
+        elif line.strip():
+            self._armed = False
+            self._final = bool(FINAL_CUE.search(line))
+
+    def finish(self) -> str:
+        """
+        End the response and return its map.
+
+        Returns:
+            str: The extracted ASCII art map, or an empty string if no map is found.
+        """
+        if not self.done:
+            self._add_line("".join(self._partial))
+            self._partial = list()
+            if self._run:
+                self._map = self._run
+                self._run = list()
+            self.done = True
+
+        return "\n".join(self._map)
 
 
 def _extract_ascii_art_map(text: str) -> str:
     """
-    Extracts the ASCII art map from the provided text by scanning from the bottom to the top.
+    Extracts the ASCII art map from the provided text: the last run of
+    consecutive ASCII art lines.
 
     Parameters:
     text (str): The input text from which to extract the ASCII art map.
@@ -60,43 +172,14 @@ def _extract_ascii_art_map(text: str) -> str:
     Returns:
     str: The extracted ASCII art map, or an empty string if no map is found.
     """
-    lines = text.split("\n")
-    print("Scanning the entire text from bottom.")
-
-    start_index = None
-    end_index = None
-
-    # Check all lines from the end to start
-    indices_to_check = reversed(range(len(lines)))
-
-    # Scan from bottom to top
-    for index in indices_to_check:
-        if start_index is not None:
-            break  # Stop if we've already found a valid map
-
-        current_map = []
-        for i in range(index, -1, -1):
-            if _is_ascii_art_line(lines[i]):
-                current_map.insert(0, lines[i])
-                if end_index is None:
-                    end_index = i
-                start_index = i
-            else:
-                if start_index is not None and end_index is not None:
-                    break
-
-        # If a valid map is found, set the start and end index
-        if start_index is not None and end_index is not None:
-            break
-
-    print(f"extract_ascii_art_map - Start index: {start_index}, End index: {end_index}")
-
-    if start_index is not None and end_index is not None:
-        ascii_art_map = "\n".join(lines[start_index : end_index + 1])
-        return ascii_art_map
-    else:
+    extractor = MapExtractor(early_stop=False)
+    extractor.feed(text)
+    ascii_art_map = extractor.finish()
+
+    if not ascii_art_map:
         print("Cannot find ASCII art.")
-        return ""
+
+    return ascii_art_map
 
 
 def preprocess(text: str) -> str:
@@ -0,0 +1,95 @@
+import os
+
+# Providers cache prompt prefixes of at least 1024 tokens, in steps of 128 tokens.
+# Tokens are estimated at ~4 characters, as async_llm.LLMClient reserves them.
+CHARS_PER_TOKEN = 4
+MIN_CACHED_PREFIX_TOKENS = 1024
+CACHED_PREFIX_STEP_TOKENS = 128
+
+
+def request_text(system_prompt: str, user_prompt: str) -> str:
+    """The prompt text of a request in the order the provider reads it."""
+    return system_prompt + "\n" + user_prompt
+
+
+def examples_key(example_list: list[dict]) -> tuple[str]:
+    """Identify a demo set by its maps."""
+    return tuple(example["map"] for example in example_list)
+
+
+def group_by_examples(example_lists: list[list[dict]]) -> list[int]:
+    """
+    Order requests so the ones sharing a demo set are sent one after another.
+
+    Groups keep the order of their first request, and requests keep their order
+    within a group.
+
+    Args:
+        example_lists (list[list[dict]]): The demo set of every request.
+
+    Returns:
+        list[int]: The request indices in sending order.
+    """
+    groups = dict()
+    for i, example_list in enumerate(example_lists):
+        groups.setdefault(examples_key(example_list), list()).append(i)
+
+    return [i for group in groups.values() for i in group]
+
+
+def order_by_prefix(system_prompts: list[str], user_prompts: list[str]) -> list[int]:
+    """Order requests so the ones with a common prompt prefix are adjacent."""
+    return sorted(
+        range(len(user_prompts)), key=lambda i: (system_prompts[i], user_prompts[i])
+    )
+
+
+def cacheable_prefix_tokens(prefix_chars: int) -> int:
+    """Estimated tokens of a shared prefix that a provider-side cache can reuse."""
+    tokens = prefix_chars // CHARS_PER_TOKEN
+    if tokens < MIN_CACHED_PREFIX_TOKENS:
+        return 0
+    return tokens - tokens % CACHED_PREFIX_STEP_TOKENS
+
+
+def prefix_stats(
+    system_prompts: list[str], user_prompts: list[str], order: list[int] = None
+) -> dict:
+    """
+    Estimate how much of a batch a prompt prefix cache can serve.
+
+    Each request is compared with the one sent before it and with the first one,
+    which covers both a prefix shared by a whole batch and one shared by a group.
+
+    Args:
+        system_prompts (list[str]): The system prompt of every request.
+        user_prompts (list[str]): The user prompt of every request.
+        order (list[int], optional): The sending order. Defaults to input order.
+
+    Returns:
+        dict: "requests", "input_tokens", "cached_tokens" (the estimated prefix
+        hits) and "prefix_hit_ratio" (cached_tokens / input_tokens).
+    """
+    if order is None:
+        order = range(len(user_prompts))
+    texts = [request_text(system_prompts[i], user_prompts[i]) for i in order]
+
+    input_tokens = 0
+    cached_tokens = 0
+    for i, text in enumerate(texts):
+        input_tokens += len(text) // CHARS_PER_TOKEN
+        if i == 0:
+            continue
+
+        prefix_chars = max(
+            len(os.path.commonprefix([texts[0], text])),
+            len(os.path.commonprefix([texts[i - 1], text])),
+        )
+        cached_tokens += cacheable_prefix_tokens(prefix_chars)
+
+    return {
+        "requests": len(texts),
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "prefix_hit_ratio": cached_tokens / input_tokens if input_tokens else 0.0,
+    }
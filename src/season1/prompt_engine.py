@@ -0,0 +1,185 @@
+import os
+import re
+from functools import lru_cache
+
+from .utility import load_config
+
+config = load_config()
+
+BASE_PROMPT_PATH = config["paths"]["base_prompt"]
+
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+# Distinct demo sets whose example sections are kept.
+EXAMPLES_CACHE_SIZE = 1024
+
+
+class Template:
+    """A prompt template compiled into literal parts and placeholder names.
+
+    "{Name}" marks a placeholder. The text is split once, so rendering only joins
+    the parts with the values. Placeholders without a value are kept as "{Name}",
+    as a chain of str.replace calls would leave them.
+
+    Attributes:
+        names (tuple[str]): The placeholders, in order of appearance.
+    """
+
+    def __init__(self, text: str = "") -> None:
+        parts = PLACEHOLDER.split(text)
+        self._literals = parts[0::2]
+        self.names = tuple(parts[1::2])
+
+    @classmethod
+    def compile(cls, template: "str | Template") -> "Template":
+        """Return template itself if it is already compiled."""
+        if isinstance(template, Template):
+            return template
+        return cls(template)
+
+    @classmethod
+    def _from_parts(cls, literals: list[str], names: list[str]) -> "Template":
+        template = cls()
+        template._literals = literals
+        template.names = tuple(names)
+        return template
+
+    def render(self, **values) -> str:
+        """
+        Fill the placeholders.
+
+        Args:
+            **values: Text per placeholder name. A Template value is rendered with
+                the same values first, so its own placeholders are filled too.
+
+        Returns:
+            str: The prompt.
+        """
+        literals = self._literals
+        pieces = [literals[0]]
+        for i, name in enumerate(self.names, 1):
+            value = values.get(name)
+            if value is None:
+                pieces.append("{" + name + "}")
+            elif isinstance(value, Template):
+                pieces.append(value.render(**values))
+            else:
+                pieces.append(value)
+            pieces.append(literals[i])
+
+        return "".join(pieces)
+
+    def partial(self, **values) -> "Template":
+        """
+        Fill some placeholders now and keep the others for render.
+
+        A Template value is spliced in with its placeholders kept open, so
+        templates can be nested and compiled once.
+
+        Returns:
+            Template: The partially filled template.
+        """
+        literals = [self._literals[0]]
+        names = list()
+        for i, name in enumerate(self.names, 1):
+            value = values.get(name)
+            if value is None:
+                names.append(name)
+                literals.append(self._literals[i])
+                continue
+
+            if isinstance(value, Template):
+                value = value.partial(**values)
+            else:
+                value = Template._from_parts([value], [])
+
+            literals[-1] += value._literals[0]
+            names.extend(value.names)
+            literals.extend(value._literals[1:])
+            literals[-1] += self._literals[i]
+
+        return Template._from_parts(literals, names)
+
+    def __str__(self) -> str:
+        return self.render()
+
+
+class PromptEngine:
+    """The templates of a base prompt directory, read and compiled once.
+
+    Every *.txt file is available under its name without the extension, for
+    example engine.template("ModificationPhaseTemplete").
+    """
+
+    def __init__(self, directory: str = BASE_PROMPT_PATH) -> None:
+        """
+        Args:
+            directory (str): The directory holding the *.txt templates.
+        """
+        self.directory = directory
+        self._texts = dict()
+        self._templates = dict()
+
+        if os.path.isdir(directory):
+            for filename in sorted(os.listdir(directory)):
+                name, extension = os.path.splitext(filename)
+                if extension == ".txt":
+                    with open(os.path.join(directory, filename), "r") as file:
+                        self._texts[name] = file.read()
+
+    def text(self, name: str) -> str:
+        """
+        The raw text of a template file.
+
+        Raises:
+            FileNotFoundError: Raised when the directory has no name.txt.
+        """
+        try:
+            return self._texts[name]
+        except KeyError:
+            raise FileNotFoundError(
+                f"No prompt template {name}.txt in {self.directory}"
+            ) from None
+
+    def template(self, name: str) -> Template:
+        """The compiled template of a file. See text."""
+        if name not in self._templates:
+            self._templates[name] = Template(self.text(name))
+        return self._templates[name]
+
+    def render(self, name: str, **values) -> str:
+        return self.template(name).render(**values)
+
+
+@lru_cache(maxsize=None)
+def get_engine(directory: str = BASE_PROMPT_PATH) -> PromptEngine:
+    """The shared PromptEngine of a directory, loaded on first use."""
+    return PromptEngine(directory)
+
+
+def format_examples(example_list: list[dict], used_paramname: list[str]) -> str:
+    """
+    The example section of a demo set, as recursion.generate_examples writes it.
+
+    Sections are memoized by the maps and the shown parameter values, so a demo
+    set reused across blocks and recursion steps is formatted only once.
+    """
+    key = tuple(
+        (data["map"], tuple(str(data["params"][param]) for param in used_paramname))
+        for data in example_list
+    )
+    return _format_examples(key, tuple(used_paramname))
+
+
+@lru_cache(maxsize=EXAMPLES_CACHE_SIZE)
+def _format_examples(key: tuple, used_paramname: tuple[str]) -> str:
+    examples = ["\n"]
+    for idx, (map, values) in enumerate(key):
+        examples.append("Example " + str(idx + 1) + ":\nMap:\n")
+        examples.append(map)
+        examples.append("Parameters:\n")
+        for param, value in zip(used_paramname, values):
+            examples.append("- " + param + ": " + value + "\n")
+        examples.append("\n")
+
+    return "".join(examples)
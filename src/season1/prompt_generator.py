@@ -1,4 +1,7 @@
 import textwrap
+from functools import lru_cache
+
+from .prompt_engine import get_engine
 from .utility import load_config
 
 config = load_config()
@@ -31,14 +34,14 @@ Generate a map with the following parameters.
 """
 
 
-def generate_prompt(example_prompt: str, params: dict, prompt_style: str) -> tuple:
-
-    base_prompt_file_path = BASE_PROMPT_PATH + f"{prompt_style}.txt"
+@lru_cache(maxsize=None)
+def _style_prompts(prompt_style: str) -> tuple[str, str]:
+    """The split start and end prompts of a prompt style, read once."""
+    return _split_prompts(get_engine(BASE_PROMPT_PATH).text(prompt_style))
 
-    with open(base_prompt_file_path, "r") as file:
-        content = file.read()
 
-    start_prompt, end_prompt = _split_prompts(content)
+def generate_prompt(example_prompt: str, params: dict, prompt_style: str) -> tuple:
+    start_prompt, end_prompt = _style_prompts(prompt_style)
 
     system = start_prompt + example_prompt
 
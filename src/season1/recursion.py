@@ -0,0 +1,348 @@
+import asyncio
+import json
+import os
+import sys
+
+from . import prompt_batch
+from . import prompt_engine
+from . import token_budget
+from . import utility
+from . import validater
+from .preprocessor import MapExtractor, preprocess
+
+DEFAULT_MAX_STEPS = 30
+
+# A modification reply holds the modified map, sometimes the original too, and
+# the reasoning about which changes reach the targets.
+MODIFICATION_MAP_COPIES = 2
+MODIFICATION_REASONING_TOKENS = 2048
+
+# Largest absolute difference between a label and its target that still counts as reached.
+DEFAULT_TOLERANCES = {
+    "map_size": 1.0,
+    "room_count": 0,
+    "enemy_count": 0,
+    "treasure_count": 0,
+    "exploration": 0.05,
+    "winding_path": 0.05,
+}
+
+MODIFICATION_SYSTEM_PROMPT = """
+You are an expert in analyzing and modifying ASCII dungeon maps based on given parameters. Your task is to modify an ASCII dungeon map to adjust several of its parameters. You will be provided with the current and target values for one or more parameters, along with a original map. Your goal is to transform the map to meet the target values for all provided parameters.
+"""
+
+
+def generate_examples(example_list: list[dict], used_paramname: list[str]) -> str:
+    return prompt_engine.format_examples(example_list, used_paramname)
+
+
+def generate_parameters_to_modify(
+    used_paramname: list[str], current_params: dict, target_params: dict
+) -> str:
+    text = "Current and Target Parameter values:\n"
+
+    for paramname in used_paramname:
+        text += "current " + paramname + ": " + str(current_params[paramname]) + "\n"
+        text += "target " + paramname + ": " + str(target_params[paramname]) + "\n"
+
+    return text
+
+
+def is_converged(
+    labels: dict,
+    target_params: dict,
+    used_paramname: list[str],
+    tolerances: dict = DEFAULT_TOLERANCES,
+) -> bool:
+    """
+    Check whether every used label is within tolerance of its target.
+
+    Args:
+        labels (dict): validater.get_label of the current map.
+        target_params (dict): The target parameter values.
+        used_paramname (list[str]): The parameters to compare.
+        tolerances (dict, optional): Allowed absolute difference per parameter.
+
+    Returns:
+        bool: False if any label is missing or "NaN".
+    """
+    for param in used_paramname:
+        value = labels.get(param)
+        if not isinstance(value, (int, float)):
+            return False
+        if abs(value - target_params[param]) > tolerances.get(param, 0):
+            return False
+
+    return True
+
+
+class RecursionJob:
+    """The recursive modification loop run as a resumable job.
+
+    Every block is refined independently: its map is labeled, and while the labels
+    are not within tolerance of target_params and fewer than max_steps
+    modifications were made, the LLM is asked to modify it again. Blocks do not
+    wait for each other between steps.
+
+    Each completed step is appended to a JSON Lines checkpoint, so an interrupted
+    job loses at most the requests in flight. Creating the job again with the
+    same checkpoint_path resumes from there.
+
+    Attributes:
+        blocks (list[dict]): Per-block state with target_params, examples, map,
+            labels, step and converged.
+        history (list[list[str]]): The map of every block after each step.
+        failures (int): Blocks that stopped on an error during the last run.
+    """
+
+    def __init__(
+        self,
+        checkpoint_path: str,
+        used_paramname: list[str],
+        modification_template: str | prompt_engine.Template,
+        data_blocks: list[dict] = None,
+        max_steps: int = DEFAULT_MAX_STEPS,
+        tolerances: dict = DEFAULT_TOLERANCES,
+        system_prompt: str = MODIFICATION_SYSTEM_PROMPT,
+        workers: int = None,
+        stream: bool = False,
+    ) -> None:
+        """
+        Args:
+            checkpoint_path (str): The JSON Lines checkpoint. Resumed if it exists.
+            used_paramname (list[str]): The parameters shown in the prompt and checked for convergence.
+            modification_template (str | prompt_engine.Template): The modification
+                prompt with {Examples}, {Map} and {ParametersToModify} left to fill.
+            data_blocks (list[dict], optional): The initial blocks with target_params,
+                map and examples. Only used when the checkpoint does not exist yet.
+            max_steps (int, optional): Most modifications made to a block.
+            tolerances (dict, optional): Allowed absolute difference per parameter.
+            system_prompt (str, optional): The system prompt of every modification request.
+            workers (int, optional): Worker processes used to label the initial maps.
+            stream (bool, optional): Stream the responses and stop each one once
+                its final map arrives. The client's generate must take until.
+        """
+        self.checkpoint_path = checkpoint_path
+        self.used_paramname = used_paramname
+        self.modification_template = prompt_engine.Template.compile(
+            modification_template
+        )
+        self.max_steps = max_steps
+        self.tolerances = tolerances
+        self.system_prompt = system_prompt
+        self.stream = stream
+
+        self.blocks = list()
+        self.history = list()
+        self.failures = 0
+
+        # validater.LabelState of each block's current map, so the next
+        # modification is relabeled incrementally. Blocks without one (the first
+        # step, or after a resume) are labeled from scratch.
+        self._label_states = dict()
+
+        if os.path.exists(checkpoint_path):
+            self._load()
+        elif data_blocks is not None:
+            self._start(data_blocks, workers)
+        else:
+            raise FileNotFoundError(
+                f"No checkpoint at {checkpoint_path} and no data blocks to start from."
+            )
+
+    def _start(self, data_blocks: list[dict], workers: int = None) -> None:
+        utility.create_directory(os.path.dirname(os.path.abspath(self.checkpoint_path)))
+
+        labels = validater.get_labels(
+            [data_block["map"] for data_block in data_blocks], workers
+        )
+        records = list()
+        for i, (data_block, label) in enumerate(zip(data_blocks, labels)):
+            block = {
+                "target_params": data_block["target_params"],
+                "examples": data_block["examples"],
+                "map": data_block["map"],
+                "labels": label,
+                "step": 0,
+                "converged": self._is_converged(label, data_block["target_params"]),
+            }
+            self.blocks.append(block)
+            self.history.append([block["map"]])
+            records.append({"index": i, **block})
+
+        # Write to a temporary file first, so a half-written start is never resumed.
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _load(self) -> None:
+        with open(self.checkpoint_path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut off by a crash.
+                    continue
+
+                index = record.pop("index")
+                if index == len(self.blocks):
+                    self.blocks.append(record)
+                    self.history.append([record["map"]])
+                    continue
+
+                block = self.blocks[index]
+                block.update(record)
+                del self.history[index][block["step"] :]
+                self.history[index].append(block["map"])
+
+    def _append(self, index: int) -> None:
+        block = self.blocks[index]
+        record = {
+            "index": index,
+            "map": block["map"],
+            "labels": block["labels"],
+            "step": block["step"],
+            "converged": block["converged"],
+        }
+        with open(self.checkpoint_path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+    def _is_converged(self, labels: dict, target_params: dict) -> bool:
+        return is_converged(labels, target_params, self.used_paramname, self.tolerances)
+
+    def is_done(self, index: int) -> bool:
+        block = self.blocks[index]
+        return block["converged"] or block["step"] >= self.max_steps
+
+    @property
+    def finished(self) -> bool:
+        return all(self.is_done(i) for i in range(len(self.blocks)))
+
+    def build_prompt(self, index: int) -> str:
+        block = self.blocks[index]
+        return self.modification_template.render(
+            Examples=generate_examples(block["examples"], self.used_paramname),
+            Map=block["map"],
+            ParametersToModify=generate_parameters_to_modify(
+                self.used_paramname, block["labels"], block["target_params"]
+            ),
+        )
+
+    def max_tokens(self, index: int) -> int:
+        """The completion limit of the next request of a block, sized by its map and target."""
+        block = self.blocks[index]
+        return token_budget.max_tokens_for(
+            block["map"],
+            block["target_params"],
+            map_copies=MODIFICATION_MAP_COPIES,
+            reasoning_tokens=MODIFICATION_REASONING_TOKENS,
+        )
+
+    def sample_index(self, index: int) -> int:
+        """
+        The response cache sample of the next request of a block.
+
+        Identical blocks keep their own cached responses. The step is included,
+        because a step that leaves the map unchanged repeats the same prompt, which
+        must be sent again rather than answered with the reply it just got.
+        """
+        return index * (self.max_steps + 1) + self.blocks[index]["step"]
+
+    async def _refine(self, client, index: int) -> None:
+        block = self.blocks[index]
+        while not self.is_done(index):
+            prompt = self.build_prompt(index)
+            options = {
+                "max_tokens": self.max_tokens(index),
+                "sample_index": self.sample_index(index),
+            }
+            if self.stream:
+                extractor = MapExtractor()
+                await client.generate(
+                    self.system_prompt, prompt, until=extractor.feed, **options
+                )
+                block["map"] = extractor.finish()
+            else:
+                output = await client.generate(self.system_prompt, prompt, **options)
+                block["map"] = preprocess(output)
+            block["labels"], self._label_states[index] = (
+                validater.get_label_incremental(
+                    block["map"], self._label_states.get(index)
+                )
+            )
+            block["step"] += 1
+            block["converged"] = self._is_converged(
+                block["labels"], block["target_params"]
+            )
+            self.history[index].append(block["map"])
+            self._append(index)
+
+    async def run(self, client) -> bool:
+        """
+        Refine every unfinished block until it converges or reaches max_steps.
+
+        A block whose request fails keeps its last checkpointed state, and the
+        other blocks carry on. Running the job again retries it.
+
+        Args:
+            client: An async_llm.LLMClient, or anything with an async
+                generate(system_prompt, user_prompt, max_tokens=None,
+                sample_index=None, until=None) returning the response text.
+
+        Returns:
+            bool: True if every block is finished.
+        """
+        self.failures = 0
+
+        async def refine(index):
+            try:
+                await self._refine(client, index)
+            except Exception as e:
+                self.failures += 1
+                print(f"Error occurs in block {index}: {e}", file=sys.stderr)
+
+        # Blocks sharing a demo set share their prompt prefix, so they are sent
+        # together for the provider's prompt cache.
+        order = prompt_batch.group_by_examples(
+            [block["examples"] for block in self.blocks]
+        )
+        await asyncio.gather(*(refine(i) for i in order if not self.is_done(i)))
+
+        return self.finished
+
+    def blocks_at(self, step: int) -> list[dict]:
+        """
+        Return the data blocks as they were after step modifications.
+
+        Blocks that stopped earlier keep their last map.
+        """
+        return [
+            {
+                "target_params": block["target_params"],
+                "map": history[min(step, len(history) - 1)],
+                "examples": block["examples"],
+            }
+            for block, history in zip(self.blocks, self.history)
+        ]
+
+    def prefix_stats(self) -> dict:
+        """prompt_batch.prefix_stats of the next request of every unfinished block."""
+        order = [
+            i
+            for i in prompt_batch.group_by_examples(
+                [block["examples"] for block in self.blocks]
+            )
+            if not self.is_done(i)
+        ]
+        prompts = [self.build_prompt(i) for i in order]
+        return prompt_batch.prefix_stats([self.system_prompt] * len(prompts), prompts)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "blocks": len(self.blocks),
+            "converged": sum(block["converged"] for block in self.blocks),
+            "finished": sum(self.is_done(i) for i in range(len(self.blocks))),
+            "requests": sum(block["step"] for block in self.blocks),
+        }
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from . import utility
+
+config = utility.load_config()
+
+CACHE_PATH = config["paths"]["cache"]
+
+# Look up first and only send the misses, storing their responses.
+READ_THROUGH = "read_through"
+# Always send, and store the response over any cached one.
+WRITE_THROUGH = "write_through"
+# Never send: answer from the cache and fail on a miss.
+REPLAY = "replay"
+MODES = (READ_THROUGH, WRITE_THROUGH, REPLAY)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ResponseCache:
+    """A persistent cache of LLM responses keyed by the hash of the request.
+
+    Responses are stored in a SQLite file. The key covers the model, the messages,
+    the sampling parameters and a sample index (see make_key), so asking again for
+    the same sample of the same request costs no API call.
+
+    When the stored responses exceed max_bytes, the least recently used ones are
+    evicted.
+
+    Attributes:
+        path (str): The SQLite file.
+        mode (str): READ_THROUGH, WRITE_THROUGH or REPLAY.
+        max_bytes (int): Most bytes of responses kept.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that had to be sent.
+        evictions (int): Responses evicted so far.
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join(CACHE_PATH, "responses.sqlite"),
+        mode: str = READ_THROUGH,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(
+                f"Unknown response cache mode {mode!r}, expected one of {MODES}"
+            )
+
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._connection = None
+        self._pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection must not cross a fork, so worker processes open their own.
+        if self._connection is None or self._pid != os.getpid():
+            utility.create_directory(os.path.dirname(self.path))
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed REAL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+            )
+            self._pid = os.getpid()
+
+        return self._connection
+
+    def get(self, key: str) -> tuple[bool, str]:
+        """
+        Return (found, response) for key, following the mode.
+
+        WRITE_THROUGH never finds anything, so the request is always sent.
+
+        Raises:
+            LookupError: Raised in REPLAY mode when key is not cached.
+        """
+        if self.mode == WRITE_THROUGH:
+            self.misses += 1
+            return False, None
+
+        connection = self._connect()
+        row = connection.execute(
+            "SELECT value FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            if self.mode == REPLAY:
+                raise LookupError(f"No cached response for {key} in replay mode")
+            return False, None
+
+        with connection:
+            connection.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+        self.hits += 1
+        return True, row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Store a response, then evict the least recently used ones over max_bytes."""
+        size = len(value.encode("utf-8"))
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        total = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = list()
+        for key, size in connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+
+        connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def clear(self) -> None:
+        """Remove every response from the SQLite file."""
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM responses")
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+_default_cache = None
+_default_disabled = False
+
+
+def get_default_cache() -> ResponseCache:
+    """Return the shared cache, creating it on first use. None if disabled."""
+    global _default_cache
+
+    if _default_disabled:
+        return None
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+
+    return _default_cache
+
+
+def set_default_cache(cache: ResponseCache) -> None:
+    """Replace the shared cache. Passing None turns caching off."""
+    global _default_cache, _default_disabled
+
+    _default_cache = cache
+    _default_disabled = cache is None
+
+
+def make_key(
+    model: str, messages: list[dict], params: dict = None, sample_index: int = None
+) -> str:
+    """
+    Hash a chat request.
+
+    Args:
+        model (str): The model name.
+        messages (list[dict]): The chat messages.
+        params (dict, optional): The sampling parameters, like max_tokens and
+            temperature.
+        sample_index (int, optional): Which sample of an identical request this is,
+            so repeated requests meant to give different outputs are kept apart.
+            None is the same as 0.
+
+    Returns:
+        str: The key.
+    """
+    request = {
+        "model": model,
+        "messages": messages,
+        "params": params or dict(),
+        "sample_index": sample_index or 0,
+    }
+    text = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def payload_key(payload: dict, sample_index: int = None) -> str:
+    """make_key of an OpenAI chat completion payload."""
+    params = {
+        name: value
+        for name, value in payload.items()
+        if name not in ("model", "messages")
+    }
+    return make_key(payload["model"], payload["messages"], params, sample_index)
+
+
+def sample_indices(system_prompts: list[str], user_prompts: list[str]) -> list[int]:
+    """Number the repeats of identical prompt pairs in a batch: 0, 1, 2, ..."""
+    counts = dict()
+    indices = list()
+    for pair in zip(system_prompts, user_prompts):
+        indices.append(counts.get(pair, 0))
+        counts[pair] = indices[-1] + 1
+
+    return indices
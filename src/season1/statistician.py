@@ -1,13 +1,27 @@
 import random
 import os
+import pickle
+import hashlib
+from functools import lru_cache
 
 import numpy as np
 import matplotlib.pyplot as plt
 
+from . import metrics
 from . import utility
 
 config = utility.load_config()
 COMPARED_PATH = config["paths"]["compared"]
+CACHE_PATH = config["paths"]["cache"]
+
+DEFAULT_GRAPH_CACHE_DIR = os.path.join(CACHE_PATH, "diversity")
+# Bump when a change alters which pairs are connected.
+GRAPH_CACHE_VERSION = 2
+# Most map sets whose graphs are kept. The least recently used ones are removed.
+GRAPH_CACHE_MAX_FILES = 512
+KEYS_SUFFIX = ".keys.npy"
+# Most new maps whose rows go to a worker at once.
+GRAPH_BLOCK_SIZE = 64
 
 default_diff_param_name_list = [
     "map_size",
@@ -33,8 +47,8 @@ def calc_abs_diff_mean_std(
     Returns:
         tuple[dict]: A tuple containing dictionaries of means and standard deviations for the absolute differences.
     """
-    compared_list = utility.load_json_files(path)
-    return _calc_abs_diff_mean_std_from_list(compared_list, param_name_list)
+    table = metrics.build_table(utility.iter_json_files(path), param_name_list)
+    return _calc_abs_diff_mean_std_from_table(table, param_name_list)
 
 
 def calc_after_mean_std(
@@ -51,8 +65,8 @@ def calc_after_mean_std(
     Returns:
         tuple[dict]: A tuple containing dictionaries of means and standard deviations for the parameters.
     """
-    compared_list = utility.load_json_files(path)
-    return _calc_after_mean_std_from_list(compared_list, param_name_list)
+    table = metrics.build_table(utility.iter_json_files(path), param_name_list)
+    return _calc_after_mean_std_from_table(table, param_name_list)
 
 
 def _calc_abs_diff_mean_std_from_list(
@@ -69,18 +83,22 @@ def _calc_abs_diff_mean_std_from_list(
     Returns:
         tuple[dict]: A tuple containing two dictionaries, one for the means and one for the standard deviations of the absolute differences.
     """
-    diff_dict = _calc_abs_diff(compared_list, param_name_list)
+    table = metrics.build_table(compared_list, param_name_list)
+    return _calc_abs_diff_mean_std_from_table(table, param_name_list)
+
 
+def _calc_abs_diff_mean_std_from_table(
+    table: np.ndarray,
+    param_name_list: list[str],
+) -> tuple[dict]:
+    """_calc_abs_diff_mean_std_from_list over a metrics.build_table table."""
     mean_dict = dict()
     std_dict = dict()
 
     for param_name in param_name_list:
-        try:
-            mean_dict[param_name] = np.mean(np.array(diff_dict[param_name]), axis=0)
-            std_dict[param_name] = np.std(np.array(diff_dict[param_name]), axis=0)
-        except:
-            mean_dict[param_name] = np.mean(diff_dict[param_name])
-            std_dict[param_name] = np.std(diff_dict[param_name])
+        mean_dict[param_name], std_dict[param_name] = metrics.mean_std(
+            metrics.abs_diff(table, param_name)
+        )
 
     return mean_dict, std_dict
 
@@ -98,18 +116,21 @@ def _calc_after_mean_std_from_list(
     Returns:
         tuple[dict]: A tuple containing two dictionaries, one for the mean and one for the standard deviation of each parameter.
     """
+    table = metrics.build_table(compared_list, param_name_list)
+    return _calc_after_mean_std_from_table(table, param_name_list)
+
+
+def _calc_after_mean_std_from_table(
+    table: np.ndarray, param_name_list: list[str]
+) -> tuple[dict]:
+    """_calc_after_mean_std_from_list over a metrics.build_table table."""
     mean_dict = dict()
     std_dict = dict()
 
     for param_name in param_name_list:
-        value_list = [
-            compared["after_params"][param_name]
-            for compared in compared_list
-            if compared["after_params"][param_name] is not None
-        ]
-
-        mean_dict[param_name] = np.mean(value_list)
-        std_dict[param_name] = np.std(value_list)
+        mean_dict[param_name], std_dict[param_name] = metrics.mean_std(
+            table[metrics.column("after", param_name)]
+        )
 
     return mean_dict, std_dict
 
@@ -129,36 +150,59 @@ def _calc_abs_diff(
         dict: A dictionary where each key is a parameter name and each value is a list of absolute differences.
 
     Note:
-        Handles both list and single numeric parameter differences.
+        Handles both list and single numeric parameter differences. Records where
+        either side is not a number are left out.
     """
+    table = metrics.build_table(compared_list, param_name_list)
+
     diff_dict = dict()
     for param_name in param_name_list:
-        diff_dict[param_name] = list()
-
-    for compared in compared_list:
-        for param_name in param_name_list:
-            if compared["after_params"][param_name] is not None:
-                try:
-                    diff_dict[param_name].append(
-                        [
-                            abs(
-                                float(compared["after_params"][param_name][i])
-                                - float(compared["before_params"][param_name][i])
-                            )
-                            for i in range(len(compared["after_params"][param_name]))
-                        ]
-                    )
-                except:
-                    diff_dict[param_name].append(
-                        abs(
-                            float(compared["after_params"][param_name])
-                            - float(compared["before_params"][param_name])
-                        )
-                    )
+        diff = metrics.abs_diff(table, param_name)
+        diff_dict[param_name] = diff[metrics.valid(diff)].tolist()
 
     return diff_dict
 
 
+def calc_controllability(
+    table: np.ndarray, param_name_list: list[str], by: str = metrics.STEP
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+    Calculate the controllability, 1 - |before - after| / max(before, after), per group.
+
+    Args:
+        table (np.ndarray): A metrics.build_table table.
+        param_name_list (list[str]): The parameters to score.
+        by (str, optional): The field to group by. Defaults to the recursion step.
+
+    Returns:
+        dict[str, tuple[np.ndarray, np.ndarray]]: Per parameter, the group keys and
+        the mean controllability of each group, per component for list parameters
+        such as map_size.
+    """
+    return {
+        param_name: metrics.group_mean(
+            table, metrics.controllability(table, param_name), by
+        )
+        for param_name in param_name_list
+    }
+
+
+def calc_playability(
+    table: np.ndarray, by: str = metrics.STEP
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the share of playable maps per group from the "after_playability" column.
+
+    Args:
+        table (np.ndarray): A metrics.build_table table holding "playability".
+        by (str, optional): The field to group by. Defaults to the recursion step.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The group keys and their playability.
+    """
+    return metrics.group_mean(table, table[metrics.column("after", "playability")], by)
+
+
 def calc_novelty(path: str = COMPARED_PATH, threshold: int = 5) -> float:
     """
     Calculate the novelty score for items stored in JSON files at the specified path.
@@ -222,58 +266,164 @@ def check_novelty(examples: list[str], target: str, threshold: int) -> bool:
 
 
 def _check_enough_levenshtein_distance(A: str, B: str, threshold: int) -> bool:
+    """
+    Check whether the Levenshtein distance between A and B is at least threshold.
+
+    Cheap lower bounds (length difference, character histograms) settle most pairs
+    without running the edit distance, which stops as soon as the outcome is known.
+    """
+    if threshold <= 0:
+        return True
     if not A or not B:
         return max(len(A), len(B)) >= threshold
 
-    len_A = len(A)
-    len_B = len(B)
+    if abs(len(A) - len(B)) >= threshold:
+        return True
+    if _histogram_lower_bound(A, B) >= threshold:
+        return True
+
+    return _levenshtein_distance(A, B, threshold) >= threshold
+
+
+@lru_cache(maxsize=4096)
+def _char_histogram(text: str) -> dict[str, int]:
+    histogram = dict()
+    for char in text:
+        histogram[char] = histogram.get(char, 0) + 1
+
+    return histogram
+
 
-    dp = [[0] * (len_B + 1) for _ in range(len_A + 1)]
+def _histogram_lower_bound(A: str, B: str) -> int:
+    """
+    A lower bound of the Levenshtein distance from character counts.
+
+    An edit removes at most one surplus character of A and supplies at most one
+    missing character of B, so the distance is at least the larger of the two totals.
+    """
+    histogram_A = _char_histogram(A)
+    histogram_B = _char_histogram(B)
+
+    surplus = 0
+    missing = 0
+    for char in histogram_A.keys() | histogram_B.keys():
+        difference = histogram_A.get(char, 0) - histogram_B.get(char, 0)
+        if difference > 0:
+            surplus += difference
+        else:
+            missing -= difference
+
+    return max(surplus, missing)
 
-    for i in range(len_A + 1):
-        dp[i][0] = i
 
-    for j in range(len_B + 1):
-        dp[0][j] = j
+@lru_cache(maxsize=4096)
+def _pattern_bitmasks(pattern: str) -> dict[str, int]:
+    bitmasks = dict()
+    for i, char in enumerate(pattern):
+        bitmasks[char] = bitmasks.get(char, 0) | (1 << i)
 
-    for i in range(1, len_A + 1):
-        for j in range(1, len_B + 1):
-            if A[i - 1] == B[j - 1]:
-                cost = 0
-            else:
-                cost = 1
+    return bitmasks
 
-            value = min(dp[i - 1][j] + 1, dp[i][j - 1] + 1, dp[i - 1][j - 1] + cost)
-            dp[i][j] = value
 
-            if value >= threshold:
-                return True
+def _levenshtein_distance(A: str, B: str, threshold: int = None) -> int:
+    """
+    Levenshtein distance with Myers' bit-parallel algorithm (Hyyrö's formulation).
 
-    return False
+    Each column of the DP table is kept as bit vectors of vertical +1/-1 deltas
+    in one Python int, so a map of ~750 characters costs one pass over the
+    shorter string with a handful of big-int operations per character.
 
+    Args:
+        A (str): The first string.
+        B (str): The second string.
+        threshold (int, optional): If given, stop as soon as the distance is known
+            to be at least threshold, or known to stay below it.
 
-def calc_diversity(path: str = COMPARED_PATH, threshold: int = 5) -> float:
+    Returns:
+        int: The distance. With threshold, a value on the same side of threshold
+             as the distance.
+    """
+    # The longer string is the bit pattern, the shorter one is scanned.
+    if len(A) < len(B):
+        A, B = B, A
+    if not B:
+        return len(A)
+
+    bitmasks = _pattern_bitmasks(A)
+    mask = (1 << len(A)) - 1
+    last_bit = 1 << (len(A) - 1)
+
+    positive_vertical = mask
+    negative_vertical = 0
+    score = len(A)
+    remaining = len(B)
+
+    for char in B:
+        equal = bitmasks.get(char, 0)
+        x_vertical = equal | negative_vertical
+        x_horizontal = (
+            ((equal & positive_vertical) + positive_vertical) ^ positive_vertical
+        ) | equal
+        positive_horizontal = negative_vertical | ~(x_horizontal | positive_vertical)
+        negative_horizontal = positive_vertical & x_horizontal
+
+        if positive_horizontal & last_bit:
+            score += 1
+        elif negative_horizontal & last_bit:
+            score -= 1
+
+        remaining -= 1
+        if threshold is not None:
+            # Each remaining column changes the score by at most one.
+            if score - remaining >= threshold or score + remaining < threshold:
+                return score
+
+        positive_horizontal = (positive_horizontal << 1) | 1
+        negative_horizontal = negative_horizontal << 1
+        positive_vertical = (
+            negative_horizontal | ~(x_vertical | positive_horizontal)
+        ) & mask
+        negative_vertical = positive_horizontal & x_vertical & mask
+
+    return score
+
+
+def calc_diversity(
+    path: str = COMPARED_PATH,
+    threshold: int = 5,
+    workers: int = None,
+    cache_dir: str = DEFAULT_GRAPH_CACHE_DIR,
+) -> float:
     """
     Calculate the diversity score from JSON files at the specified path.
 
     Args:
         path (str): The file path to the JSON files containing the data. Defaults to COMPARED_PATH.
         threshold (int): The minimum Levenshtein distance required to create an edge between items. Defaults to 5.
+        workers (int, optional): Number of worker processes for the pairwise distances. Defaults to the CPU count.
+        cache_dir (str, optional): Where pairwise results are cached. None disables the cache.
 
     Returns:
         float: The diversity score, calculated as the ratio of the largest clique size to the total number of items.
     """
     compared_list = utility.load_json_files(path)
-    return _calc_diversity_from_list(compared_list, threshold)
+    return _calc_diversity_from_list(compared_list, threshold, workers, cache_dir)
 
 
-def _calc_diversity_from_list(compared_list: list[dict], threshold: int) -> float:
+def _calc_diversity_from_list(
+    compared_list: list[dict],
+    threshold: int,
+    workers: int = None,
+    cache_dir: str = DEFAULT_GRAPH_CACHE_DIR,
+) -> float:
     """
     Calculate the diversity of a list of items based on the size of the largest clique found.
 
     Args:
         compared_list (list[dict]): A list of dictionaries, each containing a "map" key with a string to compare.
         threshold (int): The minimum Levenshtein distance required to create an edge between two items.
+        workers (int, optional): Number of worker processes for the pairwise distances. Defaults to the CPU count.
+        cache_dir (str, optional): Where pairwise results are cached. None disables the cache.
 
     Returns:
         float: The diversity score, calculated as the ratio of the largest clique size to the total number of items.
@@ -281,128 +431,390 @@ def _calc_diversity_from_list(compared_list: list[dict], threshold: int) -> floa
     map_list = [compared["map"] for compared in compared_list]
 
     print("Now Making Graph")
-    edges = _make_graph_from_map_list(map_list, threshold)
+    edges = _make_graph_from_map_list(map_list, threshold, workers, cache_dir)
 
-    U = set(range(len(edges)))
+    U = (1 << len(edges)) - 1
 
     clique_list = list()
 
     print("Now Finding Cliques")
     while U:
-        vertex = random.choice(list(U))
+        vertex = random.choice(_bits_to_list(U))
         clique = _greedy_find_clique(edges, vertex)
 
         clique_list.append(clique)
-        U.difference_update(clique)
+        U &= ~clique
 
     print("Now Merging Cliques")
     merged_clique_list = _merge_cliques(edges, clique_list)
 
-    max_clique_len = max(len(clique) for clique in merged_clique_list)
+    max_clique_len = max(clique.bit_count() for clique in merged_clique_list)
 
     return max_clique_len / len(edges)
 
 
-def _make_graph_from_map_list(map_list: list[str], threshold: int) -> list[list[int]]:
+def _make_graph_from_map_list(
+    map_list: list[str],
+    threshold: int,
+    workers: int = None,
+    cache_dir: str = None,
+) -> list[int]:
     """
-    Create an adjacency list graph from a list of strings based on Levenshtein distance.
+    Create an adjacency bitset graph from a list of strings based on Levenshtein distance.
+
+    The graph of the distinct maps is cached per map set (see _graph_cache_path),
+    so a list seen before with the same threshold is not compared again. Otherwise
+    the cached graph sharing the most maps is reused (see _load_graph_subset), and
+    only the rows of the other maps are computed, split into blocks across a
+    process pool. Only pairs within map_list are ever computed.
 
     Args:
         map_list (list[str]): A list of strings to be compared.
         threshold (int): The minimum Levenshtein distance required to create an edge between two strings.
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        cache_dir (str, optional): The pairwise cache directory. None disables the cache.
 
     Returns:
-        list[list[int]]: An adjacency list representing the graph, where each index contains a list of indices of connected nodes.
+        list[int]: Bit j of edges[i] is set if node i is connected to node j.
     """
-    n = len(map_list)
-    edges = [list() for _ in range(n)]
+    maps = sorted(set(map_list))
+    position = {level: i for i, level in enumerate(maps)}
+    digests = [hashlib.sha256(level.encode("utf-8")).digest() for level in maps]
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = _graph_cache_path(cache_dir, threshold, digests)
+
+    cached_maps, matrix = _load_graph_cache(cache_path, threshold)
+    if cached_maps != maps:
+        known_maps, known_matrix = _load_graph_subset(
+            cache_dir, threshold, position, digests
+        )
+        known = set(known_maps)
+        new_maps = [level for level in maps if level not in known]
+
+        print(f"- {len(new_maps)} new maps, {len(known_maps)} cached maps")
+        matrix = _extend_graph_matrix(
+            known_maps, known_matrix, new_maps, threshold, workers
+        )
+
+        # Put the rows back in the order of maps.
+        order = {level: i for i, level in enumerate(known_maps + new_maps)}
+        indices = [order[level] for level in maps]
+        matrix = matrix[np.ix_(indices, indices)]
+        _save_graph_cache(cache_path, threshold, maps, matrix, digests)
+
+    indices = np.array([position[level] for level in map_list], dtype=np.int64)
+    adjacency = np.packbits(matrix[np.ix_(indices, indices)], axis=1, bitorder="little")
+
+    return [int.from_bytes(row.tobytes(), "little") for row in adjacency]
+
+
+def _extend_graph_matrix(
+    known_maps: list[str],
+    matrix: np.ndarray,
+    new_maps: list[str],
+    threshold: int,
+    workers: int = None,
+) -> np.ndarray:
+    """Add the rows and columns of new_maps to the symmetric adjacency matrix."""
+    maps = known_maps + new_maps
+    size = len(maps)
+
+    extended = np.zeros((size, size), dtype=bool)
+    extended[: len(known_maps), : len(known_maps)] = matrix
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    block_size = max(1, min(GRAPH_BLOCK_SIZE, -(-len(new_maps) // (workers * 4))))
+    blocks = [
+        (start, min(start + block_size, size))
+        for start in range(len(known_maps), size, block_size)
+    ]
+
+    rows_list = utility.parallel_map(
+        _graph_rows,
+        blocks,
+        workers,
+        chunksize=1,
+        initializer=_init_graph_worker,
+        initargs=(maps, threshold),
+    )
+    for (start, stop), rows in zip(blocks, rows_list):
+        extended[start:stop, :stop] = rows[:, :stop]
+
+    # Rows were computed against the earlier maps only, so mirror them.
+    lower = np.tril(extended, -1)
+    return lower | lower.T
+
+
+_graph_maps = None
+_graph_lengths = None
+_graph_histograms = None
+_graph_threshold = None
+
+
+def _init_graph_worker(maps: list[str], threshold: int) -> None:
+    """Hand the maps and their length and character histograms to a worker once."""
+    global _graph_maps, _graph_lengths, _graph_histograms, _graph_threshold
+
+    alphabet = sorted(set().union(*(_char_histogram(level) for level in maps)))
+    char_index = {char: i for i, char in enumerate(alphabet)}
+
+    histograms = np.zeros((len(maps), len(alphabet)), dtype=np.int32)
+    for i, level in enumerate(maps):
+        for char, count in _char_histogram(level).items():
+            histograms[i, char_index[char]] = count
+
+    _graph_maps = maps
+    _graph_lengths = np.array([len(level) for level in maps], dtype=np.int32)
+    _graph_histograms = histograms
+    _graph_threshold = threshold
+
+
+def _graph_rows(block: tuple[int, int]) -> np.ndarray:
+    """
+    Compare maps start..stop-1 with every earlier map.
+
+    The length and histogram lower bounds are evaluated for a whole row at once,
+    and only the pairs they cannot settle run the edit distance.
+
+    Returns:
+        np.ndarray: Row i - start holds the edges of map i to maps 0..i-1.
+    """
+    start, stop = block
+    rows = np.zeros((stop - start, stop), dtype=bool)
+
+    for i in range(start, stop):
+        difference = _graph_histograms[:i] - _graph_histograms[i]
+        lower_bound = np.maximum(
+            np.clip(difference, 0, None).sum(axis=1),
+            np.clip(-difference, 0, None).sum(axis=1),
+        )
+        lower_bound = np.maximum(
+            lower_bound, np.abs(_graph_lengths[:i] - _graph_lengths[i])
+        )
+
+        row = lower_bound >= _graph_threshold
+        for j in np.flatnonzero(~row):
+            row[j] = (
+                _levenshtein_distance(_graph_maps[i], _graph_maps[j], _graph_threshold)
+                >= _graph_threshold
+            )
+        rows[i - start, :i] = row
+
+    return rows
+
+
+def _graph_cache_path(cache_dir: str, threshold: int, digests: list[bytes]) -> str:
+    """The cache file of a set of distinct maps, named by the hash of their hashes."""
+    digest = hashlib.sha256(b"".join(digests)).hexdigest()
+    return os.path.join(cache_dir, f"graph_{threshold}_{digest}.pkl")
+
 
-    for i in range(n - 1):
-        print(f"- Now {i}")
-        for j in range(i + 1, n):
-            if _check_enough_levenshtein_distance(map_list[i], map_list[j], threshold):
-                edges[i].append(j)
-                edges[j].append(i)
+def _map_keys(digests: list[bytes]) -> np.ndarray:
+    """Short keys of the map hashes, to find cached graphs sharing maps cheaply."""
+    return np.frombuffer(b"".join(digest[:8] for digest in digests), dtype=np.uint64)
 
-    return edges
+
+def _load_graph_subset(
+    cache_dir: str, threshold: int, position: dict, digests: list[bytes]
+) -> tuple[list[str], np.ndarray]:
+    """
+    Load the pairs among the maps of position from the cached graph sharing the most of them.
+
+    Only the key files are read to pick the graph, so the cost does not depend on
+    the size of the cached matrices.
+
+    Returns:
+        tuple[list[str], np.ndarray]: The shared maps and their adjacency matrix.
+        No maps and an empty matrix if no cached graph shares any.
+    """
+    empty = (list(), np.zeros((0, 0), dtype=bool))
+    if cache_dir is None or not os.path.isdir(cache_dir):
+        return empty
+
+    keys = _map_keys(digests)
+    best_path = None
+    best_count = 0
+    prefix = f"graph_{threshold}_"
+    for filename in os.listdir(cache_dir):
+        if not (filename.startswith(prefix) and filename.endswith(KEYS_SUFFIX)):
+            continue
+        count = np.isin(np.load(os.path.join(cache_dir, filename)), keys).sum()
+        if count > best_count:
+            best_path = os.path.join(cache_dir, filename[: -len(KEYS_SUFFIX)] + ".pkl")
+            best_count = count
+
+    cached_maps, matrix = _load_graph_cache(best_path, threshold)
+    # Key collisions are harmless, since the maps themselves are compared here.
+    shared = [i for i, level in enumerate(cached_maps) if level in position]
+    if not shared:
+        return empty
+
+    return [cached_maps[i] for i in shared], matrix[np.ix_(shared, shared)]
+
+
+def _load_graph_cache(cache_path: str, threshold: int) -> tuple[list[str], np.ndarray]:
+    """
+    Load the distinct maps of a map set and the adjacency matrix of their pairs.
+
+    Returns:
+        tuple[list[str], np.ndarray]: No maps and an empty matrix if the cache is
+        disabled, missing or was written for another threshold or version.
+    """
+    empty = (list(), np.zeros((0, 0), dtype=bool))
+    if cache_path is None or not os.path.exists(cache_path):
+        return empty
+
+    with open(cache_path, "rb") as file:
+        cache = pickle.load(file)
+    # Touch the file, so pruning removes the least recently used map sets.
+    os.utime(cache_path)
+
+    if cache["version"] != GRAPH_CACHE_VERSION or cache["threshold"] != threshold:
+        return empty
+
+    size = len(cache["maps"])
+    matrix = np.unpackbits(cache["matrix"], axis=1, count=size, bitorder="little")
+    return cache["maps"], matrix.astype(bool)
+
+
+def _save_graph_cache(
+    cache_path: str,
+    threshold: int,
+    maps: list[str],
+    matrix: np.ndarray,
+    digests: list[bytes],
+) -> None:
+    if cache_path is None:
+        return
+
+    utility.create_directory(os.path.dirname(cache_path))
+    with open(cache_path[: -len(".pkl")] + KEYS_SUFFIX, "wb") as file:
+        np.save(file, _map_keys(digests))
+
+    cache = {
+        "version": GRAPH_CACHE_VERSION,
+        "threshold": threshold,
+        "maps": maps,
+        "matrix": np.packbits(matrix, axis=1, bitorder="little"),
+    }
+
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "wb") as file:
+        pickle.dump(cache, file)
+    os.replace(temp_path, cache_path)
+
+    _prune_graph_cache(os.path.dirname(cache_path))
+
+
+def _prune_graph_cache(cache_dir: str, max_files: int = GRAPH_CACHE_MAX_FILES) -> None:
+    """Remove the least recently used graphs beyond max_files."""
+    paths = [
+        os.path.join(cache_dir, filename)
+        for filename in os.listdir(cache_dir)
+        if filename.startswith("graph_") and filename.endswith(".pkl")
+    ]
+    if len(paths) <= max_files:
+        return
+
+    paths.sort(key=os.path.getmtime)
+    for path in paths[: len(paths) - max_files]:
+        os.remove(path)
+        keys_path = path[: -len(".pkl")] + KEYS_SUFFIX
+        if os.path.exists(keys_path):
+            os.remove(keys_path)
 
 
-def _greedy_find_clique(edges: list[list[int]], start_vertex) -> set[int]:
+def _bits_to_list(bits: int) -> list[int]:
+    """Indices of the set bits, in ascending order."""
+    indices = list()
+    while bits:
+        lowest = bits & -bits
+        indices.append(lowest.bit_length() - 1)
+        bits ^= lowest
+
+    return indices
+
+
+def _greedy_find_clique(edges: list[int], start_vertex) -> int:
     """
     Find a maximal clique in a graph using a greedy algorithm starting from a given vertex.
 
     Args:
-        edges (list[list[int]]): The adjacency list representing the graph, where edges[i] contains a list of nodes connected to node i.
+        edges (list[int]): The adjacency bitsets representing the graph, where bit j of edges[i] is set if node i is connected to node j.
         start_vertex (int): The vertex to start the clique search from.
 
     Returns:
-        set[int]: A set of vertices that form a maximal clique including the start_vertex.
+        int: A bitset of vertices that form a maximal clique including the start_vertex.
     """
-    clique = {start_vertex}
+    clique = 1 << start_vertex
 
-    candidates = set(edges[start_vertex])
+    # Candidates are the common neighbours of the whole clique.
+    candidates = edges[start_vertex]
 
     while candidates:
-        for vertex in candidates:
-            if all(vertex in edges[v] for v in clique):
-                clique.add(vertex)
-                candidates.intersection_update(edges[vertex])
-                break
-        else:
-            break
+        vertex = (candidates & -candidates).bit_length() - 1
+        clique |= 1 << vertex
+        candidates &= edges[vertex]
 
     return clique
 
 
-def _merge_cliques(
-    edges: list[list[int]], clique_list: list[set[int]]
-) -> list[set[int]]:
+def _merge_cliques(edges: list[int], clique_list: list[int]) -> list[int]:
     """
     Merges cliques in a graph if the merged clique remains fully connected.
 
     Args:
-        edges (list[list[int]]): The adjacency list representing the graph, where edges[i] contains a list of nodes connected to node i.
-        clique_list (list[set[int]]): A list of cliques, where each clique is a set of nodes.
+        edges (list[int]): The adjacency bitsets representing the graph, where bit j of edges[i] is set if node i is connected to node j.
+        clique_list (list[int]): A list of disjoint cliques, where each clique is a bitset of nodes.
 
     Returns:
-        list[set[int]]: A list of merged cliques that are fully connected.
+        list[int]: A list of merged cliques that are fully connected.
     """
     merged_clique_list = list()
+    # The common neighbours of every merged clique. Two disjoint cliques form a
+    # clique together exactly when one lies within the other's common neighbours.
+    common_list = list()
 
-    while clique_list:
-        clique = clique_list.pop(0)
-        merged = False
+    for clique in clique_list:
+        common = _common_neighbours(edges, clique)
 
         for i in range(len(merged_clique_list)):
-            potential_clique = merged_clique_list[i] | clique
-
-            if _check_fully_connected(edges, potential_clique):
-                merged_clique_list[i] = potential_clique
-                merged = True
+            if clique & ~common_list[i] == 0:
+                merged_clique_list[i] |= clique
+                common_list[i] &= common
                 break
-
-        if not merged:
+        else:
             merged_clique_list.append(clique)
+            common_list.append(common)
 
     return merged_clique_list
 
 
-def _check_fully_connected(edges: list[list[int]], clique: set[int]) -> bool:
+def _common_neighbours(edges: list[int], clique: int) -> int:
+    common = -1
+    for vertex in _bits_to_list(clique):
+        common &= edges[vertex]
+
+    return common
+
+
+def _check_fully_connected(edges: list[int], clique: int) -> bool:
     """
     Checks if all nodes in the given clique are fully connected in the graph.
 
     Args:
-        edges (list[list[int]]): The adjacency list representing the graph, where edges[i] contains a list of nodes connected to node i.
-        clique (set[int]): A set of nodes that form the clique to check for full connectivity.
+        edges (list[int]): The adjacency bitsets representing the graph, where bit j of edges[i] is set if node i is connected to node j.
+        clique (int): A bitset of nodes that form the clique to check for full connectivity.
 
     Returns:
         bool: True if the clique is fully connected, False otherwise.
     """
-    clique = list(clique)
-    for i in range(len(clique)):
-        for j in range(i + 1, len(clique)):
-            if clique[j] not in edges[clique[i]]:
-                return False
+    for vertex in _bits_to_list(clique):
+        if clique & ~(edges[vertex] | (1 << vertex)):
+            return False
 
     return True
 
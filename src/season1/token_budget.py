@@ -0,0 +1,222 @@
+import math
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from . import prompt_batch
+
+DEFAULT_MODEL = "gpt-4o-mini"
+# The largest completion gpt-4o-mini returns, sent when nothing better is known.
+DEFAULT_MAX_TOKENS = 16384
+
+# Chat formatting adds a few tokens per message and to prime the reply.
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+# ASCII maps tokenize far worse than prose: runs of walls and floor merge, but
+# objects and doors split them. Two characters per token is a safe upper estimate.
+MAP_CHARS_PER_TOKEN = 2
+# Maps printed in a reply (one per step for the step-by-step prompts) and the
+# explanation tokens around them.
+DEFAULT_MAP_COPIES = 6
+DEFAULT_REASONING_TOKENS = 1024
+# Headroom on top of the estimate, since a cut-off reply loses the final map.
+DEFAULT_MARGIN = 1.25
+MIN_MAX_TOKENS = 512
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """
+    Count the tokens of text offline.
+
+    Uses the model's tiktoken encoding if the tiktoken package is installed, and
+    otherwise estimates ~4 characters per token as prompt_batch does.
+    """
+    if tiktoken is None:
+        return -(-len(text) // prompt_batch.CHARS_PER_TOKEN)
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def count_message_tokens(
+    system_prompt: str, user_prompt: str, model: str = DEFAULT_MODEL
+) -> int:
+    """The input tokens of a chat request with one system and one user message."""
+    return (
+        count_tokens(system_prompt, model)
+        + count_tokens(user_prompt, model)
+        + 2 * TOKENS_PER_MESSAGE
+        + TOKENS_PER_REPLY
+    )
+
+
+def max_tokens_for_map(
+    height: int,
+    width: int,
+    map_copies: int = DEFAULT_MAP_COPIES,
+    reasoning_tokens: int = DEFAULT_REASONING_TOKENS,
+    margin: float = DEFAULT_MARGIN,
+) -> int:
+    """
+    Size max_tokens for a reply holding maps of the given dimensions.
+
+    Args:
+        height (int): Rows of the expected map.
+        width (int): Columns of the expected map.
+        map_copies (int, optional): Maps printed in the reply.
+        reasoning_tokens (int, optional): Tokens of explanation around the maps.
+        margin (float, optional): Factor of headroom on top of the estimate.
+
+    Returns:
+        int: max_tokens, between MIN_MAX_TOKENS and DEFAULT_MAX_TOKENS.
+    """
+    map_tokens = math.ceil(height * (width + 1) / MAP_CHARS_PER_TOKEN)
+    estimate = math.ceil((map_copies * map_tokens + reasoning_tokens) * margin)
+
+    return max(MIN_MAX_TOKENS, min(estimate, DEFAULT_MAX_TOKENS))
+
+
+def map_dimensions(level: str = None, params: dict = None) -> tuple[int, int]:
+    """
+    The largest map a reply is expected to hold.
+
+    Args:
+        level (str, optional): A map the reply is based on, like the map to modify.
+        params (dict, optional): Target parameters. map_size may be one side or
+            [height, width].
+
+    Returns:
+        tuple[int, int]: Height and width, the larger of both sources. None if
+        neither gives a size.
+    """
+    sizes = list()
+    if level:
+        rows = level.rstrip("\n").split("\n")
+        sizes.append((len(rows), max(len(row) for row in rows)))
+
+    map_size = (params or dict()).get("map_size")
+    if isinstance(map_size, (list, tuple)) and len(map_size) == 2:
+        sizes.append((math.ceil(map_size[0]), math.ceil(map_size[1])))
+    elif isinstance(map_size, (int, float)) and not isinstance(map_size, bool):
+        sizes.append((math.ceil(map_size), math.ceil(map_size)))
+
+    if not sizes:
+        return None
+    return max(height for height, _ in sizes), max(width for _, width in sizes)
+
+
+def max_tokens_for(level: str = None, params: dict = None, **options) -> int:
+    """
+    Size max_tokens for the maps expected from level and params.
+
+    See map_dimensions and max_tokens_for_map. DEFAULT_MAX_TOKENS if neither gives
+    a size.
+    """
+    dimensions = map_dimensions(level, params)
+    if dimensions is None:
+        return DEFAULT_MAX_TOKENS
+
+    return max_tokens_for_map(*dimensions, **options)
+
+
+class TokenAccountant:
+    """Input and reserved output tokens of the prompts of a batch.
+
+    Attributes:
+        model (str): The model whose tokenizer is used.
+        input_tokens (list[int]): Input tokens of every added prompt.
+        max_tokens (list[int]): max_tokens of every added prompt.
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL) -> None:
+        self.model = model
+        self.input_tokens = list()
+        self.max_tokens = list()
+
+    def add(
+        self, system_prompt: str, user_prompt: str, max_tokens: int = DEFAULT_MAX_TOKENS
+    ) -> int:
+        """Count a prompt and return its input tokens."""
+        tokens = count_message_tokens(system_prompt, user_prompt, self.model)
+        self.input_tokens.append(tokens)
+        self.max_tokens.append(max_tokens)
+        return tokens
+
+    def costs(self) -> list[int]:
+        """The most tokens every prompt can be billed: input plus max_tokens."""
+        return [
+            input_tokens + max_tokens
+            for input_tokens, max_tokens in zip(self.input_tokens, self.max_tokens)
+        ]
+
+    def pack(self, tokens_per_minute: int, requests_per_minute: int = None) -> list:
+        """pack_batches over the costs of the added prompts."""
+        return pack_batches(self.costs(), tokens_per_minute, requests_per_minute)
+
+    def report(self, tokens_per_minute: int = None) -> dict:
+        """
+        Summarize the batch.
+
+        Returns:
+            dict: "prompts", "input_tokens" (total), "mean_input_tokens",
+            "max_input_tokens", "reserved_tokens" (input plus max_tokens), and with
+            tokens_per_minute, "minutes", the batches pack_batches makes of it.
+        """
+        count = len(self.input_tokens)
+        report = {
+            "prompts": count,
+            "input_tokens": sum(self.input_tokens),
+            "mean_input_tokens": sum(self.input_tokens) / count if count else 0.0,
+            "max_input_tokens": max(self.input_tokens, default=0),
+            "reserved_tokens": sum(self.costs()),
+        }
+        if tokens_per_minute is not None:
+            report["minutes"] = len(self.pack(tokens_per_minute))
+
+        return report
+
+
+def pack_batches(
+    costs: list[int], tokens_per_minute: int, requests_per_minute: int = None
+) -> list[list[int]]:
+    """
+    Split requests into consecutive batches that each fit one minute of quota.
+
+    A request costing more than tokens_per_minute gets a batch of its own.
+
+    Args:
+        costs (list[int]): The token cost of every request, in sending order.
+        tokens_per_minute (int): The token quota per minute.
+        requests_per_minute (int, optional): The request quota per minute.
+
+    Returns:
+        list[list[int]]: The request indices of every batch.
+    """
+    batches = list()
+    batch = list()
+    total = 0
+    for i, cost in enumerate(costs):
+        full = total + cost > tokens_per_minute or (
+            requests_per_minute is not None and len(batch) >= requests_per_minute
+        )
+        if batch and full:
+            batches.append(batch)
+            batch = list()
+            total = 0
+        batch.append(i)
+        total += cost
+
+    if batch:
+        batches.append(batch)
+
+    return batches
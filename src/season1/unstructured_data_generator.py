@@ -3,8 +3,39 @@ import os
 from openai import OpenAI
 from dotenv import load_dotenv
 
+from . import response_cache
+from . import token_budget
 
-def unstructured_data_generate(system: str, param: str) -> str:
+
+def unstructured_data_generate(
+    system: str,
+    param: str,
+    max_tokens: int = token_budget.DEFAULT_MAX_TOKENS,
+    sample_index: int = None,
+) -> str:
+    messages = [
+        {
+            "role": "system",
+            "content": f"{system}",
+        },
+        {
+            "role": "user",
+            "content": f"{param}",
+        },
+    ]
+
+    # Answer requests seen before from the shared response cache.
+    cache = response_cache.get_default_cache()
+    if cache is not None:
+        key = response_cache.make_key(
+            token_budget.DEFAULT_MODEL,
+            messages,
+            {"max_tokens": max_tokens},
+            sample_index,
+        )
+        found, content = cache.get(key)
+        if found:
+            return content
 
     load_dotenv()
     _api_key = os.getenv("OPENAI_API_KEY")
@@ -14,18 +45,13 @@ def unstructured_data_generate(system: str, param: str) -> str:
     client = OpenAI()
 
     completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {
-                "role": "system",
-                "content": f"{system}",
-            },
-            {
-                "role": "user",
-                "content": f"{param}",
-            },
-        ],
-        max_tokens=16384,
+        model=token_budget.DEFAULT_MODEL,
+        messages=messages,
+        max_tokens=max_tokens,
     )
+    content = completion.choices[0].message.content
+
+    if cache is not None:
+        cache.put(key, content)
 
-    return completion.choices[0].message.content
+    return content
@@ -2,10 +2,17 @@ import os
 import json
 import logging
 import glob
+import math
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 
 import yaml
 
+try:
+    from . import batch_store
+except ImportError:
+    import batch_store
+
 
 def load_json_files(path: str, type: str = "map_list") -> list[dict]:
     """Load all json data from directory.
@@ -17,11 +24,32 @@ def load_json_files(path: str, type: str = "map_list") -> list[dict]:
     Returns:
         list[dict]: The list of contents
 
+    Raises:
+        FileNotFoundError: Raised when the path is not vaild."""
+    return list(iter_json_files(path, type))
+
+
+def iter_json_files(path: str, type: str = "map_list"):
+    """Streaming load_json_files. Only one file (or store chunk) is held in memory.
+
+    A directory holding a batch_store.BatchStore yields its records instead.
+
+    Args:
+        path (str): The path of directory which has files.
+        type (str): The list to read from each file.
+
+    Yields:
+        dict: The contents, in the same order as load_json_files.
+
     Raises:
         FileNotFoundError: Raised when the path is not vaild."""
     if not os.path.exists(path):
         raise FileNotFoundError(f"The specified directory does not exist: {path}")
 
+    if batch_store.is_store(path):
+        yield from batch_store.BatchStore(path)
+        return
+
     filename_list = [
         filename
         for filename in os.listdir(path)
@@ -29,14 +57,10 @@ def load_json_files(path: str, type: str = "map_list") -> list[dict]:
     ]
     path_list = [os.path.join(path, filename) for filename in filename_list]
 
-    content_list = list()
     for file_path in path_list:
         with open(file_path, "r") as file:
             batch = json.load(file)
-            for content in batch[type]:
-                content_list.append(content)
-
-    return content_list
+        yield from batch[type]
 
 
 def load_yaml_file(path: str) -> dict:
@@ -82,6 +106,60 @@ def load_config() -> dict:
     return config
 
 
+def parallel_map(
+    func,
+    items: list,
+    workers: int = None,
+    chunksize: int = None,
+    initializer=None,
+    initargs: tuple = (),
+    executor: ProcessPoolExecutor = None,
+) -> list:
+    """
+    Apply func to every item across a process pool and return the results in input order.
+
+    Args:
+        func: A picklable (module-level) function of one argument.
+        items (list): The inputs.
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+            With 1 or fewer, the items are processed serially in this process.
+        chunksize (int, optional): Items sent to a worker at once. Defaults to about
+            four chunks per worker, which keeps the IPC overhead small.
+        initializer (optional): Called with initargs once in every worker (or in this
+            process when serial), e.g. to hand over large shared inputs only once.
+        initargs (tuple, optional): The arguments of initializer.
+        executor (ProcessPoolExecutor, optional): A running pool to use instead of
+            starting one, e.g. across many calls. initializer is not applied to it.
+
+    Returns:
+        list: func(item) for every item.
+    """
+    items = list(items)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if executor is not None:
+        if not items:
+            return list()
+        if chunksize is None:
+            chunksize = max(1, math.ceil(len(items) / (workers * 4)))
+        return list(executor.map(func, items, chunksize=chunksize))
+
+    if workers <= 1 or len(items) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [func(item) for item in items]
+
+    workers = min(workers, len(items))
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(items) / (workers * 4)))
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as executor:
+        return list(executor.map(func, items, chunksize=chunksize))
+
+
 def setup_logging(log_path: str) -> None:
     """Set up logging to record the process in a log file."""
     logging.basicConfig(filename=log_path, level=logging.INFO)
@@ -138,102 +216,27 @@ def write_json_file(file_path: str, data: dict) -> None:
         json.dump(data, outfile)
 
 
-def sort_files_by_size(files: list) -> list:
-    """Sort files by their size, from smallest to largest."""
-    return sorted(files, key=lambda x: os.path.getsize(x))
-
-
-def find_available_dataset(files_sorted_by_size: list) -> tuple:
-    """Find the first dataset with less than 100 entries."""
-    for file_path in files_sorted_by_size:
-        dataset = read_json_file(file_path)
-        if len(dataset.get("map_list", [])) < 100:
-            batch_number = int(file_path.split("batch")[-1].split(".json")[0])
-            print(
-                f"Loading file: {file_path} with size: {os.path.getsize(file_path)} bytes and batch number: {batch_number}"
-            )
-            print(
-                f"Loading dataset: {len(dataset['map_list'])} data exist in the dataset."
-            )
-            return file_path, batch_number, dataset
-    return None, None, None
-
-
-def create_new_dataset(path: str, batch_number: int) -> tuple:
-    """Create a new batch file and initialize it with an empty dataset."""
-    new_file = f"{path}batch{batch_number}.json"
-    dataset = {"map_list": []}  # Initialize empty dataset for the new file
-    write_json_file(new_file, dataset)
-    print(f"Created new dataset file: {new_file} with batch number: {batch_number}")
-    return new_file, batch_number, dataset
-
-
-def save_dataset_to_file(dataset: dict, file_path: str) -> None:
-    """Save the dataset to the specified JSON file."""
-    with open(file_path, "w") as outfile:
-        json.dump(dataset, outfile)
-    print(f"Successfully saved {file_path}")
-
-
-def get_largest_batch_file(path: str, file_pattern: str = "batch*.json") -> tuple:
-    """
-    Find the batch file with the largest number in its name.
-
-    Args:
-        path (str): Directory path to search for files.
-        file_pattern (str): The pattern to search for files. Defaults to 'batch*.json'.
-
-    Returns:
-        tuple: (largest_batch_file, batch_number), or (None, None) if no files found.
-    """
-    # Find all batch files in the directory
-    existing_files = find_existing_files(path, file_pattern)
-
-    if not existing_files:
-        return None, None
-
-    # Find the batch file with the largest number
-    max_batch_file = max(
-        existing_files, key=lambda x: int(x.split("batch")[-1].split(".json")[0])
-    )
-    batch_number = int(max_batch_file.split("batch")[-1].split(".json")[0])
-
-    return max_batch_file, batch_number
-
-
 def find_or_create_dataset(
     path: str,
-    file_pattern: str = "batch*.json",
-    max_entries: int = 100,
-    create_new: bool = False,
-) -> tuple:
+    max_entries: int = batch_store.DEFAULT_BATCH_SIZE,
+    compression: str = None,
+) -> batch_store.BatchStore:
     """
-    Find the dataset with the largest batch number and check if it can accept more entries.
-    If no file matches the criteria or if create_new is True, a new file is created.
+    Open the dataset store in path, creating it if it does not exist.
 
     Args:
-        path (str): Directory path to search for files.
-        file_pattern (str): The pattern to search for files. Defaults to 'batch*.json'.
-        max_entries (int): The maximum number of entries allowed in a file before creating a new one. Defaults to 100.
-        create_new (bool): If True, a new dataset file is created regardless of existing files. Defaults to False.
+        path (str): The store directory.
+        max_entries (int): The number of entries per batch. Defaults to 100.
+        compression (str): None or "zstd". Only used when the store is created.
 
     Returns:
-        tuple: (current_file, batch_number, dataset)
+        batch_store.BatchStore: The store. Appends go to the end of the last batch.
     """
-    # Use the new helper function to find the largest batch file
-    max_batch_file, batch_number = get_largest_batch_file(path, file_pattern)
-
-    if max_batch_file and not create_new:
-        # Load the dataset from the largest batch file
-        dataset = read_json_file(max_batch_file)
-
-        # Check if the dataset can accept more entries
-        if len(dataset.get("map_list", [])) < max_entries:
-            return max_batch_file, batch_number, dataset
-
-    # If no valid file found or create_new is True, create a new one
-    new_batch_number = batch_number + 1 if max_batch_file else 0
-    return create_new_dataset(path, new_batch_number)
+    dataset = batch_store.BatchStore(path, max_entries, compression)
+    print(
+        f"Opened dataset {path} with {len(dataset)} data in {dataset.batch_count} batches."
+    )
+    return dataset
 
 
 def load_list_from_files(directory_path: str, type: str) -> list:
@@ -246,13 +249,9 @@ def load_list_from_files(directory_path: str, type: str) -> list:
     Returns:
         list: A list containing all 'map_list' elements from all files.
     """
-    # Load all JSON files in the directory
-    json_files = load_json_files(directory_path, type)
-
-    # Create a combined list for all map_list elements
-    combined_list = []
+    return list(iter_list_from_files(directory_path, type))
 
-    for content in json_files:
-        combined_list.append(content)  # Add each map_list item to the combined list
 
-    return combined_list
+def iter_list_from_files(directory_path: str, type: str):
+    """Streaming load_list_from_files. Yields the elements one at a time."""
+    yield from iter_json_files(directory_path, type)
@@ -1,6 +1,14 @@
 import os
 import math
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
 
+import numpy as np
+
+from . import components
+from . import distance
+from . import grid
+from . import label_cache
 from . import labeler
 
 param_names = ("playability", "other_ASCII_count", "empty_validation")
@@ -10,64 +18,104 @@ param_names = ("playability", "other_ASCII_count", "empty_validation")
 # 1. Game level validation
 # =====================
 def validate(
-    level: str,
+    level: str | grid.Level,
     difficulty_curve_interval: int = labeler.DEFAULT_DIFFICULTY_CURVE_INTERVAL,
 ) -> dict[str, float]:
     """
     Validate the given level by calculating "treasure_count", "enemy_count", "map_size", "room_count","playability", "other_ASCII_count", "empty_validation"
 
     Args:
-        level (str): The level represented as a string.
+        level (str | grid.Level): The level represented as a string or a grid.Level.
         difficulty_curve_interval (int, optional): Interval used for calculating the difficulty curve. Defaults to labeler.DEFAULT_DIFFICULTY_CURVE_INTERVAL.
 
     Returns:
         dict[str, float]: Dictionary of calculated parameters such as playability, exploration requirements, and other level metrics.
     """
-    # Convert string level to list level and standardize it
-    list_level = _prepare_level(level)
-    if list_level is None:
+    return label_cache.cached(
+        "validate",
+        _validate,
+        level,
+        difficulty_curve_interval=difficulty_curve_interval,
+    )
+
+
+def _validate(
+    level: str | grid.Level,
+    difficulty_curve_interval: int = labeler.DEFAULT_DIFFICULTY_CURVE_INTERVAL,
+) -> dict[str, float]:
+    # Convert string level to a standardized grid level
+    grid_level = _prepare_level(level)
+    if grid_level is None:
         output_parameters = _set_none_parameters()
         return output_parameters
 
-    # Count parameters
-    counts = labeler._set_count_dict(list_level)
+    # Calculate and store output parameters
+    return _calculate_parameters(LevelAnalysis(grid_level), difficulty_curve_interval)
 
-    # Find positions of objects and calculate distances
-    positions = labeler._set_object_dict(list_level)
-    distances, accessible_tile_count = labeler._set_distance_dict(
-        list_level, positions["entry"], positions["exit"]
-    )
 
-    # Calculate and store output parameters
-    output_parameters = _calculate_parameters(
-        counts,
-        positions,
-        distances,
-        difficulty_curve_interval,
-        list_level,
-        accessible_tile_count,
-    )
+class LevelAnalysis:
+    """The grid facts of one level that validate reads, each computed once.
 
-    return output_parameters
+    Every fact is computed on first use and shared by all the metrics reading it,
+    so the tile histogram, the object positions, the flood fills and the
+    component labels are each derived a single time per level.
+
+    Attributes:
+        level (grid.Level): The analysed level.
+    """
+
+    def __init__(self, level: grid.Level) -> None:
+        self.level = level
+
+    @cached_property
+    def histogram(self) -> dict[str, int]:
+        return self.level.histogram()
+
+    @cached_property
+    def counts(self) -> dict:
+        return labeler._set_count_dict(self.level, self.histogram)
+
+    @cached_property
+    def object_positions(self) -> dict[str, list[tuple[int, int]]]:
+        """Row-major positions of every object icon."""
+        return labeler._object_positions(self.level)
+
+    @cached_property
+    def positions(self) -> dict:
+        """labeler._set_object_dict of the level."""
+        return labeler._set_object_dict(self.level)
+
+    @cached_property
+    def engine(self) -> distance.DistanceEngine:
+        return distance.DistanceEngine(self.level)
+
+    @cached_property
+    def entry_distances(self) -> tuple[dict, int]:
+        """Flood-fill orders from the entry, and the number of tiles reached."""
+        if self.positions["entry"] is None or self.positions["exit"] is None:
+            raise ValueError("The level needs an entry and an exit to be validated.")
+        return self.engine.flood_fill_area(self.positions["entry"])
+
+    def exploration(self, object_positions: list) -> float:
+        distances, accessible_tile_count = self.entry_distances
+        return labeler._exploration_requirement(
+            self.level, distances, object_positions, accessible_tile_count, self.engine
+        )
 
 
-def _prepare_level(level: str) -> list:
-    list_level = labeler.str_level_to_list_level(level)
-    if list_level is None:
-        return None
-    list_level = _standardize(list_level)
-    return list_level
+def _prepare_level(level: str | grid.Level) -> grid.Level:
+    """Convert the level into a grid.Level, whose rows are padded to the same length."""
+    return grid.as_level(level)
 
 
 def _calculate_parameters(
-    counts: dict,
-    positions: dict,
-    distances: dict,
-    difficulty_curve_interval: int,
-    list_level: list,
-    accessible_tile_count: int,
+    analysis: LevelAnalysis, difficulty_curve_interval: int
 ) -> dict:
     """Calculate and return the output parameters."""
+    counts = analysis.counts
+    positions = analysis.positions
+    entry_distances, _ = analysis.entry_distances
+
     output_parameters = {
         labeler.output_parameter_names[0]: labeler._density(
             counts["treasure_count"] + counts["enemy_count"], counts["total_tile_count"]
@@ -75,14 +123,11 @@ def _calculate_parameters(
         labeler.output_parameter_names[1]: labeler._empty_ratio(
             counts["empty_tile_count"], counts["total_tile_count"]
         ),
-        labeler.output_parameter_names[2]: labeler._exploration_requirement(
-            list_level,
-            distances["entry"],
-            positions["object_positions"],
-            accessible_tile_count,
+        labeler.output_parameter_names[2]: analysis.exploration(
+            positions["object_positions"]
         ),
         labeler.output_parameter_names[3]: labeler._difficulty_curve(
-            distances["entry"], positions["enemy_positions"], difficulty_curve_interval
+            entry_distances, positions["enemy_positions"], difficulty_curve_interval
         ),
         labeler.output_parameter_names[4]: counts["treasure_count"],
         labeler.output_parameter_names[5]: counts["enemy_count"],
@@ -90,29 +135,26 @@ def _calculate_parameters(
     }
 
     # Playability
-    output_parameters[param_names[0]] = _is_playable(list_level)
+    output_parameters[param_names[0]] = _is_playable(analysis.level, analysis)
 
     # Count other ASCII
-    output_parameters[param_names[1]] = _count_other_ASCII(list_level)
+    output_parameters[param_names[1]] = _count_other_ASCII(
+        analysis.level, analysis.histogram
+    )
 
     # Empty validation
-    output_parameters[param_names[2]] = _validate_empty(list_level)
+    output_parameters[param_names[2]] = _validate_empty(analysis.level)
 
     # Calculate nonlinearity only if the level is playable
     if output_parameters[param_names[0]]:
-        output_parameters[labeler.output_parameter_names[7]] = (
-            labeler._exploration_requirement(
-                list_level,
-                distances["entry"],
-                [positions["entry"], positions["exit"]],
-                accessible_tile_count,
-            )
+        output_parameters[labeler.output_parameter_names[7]] = analysis.exploration(
+            [positions["entry"], positions["exit"]]
         )
     else:
         output_parameters[labeler.output_parameter_names[7]] = None
 
     output_parameters[labeler.output_parameter_names[8]] = labeler._count_rooms(
-        list_level
+        analysis.level
     )
 
     return output_parameters
@@ -124,130 +166,96 @@ def _calculate_parameters(
 # ===============================
 # 2-1. Object and Position Information
 # ===============================
-def _find_outer_tiles(
-    list_level: list, x_boundary: int, y_boundary: int, icon_obstacles: set
-) -> set:
-    outer_set = set()
-
-    # (0, 0) ~ (n-1, 0), (0, m-1) ~ (n-1, m-1)
-    for x in range(x_boundary):
-        for y in (0, y_boundary - 1):
-            if (x, y) not in outer_set and labeler._is_accessible(
-                list_level[x][y], icon_obstacles
-            ):
-                labeler._visit(
-                    list_level, x, y, x_boundary, y_boundary, icon_obstacles, outer_set
-                )
-
-    # (0, 1) ~ (0, m-2), (n-1, 1) ~ (n-1, m-2)
-    for x in (0, x_boundary - 1):
-        for y in range(1, y_boundary - 1):
-            if (x, y) not in outer_set and labeler._is_accessible(
-                list_level[x][y], icon_obstacles
-            ):
-                labeler._visit(
-                    list_level, x, y, x_boundary, y_boundary, icon_obstacles, outer_set
-                )
-    return outer_set
+def _outer_mask(level: grid.Level) -> np.ndarray:
+    """
+    Return the passable tiles connected to the border of the level.
+
+    A passable component made of a single tile is never part of it, as the
+    breadth-first search this replaces only marked tiles reached from a neighbour.
+    """
+    ids, _ = level.components
+    border = np.concatenate((ids[0], ids[-1], ids[:, 0], ids[:, -1]))
+    sizes = np.bincount(ids.ravel())
+
+    outer_ids = np.unique(border)
+    outer_ids = outer_ids[(outer_ids > 0) & (sizes[outer_ids] > 1)]
+
+    return np.isin(ids, outer_ids)
 
 
 # ==========
 # 2-2. Evaluation
 # ==========
-def _is_playable(list_level: list) -> bool:
+def _is_playable(level: grid.Level, analysis: LevelAnalysis = None) -> bool:
     """
     Determine whether the level is playable by checking if the entry and exit points are accessible.
 
     Args:
-        list_level (list): The level represented as a list of lists.
+        level (grid.Level): The level, or a 2D list representing it.
+        analysis (LevelAnalysis, optional): Analysis of the level to reuse.
 
     Returns:
         bool: True if the level is playable, False otherwise.
     """
-    entry_pos = labeler._find_objects_position(list_level, labeler.icons["entry"])
-    if not entry_pos:
+    level = grid.as_level(level)
+    if level is None:
         return False
-    entry_pos = entry_pos[0]
-
-    exit_pos = labeler._find_objects_position(list_level, labeler.icons["boss"])
-    if not exit_pos:
-        exit_pos = labeler._find_objects_position(list_level, labeler.icons["exit"])
-        if not exit_pos:
-            return False
-        exit_pos = exit_pos[0]
-    else:
-        exit_pos = exit_pos[0]
+    if analysis is None:
+        analysis = LevelAnalysis(level)
 
-    entry_distance_dict = labeler._shortest_distances(list_level, entry_pos)
+    positions = analysis.object_positions
+    entry_pos = positions.get(labeler.icons["entry"])
+    exit_pos = positions.get(labeler.icons["boss"]) or positions.get(
+        labeler.icons["exit"]
+    )
+    if not entry_pos or not exit_pos:
+        return False
 
     # Check if exit is accessible from entry
-    return exit_pos in entry_distance_dict
+    ids, _ = level.components
+    return bool(ids[entry_pos[0]] and ids[entry_pos[0]] == ids[exit_pos[0]])
 
 
-def _count_other_ASCII(list_level: list) -> int:
+def _count_other_ASCII(level: grid.Level, histogram: dict = None) -> int:
     """
     Count the number of unique ASCII characters in the level that are not defined as icons in the labeler.
 
     Args:
-        list_level (list): The level represented as a list of lists.
+        level (grid.Level): The level.
+        histogram (dict, optional): The tile histogram of the level, if already known.
 
     Returns:
         int: The number of unique non-icon ASCII characters present in the level.
     """
-    other_ASCII_count = 0
-    appeared = set()
-
-    for row in list_level:
-        for tile in row:
-            if tile not in appeared and not _is_in_icons(tile):
-                appeared.add(tile)
-                other_ASCII_count += 1
+    if histogram is None:
+        histogram = level.histogram()
+    return sum(1 for tile in histogram if not _is_in_icons(tile))
 
-    return other_ASCII_count
 
-
-def _validate_empty(list_level: list) -> float:
+def _validate_empty(level: grid.Level) -> float:
     """
     Calculate the correct percentage of tiles.
     Outside, only ASCII " " is considered as a right tile,
     Inside, only ASCII " " is considered as a wrong tile.
 
     Args:
-        list_level (list): The level represented as a list of lists.
+        level (grid.Level): The level.
 
     Returns:
         float: The percentage of correctly placed empty tiles.
     """
-    # Initialization
     icon_inner_empty = labeler.icons["empty"]
     icon_outer_empty = labeler.icons["outside"]
-    icon_obstacles = set(labeler.icons["wall"])
-
-    x_boundary = len(list_level)
-    y_boundary = len(list_level[0])
-
-    # Make wall and total sets
-    obstacles_set = {
-        (x, y)
-        for x in range(x_boundary)
-        for y in range(y_boundary)
-        if list_level[x][y] in icon_obstacles
-    }
-    total_set = {(x, y) for x in range(x_boundary) for y in range(y_boundary)}
 
-    # Find inner and outer set
-    outer_set = _find_outer_tiles(list_level, x_boundary, y_boundary, icon_obstacles)
-    inner_set = total_set - obstacles_set - outer_set
+    # Find inner and outer masks
+    outer_mask = _outer_mask(level)
+    inner_mask = ~level.walls & ~outer_mask
 
     # Count right and wrong tiles
-    inner_wrong_count = sum(
-        1 for x, y in inner_set if list_level[x][y] == icon_inner_empty
-    )
-    inner_right_count = len(inner_set) - inner_wrong_count
-    outer_right_count = sum(
-        1 for x, y in outer_set if list_level[x][y] == icon_outer_empty
-    )
-    outer_wrong_count = len(outer_set) - outer_right_count
+    inner_wrong_count = int(np.count_nonzero(inner_mask & level.mask(icon_inner_empty)))
+    inner_right_count = int(np.count_nonzero(inner_mask)) - inner_wrong_count
+    outer_right_count = int(np.count_nonzero(outer_mask & level.mask(icon_outer_empty)))
+    outer_wrong_count = int(np.count_nonzero(outer_mask)) - outer_right_count
 
     # Return the percentage of correct tiles
     total_right = inner_right_count + outer_right_count
@@ -263,19 +271,6 @@ def _is_in_icons(tile: str) -> bool:
     return any(tile == icon for icon in labeler.icons.values())
 
 
-def _standardize(list_level: list) -> list:
-    """
-    Standardize the level by ensuring consistent formatting of spaces and empty tiles.
-    """
-
-    # Find the maximum length of rows.
-    row_max_len = max(len(row) for row in list_level)
-
-    icon_outside = labeler.icons["outside"]
-
-    return [row + [icon_outside] * (row_max_len - len(row)) for row in list_level]
-
-
 def _set_none_parameters():
     """Calculate and return the output parameters."""
     output_parameters = {
@@ -301,153 +296,381 @@ def _set_none_parameters():
 # ============
 # 5. Interface
 # ============
-def get_label(level: str) -> dict:
-    list_level = _prepare_level(level)
-    if "P" in level and "B" in level:
+def get_label(level: str | grid.Level) -> dict:
+    return label_cache.cached("get_label", _get_label, level)
+
+
+def _get_label(level: str | grid.Level) -> dict:
+    grid_level = _prepare_level(level)
+    if (
+        grid_level is not None
+        and grid_level.count(labeler.icons["entry"])
+        and grid_level.count(labeler.icons["boss"])
+    ):
+        # Exploration and winding path share one set of flood fills.
+        engine = distance.DistanceEngine(grid_level)
         return {
-            labeler.output_parameter_names[2]: _get_exploration(list_level),
-            labeler.output_parameter_names[4]: _get_treasure_count(list_level),
-            labeler.output_parameter_names[5]: _get_enemy_count(list_level),
-            labeler.output_parameter_names[6]: _get_map_size(list_level),
-            labeler.output_parameter_names[7]: _get_winding_path(list_level),
-            labeler.output_parameter_names[8]: _get_room_count(list_level),
+            labeler.output_parameter_names[2]: _get_exploration(grid_level, engine),
+            labeler.output_parameter_names[4]: _get_treasure_count(grid_level),
+            labeler.output_parameter_names[5]: _get_enemy_count(grid_level),
+            labeler.output_parameter_names[6]: _get_map_size(grid_level),
+            labeler.output_parameter_names[7]: _get_winding_path(grid_level, engine),
+            labeler.output_parameter_names[8]: _get_room_count(grid_level),
         }
     else:
         return {
             labeler.output_parameter_names[2]: "NaN",
-            labeler.output_parameter_names[4]: _get_treasure_count(list_level),
-            labeler.output_parameter_names[5]: _get_enemy_count(list_level),
-            labeler.output_parameter_names[6]: _get_map_size(list_level),
+            labeler.output_parameter_names[4]: _get_treasure_count(grid_level),
+            labeler.output_parameter_names[5]: _get_enemy_count(grid_level),
+            labeler.output_parameter_names[6]: _get_map_size(grid_level),
             labeler.output_parameter_names[7]: "NaN",
-            labeler.output_parameter_names[8]: _get_room_count(list_level),
+            labeler.output_parameter_names[8]: _get_room_count(grid_level),
         }
 
 
-def get_playable(level: str) -> bool:
-    list_level = _prepare_level(level)
-    return _is_playable(level)
+def get_labels(levels: list[str], workers: int = None) -> list[dict]:
+    """
+    Label many levels across a process pool.
+
+    Args:
+        levels (list[str]): The levels to label.
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+
+    Returns:
+        list[dict]: get_label of every level, in input order.
+    """
+    return label_cache.cached_map("get_label", _get_label, levels, workers)
+
+
+def validate_many(
+    levels: list[str],
+    workers: int = None,
+    difficulty_curve_interval: int = labeler.DEFAULT_DIFFICULTY_CURVE_INTERVAL,
+    executor: ProcessPoolExecutor = None,
+) -> list[dict]:
+    """
+    Validate many levels across a process pool.
+
+    Args:
+        levels (list[str]): The levels to validate.
+        workers (int, optional): Number of worker processes. Defaults to the CPU count.
+        difficulty_curve_interval (int, optional): Interval used for calculating the difficulty curve.
+        executor (ProcessPoolExecutor, optional): A running pool to reuse across calls.
+
+    Returns:
+        list[dict]: validate of every level, in input order.
+    """
+    return label_cache.cached_map(
+        "validate",
+        _validate,
+        levels,
+        workers,
+        executor,
+        difficulty_curve_interval=difficulty_curve_interval,
+    )
 
 
-def get_enemy_count(level: str) -> int:
+def get_playable(level: str | grid.Level) -> bool:
+    grid_level = _prepare_level(level)
+    return _is_playable(grid_level)
+
+
+def get_enemy_count(level: str | grid.Level) -> int:
     return _get_enemy_count(_prepare_level(level))
 
 
-def _get_enemy_count(list_level: list[list[str]]) -> int:
-    return _get_object_count(list_level, "enemy")
+def _get_enemy_count(level: grid.Level) -> int:
+    return _get_object_count(level, "enemy")
 
 
-def get_treasure_count(level: str) -> int:
+def get_treasure_count(level: str | grid.Level) -> int:
     return _get_treasure_count(_prepare_level(level))
 
 
-def _get_treasure_count(list_level: list[list[str]]) -> int:
-    return _get_object_count(list_level, "treasure")
+def _get_treasure_count(level: grid.Level) -> int:
+    return _get_object_count(level, "treasure")
 
 
-def get_room_count(level: str) -> int:
+def get_room_count(level: str | grid.Level) -> int:
     return _get_room_count(_prepare_level(level))
 
 
-def _get_room_count(list_level: list[list[str]]) -> int:
+def _get_room_count(level: grid.Level) -> int:
     try:
-        return labeler._count_rooms(list_level)
+        return labeler._count_rooms(level)
     except:
         return 0
 
 
-def _get_object_count(list_level: list[list[str]], object_name: str) -> int:
+def _get_object_count(level: grid.Level, object_name: str) -> int:
     try:
-        return sum(
-            tile == labeler.icons[object_name] for row in list_level for tile in row
-        )
+        return level.count(labeler.icons[object_name])
     except:
         return 0
 
 
-def get_map_size(level: str) -> tuple[int, int]:
+def get_map_size(level: str | grid.Level) -> tuple[int, int]:
     return _get_map_size(_prepare_level(level))
 
 
-def _get_map_size(list_level: list[list[str]]) -> int:
-    icon_wall = labeler.icons["wall"]
-
+def _get_map_size(level: grid.Level) -> int:
     try:
-        x = len(list_level)
-        y = len(list_level[0])
+        x, y = level.shape
     except:
         return 0
 
-    x_min = x - 1
-    x_max = 0
-    y_min = y - 1
-    y_max = 0
-
-    for i in range(x):
-        row = list_level[i]
-        for j in range(y):
-            if row[j] == icon_wall:
-                if i < x_min:
-                    x_min = i
-                if i > x_max:
-                    x_max = i
-                if j < y_min:
-                    y_min = j
-                if j > y_max:
-                    y_max = j
+    # Bounding box of the walls. Without walls it stays inverted as (x - 1, 0).
+    wall_rows = level.walls.any(axis=1).nonzero()[0]
+    wall_cols = level.walls.any(axis=0).nonzero()[0]
+    if len(wall_rows):
+        x_min, x_max = int(wall_rows[0]), int(wall_rows[-1])
+        y_min, y_max = int(wall_cols[0]), int(wall_cols[-1])
+    else:
+        x_min, x_max = x - 1, 0
+        y_min, y_max = y - 1, 0
 
     return math.sqrt((x_max - x_min + 1) * (y_max - y_min + 1))
 
 
-def get_exploration(level: str) -> float:
+def get_exploration(level: str | grid.Level) -> float:
     return _get_exploration(_prepare_level(level))
 
 
-def _get_exploration(list_level: list[list[str]]) -> float:
-    positions = labeler._set_object_dict(list_level)
+def _get_exploration(
+    level: grid.Level, engine: distance.DistanceEngine = None
+) -> float:
+    if engine is None:
+        engine = distance.DistanceEngine(level)
+
+    positions = labeler._set_object_dict(level)
     distances, accessible_tile_count = labeler._set_distance_dict(
-        list_level, positions["entry"], positions["exit"]
+        level, positions["entry"], positions["exit"], engine
     )
     return labeler._exploration_requirement(
-        list_level,
+        level,
         distances["entry"],
         positions["object_positions"],
         accessible_tile_count,
+        engine,
     )
 
 
-def get_winding_path(level: str) -> float:
+def get_winding_path(level: str | grid.Level) -> float:
     return _get_winding_path(_prepare_level(level))
 
 
-def _get_winding_path(list_level: list[list[str]]) -> float:
-    positions = labeler._set_object_dict(list_level)
+def _get_winding_path(
+    level: grid.Level, engine: distance.DistanceEngine = None
+) -> float:
+    if engine is None:
+        engine = distance.DistanceEngine(level)
+
+    positions = labeler._set_object_dict(level)
     distances, accessible_tile_count = labeler._set_distance_dict(
-        list_level, positions["entry"], positions["exit"]
+        level, positions["entry"], positions["exit"], engine
     )
     return labeler._exploration_requirement(
-        list_level,
+        level,
         distances["entry"],
         [positions["entry"], positions["exit"]],
         accessible_tile_count,
+        engine,
     )
 
 
-def _label_7dim(map_list: list) -> dict:
+def _label_7dim(map_list: list, workers: int = None) -> dict:
+    def collect_maps(map_list, depth=0):
+        if depth == 7:
+            return [map_list["map"]]
+        return [
+            level
+            for sub_list in map_list
+            for level in collect_maps(sub_list, depth + 1)
+        ]
+
+    labels = iter(get_labels(collect_maps(map_list), workers))
+
     def recursive_update(map_list, depth=0):
         if depth == 7:
-            return {"map": map_list["map"], "params": get_label(map_list["map"])}
+            return {"map": map_list["map"], "params": next(labels)}
         return [recursive_update(sub_list, depth + 1) for sub_list in map_list]
 
     return {"map_list": recursive_update(map_list)}
 
 
-def output_label(map_list: list, path: str) -> None:
+def output_label(map_list: list, path: str, workers: int = None) -> None:
     if not os.path.exists(path):
         os.makedirs(path)
 
     cur_dir = os.path.dirname(os.path.abspath(__file__))
     _path = os.path.join(cur_dir, path, f"batch.json")
-    labeler.save_file(_label_7dim(map_list), _path)
+    labeler.save_file(_label_7dim(map_list, workers), _path)
+
+
+# ========================
+# 6. Incremental Labeling
+# ========================
+# Largest share of tiles whose walls, doors or floor may change for an update to
+# stay incremental. Beyond that the rooms and distances are recomputed.
+INCREMENTAL_CHANGE_LIMIT = 0.1
+
+
+class LabelState:
+    """The analysis of one level that get_label reads, kept to relabel edits of it.
+
+    Attributes:
+        level (grid.Level): The level, None for an empty one.
+        histogram (dict[str, int]): Number of tiles of every character.
+        room_ids (np.ndarray): Room component id of every tile, 0 outside rooms.
+        room_count (int): Number of rooms.
+        engine (distance.DistanceEngine): Distance engine with its cached flood fills.
+        labels (dict): get_label of the level.
+    """
+
+    def __init__(self, level: str | grid.Level) -> None:
+        """Analyse level from scratch."""
+        self.level = _prepare_level(level)
+        if self.level is None:
+            self.labels = _get_label(None)
+            return
+
+        self.histogram = self.level.histogram()
+        self.room_ids, self.room_count = self.level.rooms
+        self.engine = distance.DistanceEngine(self.level)
+        self.labels = self._label()
+
+    def update(self, level: str | grid.Level) -> "LabelState":
+        """
+        Return the state of level, reusing this state where the edit allows.
+
+        The histogram follows the changed tiles. When only objects moved, the rooms
+        and every cached flood fill are kept. When a few walls or doors changed,
+        only the rooms next to them are relabelled and only the flood fills
+        reaching them are dropped. Anything larger is analysed from scratch.
+
+        Args:
+            level (str | grid.Level): The edited level.
+
+        Returns:
+            LabelState: A new state. This one is left as it is.
+        """
+        level = _prepare_level(level)
+        if self.level is None or level is None or level.shape != self.level.shape:
+            return LabelState(level)
+        if level.extra_chars != self.level.extra_chars:
+            return LabelState(level)
+
+        changed = level.tiles != self.level.tiles
+        if not changed.any():
+            return self
+
+        room_mask = level.room_tiles
+        room_changed = room_mask != (self.room_ids > 0)
+        wall_changed = level.walls != self.level.walls
+        if (
+            np.count_nonzero(room_changed | wall_changed)
+            > INCREMENTAL_CHANGE_LIMIT * level.tiles.size
+        ):
+            return LabelState(level)
+
+        state = LabelState.__new__(LabelState)
+        state.level = level
+        state.histogram = self._updated_histogram(level, changed)
+        if room_changed.any():
+            state.room_ids, state.room_count = self._updated_rooms(
+                room_mask, room_changed
+            )
+        else:
+            state.room_ids, state.room_count = self.room_ids, self.room_count
+        state.engine = self.engine.updated(level, wall_changed)
+        state.labels = state._label()
+
+        return state
+
+    def _updated_histogram(self, level: grid.Level, changed: np.ndarray) -> dict:
+        histogram = dict(self.histogram)
+        for tiles, sign in ((self.level.tiles, -1), (level.tiles, 1)):
+            codes, counts = np.unique(tiles[changed], return_counts=True)
+            for code, count in zip(codes, counts):
+                char = level.char(code)
+                histogram[char] = histogram.get(char, 0) + sign * int(count)
+                if not histogram[char]:
+                    del histogram[char]
+
+        return histogram
+
+    def _updated_rooms(
+        self, room_mask: np.ndarray, room_changed: np.ndarray
+    ) -> tuple[np.ndarray, int]:
+        """Relabel the rooms touching the changed tiles. Other rooms keep their ids."""
+        # A closed tile may split its room, and an opened tile joins its neighbours.
+        near = room_changed.copy()
+        near[1:] |= room_changed[:-1]
+        near[:-1] |= room_changed[1:]
+        near[:, 1:] |= room_changed[:, :-1]
+        near[:, :-1] |= room_changed[:, 1:]
+        affected = np.unique(self.room_ids[near])
+        affected = affected[affected > 0]
+
+        region = room_mask & (np.isin(self.room_ids, affected) | room_changed)
+        local_ids, local_count = components.label(region)
+
+        room_ids = np.where(np.isin(self.room_ids, affected), 0, self.room_ids)
+        room_ids = np.where(
+            local_ids > 0, local_ids + self.room_ids.max(), room_ids
+        ).astype(np.int32)
+
+        return room_ids, self.room_count - len(affected) + local_count
+
+    def _label(self) -> dict:
+        """get_label, read from this state."""
+        level = self.level
+        labels = {
+            labeler.output_parameter_names[2]: "NaN",
+            labeler.output_parameter_names[4]: self.histogram.get(
+                labeler.icons["treasure"], 0
+            ),
+            labeler.output_parameter_names[5]: self.histogram.get(
+                labeler.icons["enemy"], 0
+            ),
+            labeler.output_parameter_names[6]: _get_map_size(level),
+            labeler.output_parameter_names[7]: "NaN",
+            labeler.output_parameter_names[8]: self.room_count,
+        }
+        if self.histogram.get(labeler.icons["entry"]) and self.histogram.get(
+            labeler.icons["boss"]
+        ):
+            labels[labeler.output_parameter_names[2]] = _get_exploration(
+                level, self.engine
+            )
+            labels[labeler.output_parameter_names[7]] = _get_winding_path(
+                level, self.engine
+            )
+
+        return labels
+
+
+def get_label_incremental(
+    level: str | grid.Level, previous_state: LabelState = None
+) -> tuple[dict, LabelState]:
+    """
+    Label level, an edit of the level of previous_state, without starting over.
+
+    Args:
+        level (str | grid.Level): The level to label.
+        previous_state (LabelState, optional): The state of the previous level.
+            Without one, the level is analysed from scratch.
+
+    Returns:
+        tuple[dict, LabelState]: get_label of level, and the state to pass on to
+        the next edit.
+    """
+    if previous_state is None:
+        state = LabelState(level)
+    else:
+        state = previous_state.update(level)
+
+    return dict(state.labels), state
 
 
 # ========